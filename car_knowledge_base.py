@@ -0,0 +1,1303 @@
+"""Built-in car knowledge base for finall.py.
+
+Deployments normally serve a compiled, memory-mapped copy of this data
+(python finall.py --export-kb-source knowledge_base.json, then
+--compile-kb). finall imports this module only when no compiled file is
+deployed, so workers reading the compiled file never hold these literals.
+"""
+
+
+# Comprehensive car knowledge base
+
+
+CAR_KNOWLEDGE_BASE = {
+
+
+    # Engine Oil and Lubrication System
+
+
+    ("تغيير زيت الموتور", "change engine oil", "oil change", "engine oil change", "متى اغير الزيت", 
+
+
+     "كل قد ايه اغير زيت", "oil service", "خدمة زيت"): {
+
+
+        "en": """🔧 **Complete Engine Oil Service Guide (Egypt 2025)**
+
+
+
+
+
+• Change Intervals by Driving Style:
+
+
+  - City driving: Every 5,000 km
+
+
+  - Highway driving: Every 7,500 km
+
+
+  - Severe conditions: Every 3,000-4,000 km
+
+
+  - Time-based: Every 6 months (whichever comes first)
+
+
+
+
+
+• Oil Grades and Prices (4L):
+
+
+  1. Full Synthetic:
+
+
+     - Mobil 1: 950-1150 EGP
+
+
+     - Castrol EDGE: 850-1000 EGP
+
+
+     - Shell Helix Ultra: 900-1100 EGP
+
+
+     
+
+
+  2. Semi-Synthetic:
+
+
+     - Castrol GTX: 600-800 EGP
+
+
+     - Shell Helix HX7: 600-750 EGP
+
+
+     - Total Quartz: 700-900 EGP
+
+
+     
+
+
+  3. Conventional:
+
+
+     - Local brands: 350-550 EGP
+
+
+     - Basic options: 300-450 EGP
+
+
+
+
+
+• Service Components:
+
+
+  - Oil Filter: 120-220 EGP
+
+
+  - Labor: 120-200 EGP
+
+
+  - Diagnostic check: 150-300 EGP
+
+
+  - Total Service: 600-1700 EGP
+
+
+
+
+
+• Severe Conditions Requiring More Frequent Changes:
+
+
+  1. Frequent short trips (less than 10 km)
+
+
+  2. Extreme heat (above 35°C)
+
+
+  3. Heavy traffic driving
+
+
+  4. Dusty conditions
+
+
+  5. Towing or heavy loads
+
+
+
+
+
+• Warning Signs for Immediate Oil Change:
+
+
+  1. Dark/black oil color
+
+
+  2. Engine noise increased
+
+
+  3. Oil pressure warning light
+
+
+  4. Exhaust smoke
+
+
+  5. Oil level dropping quickly
+
+
+  6. Engine running hotter
+
+
+
+
+
+• Best Practices:
+
+
+  1. Use synthetic oil for Egypt's heat
+
+
+  2. Keep detailed service records
+
+
+  3. Check oil level every 2 weeks
+
+
+  4. Use manufacturer recommended grade
+
+
+  5. Always replace the oil filter
+
+
+  6. Consider engine age and condition
+
+
+
+
+
+• Professional Tips:
+
+
+  1. Warm engine before changing
+
+
+  2. Check for leaks after service
+
+
+  3. Reset oil life monitor if equipped
+
+
+  4. Dispose of old oil properly
+
+
+  5. Document service date and mileage""",
+
+
+        
+
+
+        "ar": """🔧 **دليل شامل لخدمة زيت المحرك (مصر 2025)**
+
+
+
+
+
+• مواعيد التغيير حسب نوع القيادة:
+
+
+  - داخل المدينة: كل 5000 كم
+
+
+  - على الطرق السريعة: كل 7500 كم
+
+
+  - الظروف القاسية: كل 3000-4000 كم
+
+
+  - حسب الوقت: كل 6 شهور (أيهما يأتي أولاً)
+
+
+
+
+
+• درجات الزيت والأسعار (4 لتر):
+
+
+  1. تخليقي كامل:
+
+
+     - موبيل 1: 950-1150 جنيه
+
+
+     - كاسترول إيدج: 850-1000 جنيه
+
+
+     - شل هيلكس ألترا: 900-1100 جنيه
+
+
+     
+
+
+  2. نصف تخليقي:
+
+
+     - كاسترول GTX: 600-800 جنيه
+
+
+     - شل هيلكس HX7: 600-750 جنيه
+
+
+     - توتال كوارتز: 700-900 جنيه
+
+
+     
+
+
+  3. عادي:
+
+
+     - ماركات محلية: 350-550 جنيه
+
+
+     - خيارات أساسية: 300-450 جنيه
+
+
+
+
+
+• مكونات الخدمة:
+
+
+  - فلتر الزيت: 120-220 جنيه
+
+
+  - أجرة العمل: 120-200 جنيه
+
+
+  - فحص بالكمبيوتر: 150-300 جنيه
+
+
+  - إجمالي الخدمة: 600-1700 جنيه
+
+
+
+
+
+• الظروف التي تتطلب تغيير أكثر تكراراً:
+
+
+  1. رحلات قصيرة متكررة (أقل من 10 كم)
+
+
+  2. حرارة شديدة (فوق 35 درجة)
+
+
+  3. القيادة في الزحام
+
+
+  4. الأجواء المتربة
+
+
+  5. سحب أحمال ثقيلة
+
+
+
+
+
+• علامات تستدعي تغيير الزيت فوراً:
+
+
+  1. لون الزيت أسود داكن
+
+
+  2. زيادة صوت المحرك
+
+
+  3. إضاءة لمبة ضغط الزيت
+
+
+  4. دخان من العادم
+
+
+  5. انخفاض مستوى الزيت سريعاً
+
+
+  6. ارتفاع حرارة المحرك
+
+
+
+
+
+• أفضل الممارسات:
+
+
+  1. استخدم زيت تخليقي لحرارة مصر
+
+
+  2. احتفظ بسجل صيانة مفصل
+
+
+  3. افحص مستوى الزيت كل أسبوعين
+
+
+  4. استخدم الدرجة الموصى بها من المصنع
+
+
+  5. غيّر فلتر الزيت مع كل تغيير
+
+
+  6. راعي عمر المحرك وحالته
+
+
+
+
+
+• نصائح احترافية:
+
+
+  1. سخن المحرك قبل التغيير
+
+
+  2. افحص التسريبات بعد الخدمة
+
+
+  3. اعد ضبط مؤشر عمر الزيت
+
+
+  4. تخلص من الزيت القديم بشكل صحيح
+
+
+  5. سجل تاريخ الخدمة والمسافة"""
+
+
+    },
+
+
+# Continuing CAR_KNOWLEDGE_BASE...
+
+
+    # Engine Performance and Diagnostics
+
+
+    ("مشاكل المحرك", "engine problems", "محرك", "engine performance", "قوة المحرك", "engine power", "ضعف المحرك"): {
+
+
+        "en": """🔍 **Complete Engine Diagnostic Guide (Egypt 2025)**
+
+
+
+
+
+• Common Problems by Symptom:
+
+
+  1. Starting Issues:
+
+
+     - No Start: Battery/Starter/Fuel pump (1200-3700 EGP)
+
+
+     - Hard Start: Spark plugs/Fuel system (400-2000 EGP)
+
+
+     - Intermittent: Sensors/Ignition (600-2500 EGP)
+
+
+
+
+
+  2. Running Problems:
+
+
+     - Rough Idle: Spark plugs/Injectors/MAF (500-3000 EGP)
+
+
+     - Misfire: Coils/Plugs/Compression (450-4000 EGP)
+
+
+     - Power Loss: Multiple systems (1000-5000 EGP)
+
+
+
+
+
+  3. Noise Issues:
+
+
+     - Ticking: Valves/Low oil (500-3000 EGP)
+
+
+     - Knocking: Bearings/Timing (2000-8000 EGP)
+
+
+     - Rattling: Timing chain/Mounts (1200-4000 EGP)
+
+
+
+
+
+• Diagnostic Process:
+
+
+  1. Computer Scan: 300-600 EGP
+
+
+  2. Compression Test: 400-800 EGP
+
+
+  3. Fuel Pressure: 300-500 EGP
+
+
+  4. Smoke Analysis: 400-700 EGP
+
+
+
+
+
+• Component Lifespans:
+
+
+  - Spark Plugs: 40,000-100,000 km
+
+
+  - Ignition Coils: 60,000-120,000 km
+
+
+  - Fuel Injectors: 100,000-150,000 km
+
+
+  - Timing Belt: 60,000-100,000 km
+
+
+
+
+
+• Warning Signs:
+
+
+  1. Check Engine Light
+
+
+  2. Unusual Noises
+
+
+  3. Performance Drop
+
+
+  4. Excessive Smoke
+
+
+  5. High Consumption
+
+
+
+
+
+• Preventive Maintenance:
+
+
+  1. Regular Oil Changes
+
+
+  2. Air Filter Service
+
+
+  3. Fuel System Cleaning
+
+
+  4. Timing Belt Check
+
+
+  5. Tune-ups
+
+
+
+
+
+• Emergency Actions:
+
+
+  - Stop if knocking occurs
+
+
+  - Check oil immediately
+
+
+  - Avoid high speeds
+
+
+  - Get professional diagnosis""",
+
+
+
+
+
+        "ar": """🔍 **دليل شامل لتشخيص المحرك (مصر 2025)**
+
+
+
+
+
+• المشاكل الشائعة حسب الأعراض:
+
+
+  1. مشاكل التشغيل:
+
+
+     - عدم التشغيل: بطارية/مارش/طرمبة (1200-3700 جنيه)
+
+
+     - صعوبة التشغيل: بوجيهات/نظام الوقود (400-2000 جنيه)
+
+
+     - تقطيع: حساسات/نظام الإشعال (600-2500 جنيه)
+
+
+
+
+
+  2. مشاكل التشغيل:
+
+
+     - رعشة: بوجيهات/رشاشات/حساس هواء (500-3000 جنيه)
+
+
+     - حريق: كويلات/بوجيهات/ضغط (450-4000 جنيه)
+
+
+     - ضعف: أنظمة متعددة (1000-5000 جنيه)
+
+
+
+
+
+  3. مشاكل الصوت:
+
+
+     - طقطقة: صبابات/زيت منخفض (500-3000 جنيه)
+
+
+     - خبط: رمان بلي/توقيت (2000-8000 جنيه)
+
+
+     - خرخرة: سلسلة/مساند (1200-4000 جنيه)
+
+
+
+
+
+• عملية التشخيص:
+
+
+  1. فحص كمبيوتر: 300-600 جنيه
+
+
+  2. فحص ضغط: 400-800 جنيه
+
+
+  3. ضغط وقود: 300-500 جنيه
+
+
+  4. تحليل دخان: 400-700 جنيه
+
+
+
+
+
+• عمر القطع:
+
+
+  - بوجيهات: 40,000-100,000 كم
+
+
+  - كويلات: 60,000-120,000 كم
+
+
+  - رشاشات: 100,000-150,000 كم
+
+
+  - سير التيمينج: 60,000-100,000 كم
+
+
+
+
+
+• علامات التحذير:
+
+
+  1. لمبة المحرك
+
+
+  2. أصوات غريبة
+
+
+  3. انخفاض الأداء
+
+
+  4. دخان زائد
+
+
+  5. استهلاك عالي
+
+
+
+
+
+• الصيانة الوقائية:
+
+
+  1. تغيير زيت منتظم
+
+
+  2. خدمة فلتر الهواء
+
+
+  3. تنظيف نظام الوقود
+
+
+  4. فحص سير التيمينج
+
+
+  5. ضبط المحرك
+
+
+
+
+
+• إجراءات الطوارئ:
+
+
+  - توقف عند سماع خبط
+
+
+  - افحص الزيت فوراً
+
+
+  - تجنب السرعات العالية
+
+
+  - احصل على تشخيص محترف"""
+
+
+    },
+
+
+
+
+
+    # Transmission Systems
+
+
+    ("مشاكل الفتيس", "transmission problems", "فتيس", "gear problems", "ناقل الحركة"): {
+
+
+        "en": """⚙️ **Transmission Systems Guide (Egypt 2025)**
+
+
+
+
+
+• Types and Common Issues:
+
+
+  1. Automatic Transmission:
+
+
+     - Hard Shifts: Solenoids/Fluid (1500-3000 EGP)
+
+
+     - Slipping: Clutch packs/Bands (3000-7000 EGP)
+
+
+     - Fluid Leaks: Seals/Gaskets (800-2000 EGP)
+
+
+
+
+
+  2. Manual Transmission:
+
+
+     - Clutch Issues: Disc/Pressure plate (2500-5000 EGP)
+
+
+     - Gear Grinding: Synchros (3000-6000 EGP)
+
+
+     - Bearing Noise: Input/Output shaft (2000-4000 EGP)
+
+
+
+
+
+• Service Costs:
+
+
+  1. Fluid Change:
+
+
+     - Automatic: 800-1500 EGP
+
+
+     - Manual: 400-800 EGP
+
+
+     - CVT: 1000-2000 EGP
+
+
+
+
+
+  2. Major Repairs:
+
+
+     - Rebuild: 8000-15000 EGP
+
+
+     - Replace: 15000-30000 EGP
+
+
+     - Clutch Kit: 3000-7000 EGP
+
+
+
+
+
+• Maintenance Schedule:
+
+
+  - Fluid Check: Monthly
+
+
+  - Fluid Change: 40,000-60,000 km
+
+
+  - Filter Change: With fluid
+
+
+  - Clutch: 80,000-120,000 km
+
+
+
+
+
+• Warning Signs:
+
+
+  1. Delayed Engagement
+
+
+  2. Rough Shifting
+
+
+  3. Slipping Gears
+
+
+  4. Strange Noises
+
+
+  5. Fluid Leaks
+
+
+  6. Burning Smell
+
+
+
+
+
+• Prevention Tips:
+
+
+  1. Regular Fluid Checks
+
+
+  2. Proper Warm-up
+
+
+  3. Avoid Overloading
+
+
+  4. Gentle Shifting
+
+
+  5. Regular Service""",
+
+
+
+
+
+        "ar": """⚙️ **دليل أنظمة ناقل الحركة (مصر 2025)**
+
+
+
+
+
+• الأنواع والمشاكل الشائعة:
+
+
+  1. الفتيس الأوتوماتيك:
+
+
+     - تغيير عنيف: سولونويد/زيت (1500-3000 جنيه)
+
+
+     - تزحلق: دسك/طارة (3000-7000 جنيه)
+
+
+     - تسريب: جوانات/مانعات (800-2000 جنيه)
+
+
+
+
+
+  2. الفتيس العادي:
+
+
+     - مشاكل الدبرياج: دسك/بلية (2500-5000 جنيه)
+
+
+     - صوت تعشيق: سنكرونات (3000-6000 جنيه)
+
+
+     - صوت رمان: عمود الدخل/الخروج (2000-4000 جنيه)
+
+
+
+
+
+• تكاليف الخدمة:
+
+
+  1. تغيير الزيت:
+
+
+     - أوتوماتيك: 800-1500 جنيه
+
+
+     - عادي: 400-800 جنيه
+
+
+     - CVT: 1000-2000 جنيه
+
+
+
+
+
+  2. إصلاحات كبيرة:
+
+
+     - إصلاح: 8000-15000 جنيه
+
+
+     - تغيير: 15000-30000 جنيه
+
+
+     - طقم دبرياج: 3000-7000 جنيه
+
+
+
+
+
+• جدول الصيانة:
+
+
+  - فحص الزيت: شهرياً
+
+
+  - تغيير الزيت: 40,000-60,000 كم
+
+
+  - تغيير الفلتر: مع الزيت
+
+
+  - دبرياج: 80,000-120,000 كم
+
+
+
+
+
+• علامات التحذير:
+
+
+  1. تأخر التعشيق
+
+
+  2. تغيير خشن
+
+
+  3. تزحلق التروس
+
+
+  4. أصوات غريبة
+
+
+  5. تسريب زيت
+
+
+  6. رائحة حريق
+
+
+
+
+
+• نصائح وقائية:
+
+
+  1. فحص الزيت بانتظام
+
+
+  2. تسخين مناسب
+
+
+  3. تجنب الحمولة الزائدة
+
+
+  4. تغيير ناعم
+
+
+  5. صيانة منتظمة"""
+
+
+    },
+
+
+
+
+
+# Continue with more comprehensive problem categories...
+
+
+    # Brake Systems
+
+
+    ("مشاكل الفرامل", "brake problems", "brake system", "فرامل", "صوت فرامل", "brake noise"): {
+
+
+        "en": """🛑 **Complete Brake System Guide (Egypt 2025)**
+
+
+
+
+
+• System Components and Issues:
+
+
+  1. Front Brakes:
+
+
+     - Disc Pads: 400-1700 EGP/set
+
+
+     - Rotors: 1200-2500 EGP/pair
+
+
+     - Calipers: 1500-3000 EGP/each
+
+
+     
+
+
+  2. Rear Brakes:
+
+
+     - Shoes: 500-1000 EGP/set
+
+
+     - Drums: 900-1800 EGP/pair
+
+
+     - Cylinders: 400-800 EGP/each
+
+
+     
+
+
+  3. Hydraulic System:
+
+
+     - Master Cylinder: 1200-2500 EGP
+
+
+     - Brake Lines: 400-1000 EGP
+
+
+     - ABS Module: 3000-7000 EGP
+
+
+
+
+
+• Common Problems:
+
+
+  1. Noise Issues:
+
+
+     - Squealing: Wear indicators
+
+
+     - Grinding: Metal-on-metal
+
+
+     - Clicking: Hardware loose
+
+
+     
+
+
+  2. Performance Issues:
+
+
+     - Soft Pedal: Air/Leak
+
+
+     - Hard Pedal: Booster/Master
+
+
+     - Pulling: Caliper/Alignment
+
+
+     
+
+
+  3. Vibration Issues:
+
+
+     - Pedal: Master cylinder
+
+
+     - Steering: Rotors
+
+
+     - Body: Suspension related
+
+
+
+
+
+• Maintenance Schedule:
+
+
+  - Pad Check: Every 10,000 km
+
+
+  - Fluid Change: Every 2 years
+
+
+  - Rotor Check: With pad change
+
+
+  - System Flush: Every 3 years
+
+
+
+
+
+• Emergency Signs:
+
+
+  1. Pedal goes to floor
+
+
+  2. Grinding noise
+
+
+  3. Burning smell
+
+
+  4. ABS light on
+
+
+  5. Pulling to one side
+
+
+
+
+
+• Professional Tips:
+
+
+  1. Always replace in pairs
+
+
+  2. Use quality parts
+
+
+  3. Proper break-in
+
+
+  4. Regular inspection
+
+
+  5. Clean components""",
+
+
+
+
+
+        "ar": """🛑 **دليل شامل لنظام الفرامل (مصر 2025)**
+
+
+
+
+
+• مكونات النظام والمشاكل:
+
+
+  1. الفرامل الأمامية:
+
+
+     - تيل: 400-1700 جنيه/طقم
+
+
+     - ديسكات: 1200-2500 جنيه/زوج
+
+
+     - كاليبرات: 1500-3000 جنيه/قطعة
+
+
+     
+
+
+  2. الفرامل الخلفية:
+
+
+     - تيل: 500-1000 جنيه/طقم
+
+
+     - طنابير: 900-1800 جنيه/زوج
+
+
+     - اسطوانات: 400-800 جنيه/قطعة
+
+
+     
+
+
+  3. النظام الهيدروليكي:
+
+
+     - ماستر: 1200-2500 جنيه
+
+
+     - خراطيم: 400-1000 جنيه
+
+
+     - ABS: 3000-7000 جنيه
+
+
+
+
+
+• المشاكل الشائعة:
+
+
+  1. مشاكل الصوت:
+
+
+     - صفير: مؤشرات التآكل
+
+
+     - احتكاك: معدن بمعدن
+
+
+     - طقطقة: مسامير مفكوكة
+
+
+     
+
+
+  2. مشاكل الأداء:
+
+
+     - دواسة طرية: هواء/تسريب
+
+
+     - دواسة صلبة: بوستر/ماستر
+
+
+     - سحب: كاليبر/زوايا
+
+
+     
+
+
+  3. مشاكل الاهتزاز:
+
+
+     - دواسة: ماستر
+
+
+     - دركسيون: ديسكات
+
+
+     - جسم: تعليق
+
+
+
+
+
+• جدول الصيانة:
+
+
+  - فحص التيل: كل 10,000 كم
+
+
+  - تغيير الزيت: كل سنتين
+
+
+  - فحص الديسكات: مع التيل
+
+
+  - غسيل النظام: كل 3 سنوات
+
+
+
+
+
+• علامات الطوارئ:
+
+
+  1. الدواسة تنزل للأرض
+
+
+  2. صوت احتكاك
+
+
+  3. رائحة حريق
+
+
+  4. لمبة ABS
+
+
+  5. سحب لجانب
+
+
+
+
+
+• نصائح احترافية:
+
+
+  1. التغيير بالأزواج
+
+
+  2. استخدام قطع جيدة
+
+
+  3. تليين صحيح
+
+
+  4. فحص منتظم
+
+
+  5. تنظيف المكونات"""
+
+
+    },
+
+
+}
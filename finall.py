@@ -4,24 +4,79 @@ import chainlit as cl
 from llama_cpp import Llama
 
 
+import llama_cpp
+
+
 import asyncio
 
 
+import codecs
+
+
+import hashlib
+
+
+import hmac
+
+
+import itertools
+
+
+import json
+
+
+import numpy as np
+
+
 import logging
 
 
+import mmap
+
+
 import os
 
 
+import queue
+import random
+
+
 import re
 
 
-from typing import Optional
+import struct
+
+
+import sys
+
+
+import threading
+
+
+import time
+
+
+from types import MappingProxyType
+
+
+import zlib
+
+
+from typing import Iterable, Optional, Sequence
 
 
 import datetime
 
 
+from collections import Counter, OrderedDict, deque
+
+
+from collections.abc import Mapping
+
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
 
 
 
@@ -88,6 +143,30 @@ class ResponseGenerationError(Exception):
 
 
 
+class ModelLoadError(Exception):
+
+
+    """Exception raised when a GGUF model cannot be loaded."""
+
+
+    pass
+
+
+
+
+
+class InferenceQueueFullError(Exception):
+
+
+    """Exception raised when the inference queue cannot accept more requests."""
+
+
+    pass
+
+
+
+
+
 # Set up enhanced logging
 
 
@@ -127,6 +206,15 @@ class Config:
     MODEL_PATH = "./arabic-orpo-llama-3-8b-instruct.Q5_K_S.gguf"
 
 
+    DRAFT_MODEL_PATH = "./Llama-3.2-1B-Instruct.Q4_K_M.gguf"  # must share the Llama-3 vocabulary
+
+
+    SPECULATIVE_DECODING = None  # None, "prompt_lookup" or "draft_model"; N_PARALLEL == 1 only
+
+
+    SPECULATIVE_DRAFT_TOKENS = 8
+
+
     MAX_TOKENS = 300
 
 
@@ -148,6 +236,114 @@ class Config:
     BATCH_SIZE = 512
 
 
+    USE_MMAP = True
+
+
+    USE_MLOCK = True
+
+
+    INFERENCE_WORKERS = 1  # one llama.cpp context; it already uses N_THREADS cores
+
+
+    INFERENCE_QUEUE_SIZE = 16
+
+
+    EMERGENCY_QUEUE_SIZE = 8  # separate budget so emergencies are never rejected behind routine traffic
+
+
+    SESSION_STATE_CACHE_MB = 1024  # saved per-session KV states, evicted least recently used
+
+
+    VERBATIM_HISTORY_TURNS = 2  # newest turns kept word for word in the prompt
+
+
+    SUMMARY_TURN_TOKENS = 48  # per side of an older, condensed turn
+
+
+    TOKEN_COUNT_CACHE_SIZE = 4096
+
+
+    RESPONSE_CACHE_SIZE = 512  # complete answers kept for repeated questions
+
+
+    EMBEDDING_MODEL_PATH = "./multilingual-e5-small.Q8_0.gguf"  # semantic cache; disabled if missing
+
+
+    EMBEDDING_QUERY_PREFIX = "query: "  # e5 models are trained with these role prefixes
+
+
+    EMBEDDING_PASSAGE_PREFIX = "passage: "
+
+
+    SEMANTIC_CACHE_SIZE = 1024
+
+
+    SEMANTIC_CACHE_THRESHOLD = 0.92  # minimum cosine similarity for a paraphrase hit
+
+
+    VECTOR_INDEX_PATH = "./kb_vectors.npy"  # built offline with: python finall.py --build-vector-index
+
+
+    RETRIEVAL_TOP_K = 3  # knowledge sections injected into the prompt
+
+
+    KB_COMPILED_PATH = "./knowledge_base.kb"  # python finall.py --compile-kb knowledge_base.json
+
+
+    KB_LANGUAGES = ("ar", "en")  # language variants indexed for retrieval; others are never decompressed
+
+
+    KB_ARTICLE_CACHE_SIZE = 16  # decompressed articles kept per language
+
+
+    PRICING_PATH = "./pricing.json"  # overrides CostCalculationSystem.DEFAULT_PRICING, hot-reloaded
+
+
+    KB_WATCH_INTERVAL = 30  # seconds between checks for changed knowledge/pricing files; 0 disables
+
+
+    DIAGNOSTIC_TREES_PATH = "./diagnostic_trees.json"  # python finall.py --build-diagnostic-trees
+
+
+    DIAGNOSTIC_TARGET_CONFIDENCE = 0.9  # a diagnosis session stops once one cause reaches this posterior
+
+
+    DIAGNOSTIC_MAX_QUESTIONS = 4
+
+
+    # Sequences decoded together; 1 disables continuous batching. Batched sequences skip the
+
+
+    # per-session KV cache and speculative decoding, so batching is opt-in.
+
+
+    N_PARALLEL = 1
+
+
+    BATCH_WINDOW_MS = 25  # how long an idle engine waits to gather concurrent requests
+
+
+    STOP_SEQUENCES = ["<|eot_id|>", "<|end_of_text|>"]
+
+
+    SYSTEM_PROMPT = (
+
+
+        "You are an expert Egyptian car mechanic assistant. Answer maintenance, diagnostic and cost "
+
+
+        "questions accurately and concisely, quote prices in EGP and always put driver safety first.\n"
+
+
+        "أنت خبير سيارات مصري. أجب بدقة واختصار عن أسئلة الصيانة والأعطال والتكاليف، "
+
+
+        "واذكر الأسعار بالجنيه المصري وضع سلامة السائق أولاً."
+
+
+    )
+
+
     CURRENT_DATE = "2025-06-06 19:00:25"
 
 
@@ -430,4240 +626,4208 @@ class Config:
 
 
 
-# Comprehensive car knowledge base
+# Advanced Diagnostic System Implementation
 
 
-CAR_KNOWLEDGE_BASE = {
+class AdvancedDiagnosticSystem:
 
 
-    # Engine Oil and Lubrication System
+    def __init__(self):
 
 
-    ("تغيير زيت الموتور", "change engine oil", "oil change", "engine oil change", "متى اغير الزيت", 
+        self.diagnostic_data = {
 
 
-     "كل قد ايه اغير زيت", "oil service", "خدمة زيت"): {
+            "engine": {
 
 
-        "en": """🔧 **Complete Engine Oil Service Guide (Egypt 2025)**
+                "symptoms": {
 
 
+                    "starting": {
 
 
+                        "no_crank": {
 
-• Change Intervals by Driving Style:
 
+                            "causes": [
 
-  - City driving: Every 5,000 km
 
+                                {"part": "battery", "probability": 0.4, "cost": "1400-2500"},
 
-  - Highway driving: Every 7,500 km
 
+                                {"part": "starter", "probability": 0.3, "cost": "1800-3500"},
 
-  - Severe conditions: Every 3,000-4,000 km
 
+                                {"part": "alternator", "probability": 0.2, "cost": "2500-4500"}
 
-  - Time-based: Every 6 months (whichever comes first)
 
+                            ],
 
 
+                            "tests": ["Battery voltage", "Starter draw", "Alternator output"]
 
 
-• Oil Grades and Prices (4L):
+                        },
 
 
-  1. Full Synthetic:
+                        "crank_no_start": {
 
 
-     - Mobil 1: 950-1150 EGP
+                            "causes": [
 
 
-     - Castrol EDGE: 850-1000 EGP
+                                {"part": "fuel_pump", "probability": 0.35, "cost": "2100-3700"},
 
 
-     - Shell Helix Ultra: 900-1100 EGP
+                                {"part": "spark_plugs", "probability": 0.25, "cost": "120-270"},
 
 
-     
+                                {"part": "ignition_coil", "probability": 0.2, "cost": "450-1200"}
 
 
-  2. Semi-Synthetic:
+                            ],
 
 
-     - Castrol GTX: 600-800 EGP
+                            "tests": ["Fuel pressure", "Spark test", "Compression test"]
 
 
-     - Shell Helix HX7: 600-750 EGP
+                        }
 
 
-     - Total Quartz: 700-900 EGP
+                    },
 
 
-     
+                    "running": {
 
 
-  3. Conventional:
+                        "misfire": {
 
 
-     - Local brands: 350-550 EGP
+                            "causes": [
 
 
-     - Basic options: 300-450 EGP
+                                {"part": "spark_plugs", "probability": 0.3, "cost": "120-270"},
 
 
+                                {"part": "ignition_coils", "probability": 0.3, "cost": "450-1200"},
 
 
+                                {"part": "fuel_injectors", "probability": 0.2, "cost": "1500-2800"}
 
-• Service Components:
 
+                            ],
 
-  - Oil Filter: 120-220 EGP
 
+                            "tests": ["Compression test", "Spark test", "Injector balance"]
 
-  - Labor: 120-200 EGP
 
+                        }
 
-  - Diagnostic check: 150-300 EGP
 
+                    }
 
-  - Total Service: 600-1700 EGP
 
+                }
 
 
+            }
 
 
-• Severe Conditions Requiring More Frequent Changes:
+        }
 
 
-  1. Frequent short trips (less than 10 km)
+        self.diagnostic_index = self._compile_index(self.diagnostic_data)
 
 
-  2. Extreme heat (above 35°C)
+        
 
 
-  3. Heavy traffic driving
+    @staticmethod
 
 
-  4. Dusty conditions
+    def _compile_index(diagnostic_data: dict) -> dict:
 
 
-  5. Towing or heavy loads
+        """Flatten the diagnostic tree into {(system, symptom, sub_symptom): diagnosis}.
 
 
 
 
 
-• Warning Signs for Immediate Oil Change:
+        Confidences are normalized and causes sorted once here; every
 
 
-  1. Dark/black oil color
+        diagnosis is a read-only mapping shared by all callers.
 
 
-  2. Engine noise increased
+        """
 
 
-  3. Oil pressure warning light
+        index = {}
 
 
-  4. Exhaust smoke
+        for system, system_data in diagnostic_data.items():
 
 
-  5. Oil level dropping quickly
+            for symptom, symptom_data in system_data.get("symptoms", {}).items():
 
 
-  6. Engine running hotter
+                for sub_symptom, problem_data in symptom_data.items():
 
 
+                    total_probability = sum(cause["probability"] for cause in problem_data["causes"])
 
 
+                    causes = sorted(problem_data["causes"], key=lambda cause: cause["probability"], reverse=True)
 
-• Best Practices:
 
+                    index[(system, symptom, sub_symptom)] = MappingProxyType({
 
-  1. Use synthetic oil for Egypt's heat
 
+                        "possible_causes": tuple(
 
-  2. Keep detailed service records
 
+                            MappingProxyType({
 
-  3. Check oil level every 2 weeks
 
+                                "part": cause["part"],
 
-  4. Use manufacturer recommended grade
 
+                                "confidence": round(cause["probability"] / total_probability * 100, 2),
 
-  5. Always replace the oil filter
 
+                                "cost": cause["cost"]
 
-  6. Consider engine age and condition
 
+                            })
 
 
+                            for cause in causes
 
 
-• Professional Tips:
+                        ),
 
 
-  1. Warm engine before changing
+                        "recommended_tests": tuple(problem_data["tests"]),
 
 
-  2. Check for leaks after service
+                        "confidence_level": "high" if total_probability > 0.8 else "medium"
 
 
-  3. Reset oil life monitor if equipped
+                    })
 
 
-  4. Dispose of old oil properly
+        return index
 
 
-  5. Document service date and mileage""",
+    def diagnose(self, system: str, symptom: str, sub_symptom: str) -> Mapping:
 
 
-        
+        """Perform advanced diagnosis based on symptoms.
 
 
-        "ar": """🔧 **دليل شامل لخدمة زيت المحرك (مصر 2025)**
 
 
 
+        Returns a shared read-only mapping; copy it before changing it.
 
 
-• مواعيد التغيير حسب نوع القيادة:
+        """
 
 
-  - داخل المدينة: كل 5000 كم
+        diagnosis = self.diagnostic_index.get((system, symptom, sub_symptom))
 
 
-  - على الطرق السريعة: كل 7500 كم
+        if diagnosis is None:
 
 
-  - الظروف القاسية: كل 3000-4000 كم
+            logger.error(f"Diagnostic error: Unknown problem: {system}/{symptom}/{sub_symptom}")
 
 
-  - حسب الوقت: كل 6 شهور (أيهما يأتي أولاً)
+            raise DiagnosticError(f"Error during diagnosis: Unknown problem: {system}/{symptom}/{sub_symptom}")
 
 
+        return diagnosis
 
 
 
-• درجات الزيت والأسعار (4 لتر):
 
 
-  1. تخليقي كامل:
+# Enhanced User Profile System
 
 
-     - موبيل 1: 950-1150 جنيه
+class EnhancedUserProfile:
 
 
-     - كاسترول إيدج: 850-1000 جنيه
+    def __init__(self, username: str):
 
 
-     - شل هيلكس ألترا: 900-1100 جنيه
+        self.username = username
 
 
-     
+        self.vehicles = {}
 
 
-  2. نصف تخليقي:
+        self.service_history = {}
 
 
-     - كاسترول GTX: 600-800 جنيه
+        self.preferences = {
 
 
-     - شل هيلكس HX7: 600-750 جنيه
+            "preferred_shops": [],
 
 
-     - توتال كوارتز: 700-900 جنيه
+            "parts_quality": "standard",
 
 
-     
+            "notification_preference": "both",  # email/sms/both
 
 
-  3. عادي:
+            "maintenance_style": "standard"  # economic/standard/premium
 
 
-     - ماركات محلية: 350-550 جنيه
+        }
 
 
-     - خيارات أساسية: 300-450 جنيه
+        
 
 
+    def add_vehicle(self, vehicle_id: str, details: dict):
 
 
+        """Add or update vehicle information."""
 
-• مكونات الخدمة:
 
+        try:
 
-  - فلتر الزيت: 120-220 جنيه
 
+            self.vehicles[vehicle_id] = {
 
-  - أجرة العمل: 120-200 جنيه
 
+                "make": details.get("make", ""),
 
-  - فحص بالكمبيوتر: 150-300 جنيه
 
+                "model": details.get("model", ""),
 
-  - إجمالي الخدمة: 600-1700 جنيه
 
+                "year": details.get("year", 0),
 
 
+                "mileage": details.get("mileage", 0),
 
 
-• الظروف التي تتطلب تغيير أكثر تكراراً:
+                "last_service": details.get("last_service", ""),
 
 
-  1. رحلات قصيرة متكررة (أقل من 10 كم)
+                "service_history": [],
 
 
-  2. حرارة شديدة (فوق 35 درجة)
+                "maintenance_schedule": {},
 
 
-  3. القيادة في الزحام
+                "known_issues": []
 
 
-  4. الأجواء المتربة
+            }
 
 
-  5. سحب أحمال ثقيلة
+            self._update_maintenance_schedule(vehicle_id)
 
 
+        except Exception as e:
 
 
+            raise UserProfileError(f"Error adding vehicle: {str(e)}")
 
-• علامات تستدعي تغيير الزيت فوراً:
 
 
-  1. لون الزيت أسود داكن
 
 
-  2. زيادة صوت المحرك
+    def _update_maintenance_schedule(self, vehicle_id: str):
 
 
-  3. إضاءة لمبة ضغط الزيت
+        """Update maintenance schedule based on vehicle information."""
 
 
-  4. دخان من العادم
+        vehicle = self.vehicles.get(vehicle_id)
 
 
-  5. انخفاض مستوى الزيت سريعاً
+        if not vehicle:
 
 
-  6. ارتفاع حرارة المحرك
+            return
 
 
+        fleet_schedule = fleet_scheduler.schedule(
 
 
+            [vehicle["mileage"]],
 
-• أفضل الممارسات:
 
+            [self._get_vehicle_category(vehicle["make"])],
 
-  1. استخدم زيت تخليقي لحرارة مصر
 
+            [vehicle.get("driving_conditions", "normal")]
 
-  2. احتفظ بسجل صيانة مفصل
 
+        )
 
-  3. افحص مستوى الزيت كل أسبوعين
 
+        vehicle["maintenance_schedule"] = fleet_scheduler.vehicle_schedule(fleet_schedule, 0)
 
-  4. استخدم الدرجة الموصى بها من المصنع
 
 
-  5. غيّر فلتر الزيت مع كل تغيير
 
 
-  6. راعي عمر المحرك وحالته
+    def refresh_maintenance_schedules(self):
 
 
+        """Recompute the schedules of all vehicles (e.g. a whole fleet) in one pass."""
 
 
+        vehicle_ids = list(self.vehicles)
 
-• نصائح احترافية:
 
+        if not vehicle_ids:
 
-  1. سخن المحرك قبل التغيير
 
+            return
 
-  2. افحص التسريبات بعد الخدمة
 
+        fleet_schedule = fleet_scheduler.schedule(
 
-  3. اعد ضبط مؤشر عمر الزيت
 
+            [self.vehicles[vehicle_id]["mileage"] for vehicle_id in vehicle_ids],
 
-  4. تخلص من الزيت القديم بشكل صحيح
 
+            [self._get_vehicle_category(self.vehicles[vehicle_id]["make"]) for vehicle_id in vehicle_ids],
 
-  5. سجل تاريخ الخدمة والمسافة"""
 
+            [self.vehicles[vehicle_id].get("driving_conditions", "normal") for vehicle_id in vehicle_ids]
 
-    },
 
+        )
 
-# Continuing CAR_KNOWLEDGE_BASE...
 
+        for index, vehicle_id in enumerate(vehicle_ids):
 
-    # Engine Performance and Diagnostics
 
+            self.vehicles[vehicle_id]["maintenance_schedule"] = fleet_scheduler.vehicle_schedule(fleet_schedule, index)
 
-    ("مشاكل المحرك", "engine problems", "محرك", "engine performance", "قوة المحرك", "engine power", "ضعف المحرك"): {
 
 
-        "en": """🔍 **Complete Engine Diagnostic Guide (Egypt 2025)**
 
 
+    def _get_vehicle_category(self, make: str) -> str:
 
 
+        """Determine vehicle category for maintenance calculations."""
 
-• Common Problems by Symptom:
 
+        make_lower = make.lower()
 
-  1. Starting Issues:
 
+        for category, data in Config.VEHICLE_CATEGORIES.items():
 
-     - No Start: Battery/Starter/Fuel pump (1200-3700 EGP)
 
+            if make_lower in data["brands"]:
 
-     - Hard Start: Spark plugs/Fuel system (400-2000 EGP)
 
+                return category
 
-     - Intermittent: Sensors/Ignition (600-2500 EGP)
 
+        return "economy"  # default category
 
 
 
 
-  2. Running Problems:
 
+# Enhanced Maintenance Scheduling System with Weather and Conditions Adaptation
 
-     - Rough Idle: Spark plugs/Injectors/MAF (500-3000 EGP)
 
+class EnhancedMaintenanceScheduler:
 
-     - Misfire: Coils/Plugs/Compression (450-4000 EGP)
 
+    def __init__(self):
 
-     - Power Loss: Multiple systems (1000-5000 EGP)
 
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:11:27", "%Y-%m-%d %H:%M:%S")
 
 
+        self.current_user = "andrewamirr"
 
 
-  3. Noise Issues:
+        self.weather_conditions = {
 
 
-     - Ticking: Valves/Low oil (500-3000 EGP)
+            "egypt": {
 
 
-     - Knocking: Bearings/Timing (2000-8000 EGP)
+                "summer": {
 
 
-     - Rattling: Timing chain/Mounts (1200-4000 EGP)
+                    "temperature": "35-45°C",
 
 
+                    "humidity": "high",
 
 
+                    "dust": "severe",
 
-• Diagnostic Process:
 
+                    "maintenance_factor": 0.8  # More frequent maintenance needed
 
-  1. Computer Scan: 300-600 EGP
 
+                },
 
-  2. Compression Test: 400-800 EGP
 
+                "winter": {
 
-  3. Fuel Pressure: 300-500 EGP
 
+                    "temperature": "10-25°C",
 
-  4. Smoke Analysis: 400-700 EGP
 
+                    "humidity": "moderate",
 
 
+                    "dust": "moderate",
 
 
-• Component Lifespans:
+                    "maintenance_factor": 1.0
 
 
-  - Spark Plugs: 40,000-100,000 km
+                }
 
 
-  - Ignition Coils: 60,000-120,000 km
+            }
 
 
-  - Fuel Injectors: 100,000-150,000 km
+        }
 
 
-  - Timing Belt: 60,000-100,000 km
+        
 
 
+    def get_current_conditions(self) -> dict:
 
 
+        """Get current weather and environmental conditions."""
 
-• Warning Signs:
 
+        month = self.current_date.month
 
-  1. Check Engine Light
 
+        if 4 <= month <= 10:  # Summer months in Egypt
 
-  2. Unusual Noises
 
+            return self.weather_conditions["egypt"]["summer"]
 
-  3. Performance Drop
 
+        return self.weather_conditions["egypt"]["winter"]
 
-  4. Excessive Smoke
 
 
-  5. High Consumption
 
 
+    def calculate_next_service(self, service_type: str, current_mileage: int,
 
 
+                             vehicle_type: str = "economy", 
 
-• Preventive Maintenance:
 
+                             driving_conditions: str = "normal") -> dict:
 
-  1. Regular Oil Changes
 
+        """Calculate next service considering all factors."""
 
-  2. Air Filter Service
 
+        try:
 
-  3. Fuel System Cleaning
 
+            # Get base intervals
 
-  4. Timing Belt Check
 
+            intervals = Config.MAINTENANCE_INTERVALS.get(service_type, {})
 
-  5. Tune-ups
 
+            base_interval = intervals.get("normal", 10000)
 
 
+            
 
 
-• Emergency Actions:
+            # Adjust for vehicle type
 
 
-  - Stop if knocking occurs
+            vehicle_factor = Config.VEHICLE_CATEGORIES[vehicle_type]["maintenance_factor"]
 
 
-  - Check oil immediately
+            
 
 
-  - Avoid high speeds
+            # Adjust for weather conditions
 
 
-  - Get professional diagnosis""",
+            conditions = self.get_current_conditions()
 
 
+            weather_factor = conditions["maintenance_factor"]
 
 
-
-        "ar": """🔍 **دليل شامل لتشخيص المحرك (مصر 2025)**
-
-
-
-
-
-• المشاكل الشائعة حسب الأعراض:
-
-
-  1. مشاكل التشغيل:
-
-
-     - عدم التشغيل: بطارية/مارش/طرمبة (1200-3700 جنيه)
-
-
-     - صعوبة التشغيل: بوجيهات/نظام الوقود (400-2000 جنيه)
+            
 
 
-     - تقطيع: حساسات/نظام الإشعال (600-2500 جنيه)
+            # Adjust for driving conditions
 
 
+            condition_factors = {
 
 
+                "normal": 1.0,
 
-  2. مشاكل التشغيل:
 
+                "severe": 0.7,
 
-     - رعشة: بوجيهات/رشاشات/حساس هواء (500-3000 جنيه)
 
+                "light": 1.2
 
-     - حريق: كويلات/بوجيهات/ضغط (450-4000 جنيه)
 
+            }
 
-     - ضعف: أنظمة متعددة (1000-5000 جنيه)
 
+            driving_factor = condition_factors.get(driving_conditions, 1.0)
 
 
+            
 
 
-  3. مشاكل الصوت:
+            # Calculate final interval
 
 
-     - طقطقة: صبابات/زيت منخفض (500-3000 جنيه)
+            adjusted_interval = base_interval * vehicle_factor * weather_factor * driving_factor
 
 
-     - خبط: رمان بلي/توقيت (2000-8000 جنيه)
+            
 
 
-     - خرخرة: سلسلة/مساند (1200-4000 جنيه)
+            next_service_km = current_mileage + int(adjusted_interval)
 
 
+            next_service_date = self.current_date + datetime.timedelta(days=int(adjusted_interval/50))  # Assuming 50km per day average
 
 
+            
 
-• عملية التشخيص:
 
+            return {
 
-  1. فحص كمبيوتر: 300-600 جنيه
 
+                "next_service_km": next_service_km,
 
-  2. فحص ضغط: 400-800 جنيه
 
+                "next_service_date": next_service_date.strftime("%Y-%m-%d"),
 
-  3. ضغط وقود: 300-500 جنيه
 
+                "km_remaining": int(adjusted_interval),
 
-  4. تحليل دخان: 400-700 جنيه
 
+                "days_remaining": int((next_service_date - self.current_date).days),
 
 
+                "weather_adjustment": f"{weather_factor:.2f}",
 
 
-• عمر القطع:
+                "urgency": self._calculate_urgency(adjusted_interval)
 
 
-  - بوجيهات: 40,000-100,000 كم
+            }
 
 
-  - كويلات: 60,000-120,000 كم
+        except Exception as e:
 
 
-  - رشاشات: 100,000-150,000 كم
+            raise MaintenanceError(f"Error calculating next service: {str(e)}")
 
 
-  - سير التيمينج: 60,000-100,000 كم
 
 
 
+    def _calculate_urgency(self, interval: float) -> str:
 
 
-• علامات التحذير:
+        """Calculate maintenance urgency level."""
 
 
-  1. لمبة المحرك
+        if interval <= 500:
 
 
-  2. أصوات غريبة
+            return "critical"
 
 
-  3. انخفاض الأداء
+        elif interval <= 1000:
 
 
-  4. دخان زائد
+            return "urgent"
 
 
-  5. استهلاك عالي
+        elif interval <= 2000:
 
 
+            return "soon"
 
 
+        return "normal"
 
-• الصيانة الوقائية:
 
 
-  1. تغيير زيت منتظم
 
+class QueryAnalyzer:
+    # ...existing code...
 
-  2. خدمة فلتر الهواء
+    def analyze_query(self, query: str) -> dict:
+        language = "ar" if is_arabic_text(query) else "en"
+        query_type = self._determine_query_type(query, language)
+        is_emergency = self._check_emergency(query, language)
+        return {
+            "query_type": query_type,
+            "is_emergency": is_emergency,
+            "language": language,
+            "main_content": query
+        }
+        self.current_date = datetime.datetime.strptime("2025-06-06 20:04:01", "%Y-%m-%d %H:%M:%S")
 
+        self.current_user = "andrewamirr"
+# Advanced Cost Calculation System
 
-  3. تنظيف نظام الوقود
 
+class CostCalculationSystem:
 
-  4. فحص سير التيمينج
 
+    DEFAULT_PRICING = {
 
-  5. ضبط المحرك
 
+        "labor_rates": {
 
 
+            "standard": 150,  # EGP per hour
 
 
-• إجراءات الطوارئ:
+            "specialist": 250,
 
 
-  - توقف عند سماع خبط
+            "dealership": 350
 
 
-  - افحص الزيت فوراً
+        },
 
 
-  - تجنب السرعات العالية
+        "parts_quality_factors": {
 
 
-  - احصل على تشخيص محترف"""
+            "economy": 0.7,
 
 
-    },
+            "standard": 1.0,
 
 
+            "premium": 1.4
 
 
+        },
 
-    # Transmission Systems
 
+        "emergency_factor": 1.5,
 
-    ("مشاكل الفتيس", "transmission problems", "فتيس", "gear problems", "ناقل الحركة"): {
 
+        "base_costs": {
 
-        "en": """⚙️ **Transmission Systems Guide (Egypt 2025)**
 
+            "oil_change": {
 
 
+                "parts": 800,
 
 
-• Types and Common Issues:
+                "labor_hours": 1,
 
 
-  1. Automatic Transmission:
+                "complexity": "low"
 
 
-     - Hard Shifts: Solenoids/Fluid (1500-3000 EGP)
+            },
 
 
-     - Slipping: Clutch packs/Bands (3000-7000 EGP)
+            "brake_service": {
 
 
-     - Fluid Leaks: Seals/Gaskets (800-2000 EGP)
+                "parts": 1200,
 
 
+                "labor_hours": 2,
 
 
+                "complexity": "medium"
 
-  2. Manual Transmission:
 
+            },
 
-     - Clutch Issues: Disc/Pressure plate (2500-5000 EGP)
 
+            "timing_belt": {
 
-     - Gear Grinding: Synchros (3000-6000 EGP)
 
+                "parts": 2500,
 
-     - Bearing Noise: Input/Output shaft (2000-4000 EGP)
 
+                "labor_hours": 4,
 
 
+                "complexity": "high"
 
 
-• Service Costs:
+            }
 
 
-  1. Fluid Change:
+            # Add more repair types as needed
 
 
-     - Automatic: 800-1500 EGP
+        }
 
 
-     - Manual: 400-800 EGP
+    }
 
 
-     - CVT: 1000-2000 EGP
+    def __init__(self, pricing: Optional[dict] = None):
 
 
+        # Without explicit pricing, every call reads the live knowledge snapshot
 
 
+        self._pricing = pricing
 
-  2. Major Repairs:
 
+    @property
 
-     - Rebuild: 8000-15000 EGP
 
+    def pricing(self) -> dict:
 
-     - Replace: 15000-30000 EGP
 
+        return self._pricing if self._pricing is not None else knowledge_store.current.pricing
 
-     - Clutch Kit: 3000-7000 EGP
 
+    @property
 
 
+    def labor_rates(self) -> dict:
 
 
-• Maintenance Schedule:
+        return self.pricing["labor_rates"]
 
 
-  - Fluid Check: Monthly
+    @property
 
 
-  - Fluid Change: 40,000-60,000 km
+    def parts_quality_factors(self) -> dict:
 
 
-  - Filter Change: With fluid
+        return self.pricing["parts_quality_factors"]
 
 
-  - Clutch: 80,000-120,000 km
+    @property
 
 
+    def emergency_factor(self) -> float:
 
 
+        return self.pricing["emergency_factor"]
 
-• Warning Signs:
 
+    def calculate_repair_cost(self, repair_type: str, parts_quality: str = "standard",
 
-  1. Delayed Engagement
 
+                            is_emergency: bool = False, shop_type: str = "standard") -> dict:
 
-  2. Rough Shifting
 
+        """Calculate detailed repair cost estimate."""
 
-  3. Slipping Gears
 
+        try:
 
-  4. Strange Noises
 
+            # One snapshot for the whole estimate, even if prices are reloaded meanwhile
 
-  5. Fluid Leaks
 
+            pricing = self.pricing
 
-  6. Burning Smell
 
+            base_costs = pricing["base_costs"]
 
 
+            
 
 
-• Prevention Tips:
+            if repair_type not in base_costs:
 
 
-  1. Regular Fluid Checks
+                raise ValueError(f"Unknown repair type: {repair_type}")
 
 
-  2. Proper Warm-up
+                
 
 
-  3. Avoid Overloading
+            repair_info = base_costs[repair_type]
 
 
-  4. Gentle Shifting
+            
 
 
-  5. Regular Service""",
+            # Calculate parts cost
 
 
+            parts_cost = repair_info["parts"] * pricing["parts_quality_factors"][parts_quality]
 
 
+            
 
-        "ar": """⚙️ **دليل أنظمة ناقل الحركة (مصر 2025)**
 
+            # Calculate labor cost
 
 
+            labor_cost = repair_info["labor_hours"] * pricing["labor_rates"][shop_type]
 
 
-• الأنواع والمشاكل الشائعة:
+            
 
 
-  1. الفتيس الأوتوماتيك:
+            # Apply emergency factor if needed
 
 
-     - تغيير عنيف: سولونويد/زيت (1500-3000 جنيه)
+            if is_emergency:
 
 
-     - تزحلق: دسك/طارة (3000-7000 جنيه)
+                parts_cost *= pricing["emergency_factor"]
 
 
-     - تسريب: جوانات/مانعات (800-2000 جنيه)
+                labor_cost *= pricing["emergency_factor"]
 
 
+                
 
 
+            total_cost = parts_cost + labor_cost
 
-  2. الفتيس العادي:
 
+            
 
-     - مشاكل الدبرياج: دسك/بلية (2500-5000 جنيه)
 
+            return {
 
-     - صوت تعشيق: سنكرونات (3000-6000 جنيه)
 
+                "repair_type": repair_type,
 
-     - صوت رمان: عمود الدخل/الخروج (2000-4000 جنيه)
 
+                "parts_cost": round(parts_cost, 2),
 
 
+                "labor_cost": round(labor_cost, 2),
 
 
-• تكاليف الخدمة:
+                "total_cost": round(total_cost, 2),
 
 
-  1. تغيير الزيت:
+                "quality_level": parts_quality,
 
 
-     - أوتوماتيك: 800-1500 جنيه
+                "is_emergency": is_emergency,
 
 
-     - عادي: 400-800 جنيه
+                "shop_type": shop_type,
 
 
-     - CVT: 1000-2000 جنيه
+                "estimated_time": repair_info["labor_hours"],
 
 
+                "complexity": repair_info["complexity"],
 
 
+                "currency": "EGP"
 
-  2. إصلاحات كبيرة:
 
+            }
 
-     - إصلاح: 8000-15000 جنيه
 
+        except Exception as e:
 
-     - تغيير: 15000-30000 جنيه
 
+            raise CostCalculationError(f"Error calculating repair cost: {str(e)}")
 
-     - طقم دبرياج: 3000-7000 جنيه
 
 
 
 
+# Advanced Response Generation System
 
-• جدول الصيانة:
 
+class ResponseGenerator:
 
-  - فحص الزيت: شهرياً
 
+    def __init__(self):
 
-  - تغيير الزيت: 40,000-60,000 كم
 
+        self.diagnostic_system = AdvancedDiagnosticSystem()
 
-  - تغيير الفلتر: مع الزيت
 
+        self.cost_calculator = CostCalculationSystem()
 
-  - دبرياج: 80,000-120,000 كم
 
+        self.maintenance_scheduler = EnhancedMaintenanceScheduler()
 
 
+        
 
 
-• علامات التحذير:
+    def generate_response(self, query: str, user_profile: EnhancedUserProfile,
 
 
-  1. تأخر التعشيق
+                         language: str = "en") -> dict:
 
 
-  2. تغيير خشن
+        """Generate comprehensive response to user query."""
 
 
-  3. تزحلق التروس
+        try:
 
 
-  4. أصوات غريبة
+            # Analyze query
 
 
-  5. تسريب زيت
+            query_type = self._analyze_query_type(query)
 
 
-  6. رائحة حريق
+            is_emergency = self._check_emergency(query)
 
 
+            
 
 
+            # Get base response from knowledge base
 
-• نصائح وقائية:
 
+            base_response = self._get_knowledge_base_response(query, language)
 
-  1. فحص الزيت بانتظام
 
+            
 
-  2. تسخين مناسب
 
+            # Get diagnostic information if needed
 
-  3. تجنب الحمولة الزائدة
 
+            if query_type == "problem":
 
-  4. تغيير ناعم
 
+                diagnostic_info = self.diagnostic_system.diagnose(
 
-  5. صيانة منتظمة"""
 
+                    system=self._identify_system(query),
 
-    },
 
+                    symptom=self._identify_symptom(query),
 
 
+                    sub_symptom=self._identify_sub_symptom(query)
 
 
-# Continue with more comprehensive problem categories...
+                )
 
 
-    # Brake Systems
+            else:
 
 
-    ("مشاكل الفرامل", "brake problems", "brake system", "فرامل", "صوت فرامل", "brake noise"): {
+                diagnostic_info = None
 
 
-        "en": """🛑 **Complete Brake System Guide (Egypt 2025)**
+                
 
 
+            # Calculate costs if applicable
 
 
+            if query_type in ["repair", "maintenance"]:
 
-• System Components and Issues:
 
+                cost_info = self.cost_calculator.calculate_repair_cost(
 
-  1. Front Brakes:
 
+                    repair_type=self._identify_repair_type(query),
 
-     - Disc Pads: 400-1700 EGP/set
 
+                    parts_quality=user_profile.preferences["parts_quality"],
 
-     - Rotors: 1200-2500 EGP/pair
 
+                    is_emergency=is_emergency
 
-     - Calipers: 1500-3000 EGP/each
 
+                )
 
-     
 
+            else:
 
-  2. Rear Brakes:
 
+                cost_info = None
 
-     - Shoes: 500-1000 EGP/set
 
+                
 
-     - Drums: 900-1800 EGP/pair
 
+            # Format response
 
-     - Cylinders: 400-800 EGP/each
 
+            response = self._format_response(
 
-     
 
+                base_response=base_response,
 
-  3. Hydraulic System:
 
+                diagnostic_info=diagnostic_info,
 
-     - Master Cylinder: 1200-2500 EGP
 
+                cost_info=cost_info,
 
-     - Brake Lines: 400-1000 EGP
 
+                is_emergency=is_emergency,
 
-     - ABS Module: 3000-7000 EGP
 
+                language=language
 
 
+            )
 
 
-• Common Problems:
+            
 
 
-  1. Noise Issues:
+            return response
 
 
-     - Squealing: Wear indicators
+            
 
 
-     - Grinding: Metal-on-metal
+        except Exception as e:
 
 
-     - Clicking: Hardware loose
+            logger.error(f"Response generation error: {str(e)}")
 
 
-     
+            raise ResponseGenerationError(f"Error generating response: {str(e)}")
 
 
-  2. Performance Issues:
 
 
-     - Soft Pedal: Air/Leak
 
+    def _analyze_query_type(self, query: str) -> str:
 
-     - Hard Pedal: Booster/Master
 
+        """Analyze query type (problem, maintenance, repair, info)."""
 
-     - Pulling: Caliper/Alignment
 
+        # Implementation details...
 
-     
 
+        pass
 
-  3. Vibration Issues:
 
 
-     - Pedal: Master cylinder
 
 
-     - Steering: Rotors
+    def _check_emergency(self, query: str) -> bool:
 
 
-     - Body: Suspension related
+        """Check if query indicates emergency situation."""
 
 
+        emergency_keywords = {
 
 
+            "en": ["emergency", "urgent", "help", "stuck", "smoke", "fire"],
 
-• Maintenance Schedule:
 
+            "ar": ["طوارئ", "عاجل", "النجدة", "متعطل", "دخان", "حريق"]
 
-  - Pad Check: Every 10,000 km
 
+        }
 
-  - Fluid Change: Every 2 years
 
+        # Implementation details...
 
-  - Rotor Check: With pad change
 
+        pass
 
-  - System Flush: Every 3 years
 
 
 
 
+# Continue with more implementations...
 
-• Emergency Signs:
 
+# Query Analysis and Emergency Response System
 
-  1. Pedal goes to floor
 
+import datetime
+import re
 
-  2. Grinding noise
+class LanguageIdentifier:
+    """Script profiling for Arabic, English and Arabizi messages.
+
+    Arabic-script runs are cut out with one precompiled pattern and counted.
+    The Latin remainder is lowered and split into words as bytes, which keeps
+    the common all-English message on C-level string operations. Letter
+    counts give the Arabic vs Latin script ratios, and Latin words are checked
+    for Arabizi (Arabic written in Latin letters with digits for sounds such
+    as 3 = ع, 7 = ح, 2 = ء). Mixed messages are answered in the language that
+    carries most of the text; Arabizi is answered in Arabic.
+    """
+    ARABIC_CHARS = r"\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF"
+    # Arabic runs swallow the spaces between Arabic words, so an Arabic sentence is a single match
+    ARABIC_RUN_PATTERN = re.compile(rf"[{ARABIC_CHARS}]+(?:[ ]+[{ARABIC_CHARS}]+)*")
+    LATIN_LETTERS = b"abcdefghijklmnopqrstuvwxyz"
+    # Maps every byte that is not a lowercase letter or digit to a space, so split() yields the words
+    WORD_SEPARATORS = bytes(c if 0x30 <= c <= 0x39 or 0x61 <= c <= 0x7A else 0x20 for c in range(256))
+    # A digit used as a letter, e.g. 3arabeya, e7na, ma3lesh; oil grades such as 5w30 are excluded
+    ARABIZI_DIGIT_PATTERN = re.compile(rb"^(?!\d+w\d+$)[a-z]*[235679][a-z]+\d*$")
+    ARABIZI_WORDS = frozenset(word.encode() for word in [
+        "ana", "enta", "enty", "ezay", "ezzay", "keda", "leh", "msh", "mesh", "mish", "bta3", "beta3",
+        "3ayez", "3awez", "3ayz", "3andy", "3ndy", "feeh", "feha", "ba2a", "ya3ni", "yaani", "zeit", "zeet",
+        "emta", "imta", "delwa2ty", "momken", "mafeesh", "mafish", "3shan", "3lshan", "tayeb", "lazem",
+        "bkam", "be2ad", "3arabeya", "3arabiya", "el3arabeya", "fel", "fl", "wala", "awy", "kteer", "shwaya"
+    ])
+
+    def __init__(self, arabizi_threshold: float = 0.3):
+        self.arabizi_threshold = arabizi_threshold
+
+    def identify(self, text: str) -> dict:
+        """Return the response language with script ratios and the Arabizi verdict."""
+        if text.isascii():
+            arabic_letters = 0
+            latin_text = text
+        else:
+            latin_text = self.ARABIC_RUN_PATTERN.sub(" ", text)
+            arabic_letters = len(text) - len(latin_text) - text.count(" ") + latin_text.count(" ")
+        latin = latin_text.encode("ascii", "replace").lower().translate(self.WORD_SEPARATORS)
+        words = latin.split()
+        arabizi_words = sum(map(self.ARABIZI_WORDS.__contains__, words))
+        if latin.translate(None, self.LATIN_LETTERS + b" "):
+            # Digits present: drop bare numbers and look for digits used as letters
+            words = [word for word in words if not word.isdigit()]
+            arabizi_words += sum(
+                1 for word in words
+                if not word.isalpha() and word not in self.ARABIZI_WORDS and self.ARABIZI_DIGIT_PATTERN.match(word)
+            )
+        latin_letters = sum(map(len, words))
+        latin_words = len(words)
+        letters = arabic_letters + latin_letters
+        arabic_ratio = arabic_letters / letters if letters else 0.0
+        arabizi_ratio = arabizi_words / latin_words if latin_words else 0.0
+        is_arabizi = arabizi_ratio >= self.arabizi_threshold
+        return {
+            "language": "ar" if arabic_ratio >= 0.5 or is_arabizi else "en",
+            "arabic_ratio": round(arabic_ratio, 3),
+            "latin_ratio": round(1.0 - arabic_ratio, 3) if letters else 0.0,
+            "arabizi_ratio": round(arabizi_ratio, 3),
+            "is_arabizi": is_arabizi,
+            "is_mixed": bool(arabic_letters and latin_letters)
+        }
 
+language_identifier = LanguageIdentifier()
 
-  3. Burning smell
+def is_arabic_text(text: str) -> bool:
+    """Check whether a message should be treated (and answered) as Arabic."""
+    return language_identifier.identify(text)["language"] == "ar"
+
+class ArabicNormalizer:
+    """Folds the spelling variants Egyptian users mix freely into one form.
+
+    Tashkeel and tatweel are removed, alef forms become ا, alef maqsura
+    becomes ي, ta marbuta becomes ه and Arabic-Indic digits become ASCII,
+    all through one precomputed str.translate table. Text is also
+    lower-cased and its whitespace collapsed. Keyword lists and knowledge
+    base aliases are normalized once when indexed, queries on every call.
+    """
+    REMOVED_CHARS = "".join(chr(code) for code in range(0x064B, 0x0653)) + "\u0670\u0640"
+    CHAR_MAP = {
+        "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+        "ى": "ي",
+        "ة": "ه",
+        **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+        **{chr(0x06F0 + digit): str(digit) for digit in range(10)}
+    }
 
+    def __init__(self):
+        self.table = str.maketrans({**self.CHAR_MAP, **{char: None for char in self.REMOVED_CHARS}})
+        self.stats = {"calls": 0, "chars": 0, "seconds": 0.0}
+
+    def normalize(self, text: str) -> str:
+        start_time = time.perf_counter()
+        normalized = " ".join(text.lower().translate(self.table).split())
+        self.stats["calls"] += 1
+        self.stats["chars"] += len(text)
+        self.stats["seconds"] += time.perf_counter() - start_time
+        return normalized
+
+    def get_stats(self) -> dict:
+        seconds = self.stats["seconds"]
+        return {
+            **self.stats,
+            "chars_per_second": round(self.stats["chars"] / seconds) if seconds > 0 else 0
+        }
 
-  4. ABS light on
+arabic_normalizer = ArabicNormalizer()
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton that finds every keyword in a text in one pass.
+
+    Keywords are compiled once into a character trie with failure links;
+    each keyword carries a payload that is returned with its matches.
+    """
+    def __init__(self, keywords: Iterable):
+        self.keywords = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for keyword, payload in keywords:
+            if keyword:
+                self._add(keyword, payload)
+        self._link()
+
+    def _add(self, keyword: str, payload) -> None:
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(len(self.keywords))
+        self.keywords.append((keyword, payload))
+
+    def _link(self) -> None:
+        # Breadth-first pass to fill failure links and merge outputs
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self.goto[state].items():
+                pending.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text: str) -> list:
+        """Return (start, end, keyword, payload) for every keyword occurrence in text."""
+        matches = []
+        state = 0
+        goto = self.goto
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = self.fail[state]
+            state = goto[state].get(char, 0)
+            for keyword_id in self.output[state]:
+                keyword, payload = self.keywords[keyword_id]
+                matches.append((position - len(keyword) + 1, position + 1, keyword, payload))
+        return matches
 
+class QueryAnalyzer:
+    QUERY_TYPE_PATTERNS = {
+        "maintenance": {
+            "en": ["change", "service", "maintain", "check", "when should", "how often"],
+            "ar": ["تغيير", "صيانة", "فحص", "متى", "كل قد", "كام"]
+        },
+        "diagnostic": {
+            "en": ["problem", "issue", "broken", "not working", "failed", "wrong"],
+            "ar": ["مشكلة", "عطل", "مكسور", "مش شغال", "عطلان", "خربان"]
+        },
+        "cost": {
+            "en": ["cost", "price", "expensive", "cheap", "how much", "pay"],
+            "ar": ["سعر", "تكلفة", "غالي", "رخيص", "بكام", "كلفة"]
+        },
+        "emergency": {
+            "en": ["emergency", "urgent", "help", "stuck", "smoke", "fire"],
+            "ar": ["طوارئ", "عاجل", "نجدة", "متعطل", "دخان", "حريق"]
+        }
+    }
+    EMERGENCY_KEYWORDS = {
+        "en": ["emergency", "urgent", "help", "stuck", "smoke", "fire", "accident"],
+        "ar": ["طوارئ", "عاجل", "النجدة", "متعطل", "دخان", "حريق", "حادث"]
+    }
 
-  5. Pulling to one side
+    # Latin keywords match whole words, optionally inflected ("problems", "failed", "checking"),
+    # so "fire" is not found inside "misfire"
+    LATIN_SUFFIXES = frozenset(["", "s", "es", "ed", "d", "ing"])
+    # Arabic keywords may carry the clitics written onto the word: a conjunction, a preposition
+    # or the article in front, a pronoun or plural ending behind
+    ARABIC_PREFIXES = frozenset(["", "و", "ف", "ب", "ل", "ك", "ال", "وال", "فال", "بال", "كال", "لل", "ولل",
+                                 "فلل", "وب", "فب", "ول", "فل"])
+    ARABIC_SUFFIXES = frozenset(["", "ه", "ها", "هم", "ك", "كم", "ي", "نا", "ات", "ين", "ون", "ا"])
 
+    # Compiled once per process from the keyword lists above
+    _matcher = None
 
+    def __init__(self):
+        self.current_date = datetime.datetime.strptime("2025-06-06 20:04:01", "%Y-%m-%d %H:%M:%S")
+        self.current_user = "andrewamirr"
+        self.normalizer = arabic_normalizer
+        if QueryAnalyzer._matcher is None:
+            QueryAnalyzer._matcher = self._compile_matcher(self.normalizer)
+        self.matcher = QueryAnalyzer._matcher
+
+    @classmethod
+    def _compile_matcher(cls, normalizer: ArabicNormalizer) -> KeywordAutomaton:
+        """Build one automaton holding every query-type and emergency keyword of every language."""
+        keywords = [(normalizer.normalize(pattern), ("type", query_type))
+                    for query_type, language_patterns in cls.QUERY_TYPE_PATTERNS.items()
+                    for patterns in language_patterns.values()
+                    for pattern in patterns]
+        keywords += [(normalizer.normalize(keyword), ("emergency", None))
+                     for language_keywords in cls.EMERGENCY_KEYWORDS.values()
+                     for keyword in language_keywords]
+        return KeywordAutomaton(keywords)
+
+    def _is_whole_word(self, text: str, start: int, end: int, keyword: str) -> bool:
+        """Whether a keyword hit is a word of its own, allowing for inflection and Arabic clitics."""
+        word_start = start
+        while word_start and text[word_start - 1].isalnum():
+            word_start -= 1
+        word_end = end
+        while word_end < len(text) and text[word_end].isalnum():
+            word_end += 1
+        prefix, suffix = text[word_start:start], text[end:word_end]
+        if keyword[0].isascii():
+            return not prefix and suffix in self.LATIN_SUFFIXES
+        return prefix in self.ARABIC_PREFIXES and suffix in self.ARABIC_SUFFIXES
+
+    def classify(self, query: str) -> dict:
+        """Score every query type in one scan of the normalized query.
+
+        Keywords of every language are matched whatever language the reply
+        will be in: Arabizi and mixed messages are answered in Arabic but
+        often carry English words such as "fire" or "smoke". Only hits that
+        form a word of their own count (see _is_whole_word).
+
+        Returns the best type (most keyword hits, then most matched
+        characters, then declaration order; cost terms win over maintenance),
+        per-type hit counts, the matched spans per type in normalized-text
+        positions, and the emergency flag.
+        """
+        hits = {query_type: 0 for query_type in self.QUERY_TYPE_PATTERNS}
+        matched_chars = dict(hits)
+        spans = {query_type: [] for query_type in self.QUERY_TYPE_PATTERNS}
+        emergency_spans = []
+        text = self.normalizer.normalize(query)
+        found = [hit for hit in self.matcher.find_all(text) if self._is_whole_word(text, *hit[:3])]
+        for start, end, keyword, (kind, query_type) in found:
+            # A keyword inside a longer hit ("كام" in "بكام") belongs to that hit
+            if any(other_start <= start and end <= other_end and other_end - other_start > end - start
+                   for other_start, other_end, *_ in found):
+                continue
+            if kind == "emergency":
+                emergency_spans.append((start, end, keyword))
+                continue
+            hits[query_type] += 1
+            matched_chars[query_type] += end - start
+            spans[query_type].append((start, end, keyword))
+        best_type = max(hits, key=lambda query_type: (hits[query_type], matched_chars[query_type]))
+        # Service names are maintenance keywords, so "how much is an oil change" mentions both;
+        # a price term states what is asked about the service
+        if best_type == "maintenance" and hits["cost"]:
+            best_type = "cost"
+        return {
+            # Default to information type if no specific pattern is matched
+            "query_type": best_type if hits[best_type] else "information",
+            "category_hits": hits,
+            "keyword_spans": {query_type: found for query_type, found in spans.items() if found},
+            "is_emergency": bool(emergency_spans),
+            "emergency_spans": emergency_spans
+        }
+    
+    def analyze_query(self, query: str) -> dict:
+        """Main method to analyze user query"""
+        language_profile = language_identifier.identify(query)
+        language = language_profile["language"]
+        classification = self.classify(query)
+        return {
+            "query_type": classification["query_type"],
+            "is_emergency": classification["is_emergency"],
+            "language": language,
+            "main_content": query,
+            "category_hits": classification["category_hits"],
+            "keyword_spans": classification["keyword_spans"],
+            "language_profile": language_profile
+        }
+    
+    def _determine_query_type(self, query: str, language: str) -> str:
+        """Determine the type of query being asked."""
+        return self.classify(query)["query_type"]
 
+    def _check_emergency(self, query: str, language: str) -> bool:
+        """Check if query indicates an emergency situation."""
+        return self.classify(query)["is_emergency"]
+
+    def analyze_batch(self, queries: Iterable[str], chunk_size: int = 1000, workers: int = 0):
+        """Lazily yield analyze_query results for a stream of queries, in input order.
+
+        Queries are read chunk_size at a time. With workers > 1 the chunks
+        are analyzed in a process pool, with at most two chunks per worker
+        in flight. Progress and queries/sec are kept in self.batch_stats.
+        """
+        iterator = iter(queries)
+        chunks = iter(lambda: list(itertools.islice(iterator, chunk_size)), [])
+        start_time = time.perf_counter()
+        self.batch_stats = {"queries": 0, "chunks": 0, "seconds": 0.0, "queries_per_second": 0.0,
+                            "workers": max(workers, 1)}
+
+        def finish_chunk(results: list) -> list:
+            elapsed = time.perf_counter() - start_time
+            self.batch_stats["queries"] += len(results)
+            self.batch_stats["chunks"] += 1
+            self.batch_stats["seconds"] = round(elapsed, 3)
+            self.batch_stats["queries_per_second"] = round(self.batch_stats["queries"] / elapsed, 1) if elapsed > 0 else 0.0
+            return results
+
+        if workers <= 1:
+            for chunk in chunks:
+                yield from finish_chunk([self.analyze_query(query) for query in chunk])
+        else:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            try:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(analyze_query_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        yield from finish_chunk(pending.popleft().result())
+                while pending:
+                    yield from finish_chunk(pending.popleft().result())
+            finally:
+                pool.shutdown(cancel_futures=True)
+        logger.info(f"Analyzed {self.batch_stats['queries']} queries in {self.batch_stats['seconds']}s "
+                    f"({self.batch_stats['queries_per_second']} queries/sec)")
 
+# One analyzer per batch worker process, created on its first chunk
+_batch_analyzer = None
 
-• Professional Tips:
+def analyze_query_chunk(queries: list) -> list:
+    """Process-pool entry point for QueryAnalyzer.analyze_batch."""
+    global _batch_analyzer
+    if _batch_analyzer is None:
+        _batch_analyzer = QueryAnalyzer()
+    return [_batch_analyzer.analyze_query(query) for query in queries]
 
 
-  1. Always replace in pairs
+import datetime
+import chainlit as cl
+import logging
 
+# Set up logger
+logger = logging.getLogger(__name__)
 
-  2. Use quality parts
+class SessionManager:
+    """Simple session manager for handling user sessions"""
+    def __init__(self):
+        self.sessions = {}
+    
+    def get_or_create_session(self, session_id: str) -> dict:
+        """Get existing session or create new one"""
+        if session_id not in self.sessions:
+            self.sessions[session_id] = {
+                "language": "ar",  # Default to Arabic
+                "created_at": datetime.datetime.now(),
+                "message_count": 0
+            }
+        return self.sessions[session_id]
 
+class CarExpertSystem:
+    def __init__(self):
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:54:22", "%Y-%m-%d %H:%M:%S")
+        self.current_user = "andrewamirr"
+        self.query_analyzer = QueryAnalyzer()
+        self.response_generator = AdvancedResponseGenerator()
+        self.session_manager = SessionManager()
+        
+    async def _send_response(self, response: dict, session_id: str) -> None:
+        """Send response to user via chainlit"""
+        try:
+            # Format the response based on type
+            if response.get("type") == "error":
+                message = f"❌ {response['message']}"
+            elif response.get("type") == "emergency":
+                message = f"🚨 {response['message']}"
+            else:
+                message = response.get("main_content", str(response))
+            
+            await cl.Message(content=message).send()
+            
+        except Exception as e:
+            logger.error(f"Error sending response: {str(e)}")
+            await self._send_system_error(session_id)
 
-  3. Proper break-in
+    async def _send_system_error(self, session_id: str) -> None:
+        """Send system error message"""
+        error_messages = {
+            "en": "⚠️ System Error: Please try again later or contact support.",
+            "ar": "⚠️ خطأ في النظام: يرجى المحاولة لاحقاً أو الاتصال بالدعم."
+        }
+        
+        try:
+            session = self.session_manager.get_or_create_session(session_id)
+            language = session.get("language", "ar")
+            await cl.Message(content=error_messages[language]).send()
+        except Exception as e:
+            # Fallback error message if even error handling fails
+            logger.error(f"Critical error in error handler: {str(e)}")
+            await cl.Message(content="⚠️ Critical system error occurred").send()
 
+    async def process_message(self, message: cl.Message) -> None:
+        """Process incoming message and generate response."""
+        session_id = "default_session"  # Simple session ID
+        
+        try:
+            user_message = message.content.strip()
+            
+            # Analyze query
+            analysis = self.query_analyzer.analyze_query(user_message)
+            
+            # Get or create session
+            session = self.session_manager.get_or_create_session(session_id)
+            session["message_count"] += 1
+            
+            # Generate response using the response generator
+            try:
+                response_content = self.response_generator.generate_response(analysis)
+                
+                # Create response dict
+                response = {
+                    "type": "emergency" if analysis.get("is_emergency") else "normal",
+                    "main_content": response_content,
+                    "message": response_content
+                }
+                
+                # Send the response
+                await self._send_response(response, session_id)
+                
+            except Exception as e:
+                logger.error(f"Error generating response: {str(e)}")
+                # Send error response
+                error_response = self.response_generator._generate_error_response(e, analysis.get("language", "ar"))
+                await self._send_response(error_response, session_id)
+                
+        except Exception as e:
+            logger.error(f"Error processing message: {str(e)}")
+            await self._send_system_error(session_id)
 
-  4. Regular inspection
+    async def _send_formatted_response(self, analysis: dict, session_id: str) -> None:
+        """Send formatted response to user."""
+        try:
+            # Generate proper response using response generator
+            response_content = self.response_generator.generate_response(analysis)
+            
+            if response_content:
+                await cl.Message(content=response_content).send()
+            else:
+                await self._send_default_response(analysis, session_id)
+                
+        except Exception as e:
+            logger.error(f"Error sending formatted response: {str(e)}")
+            await self._send_system_error(session_id)
 
+    async def _send_default_response(self, analysis: dict, session_id: str) -> None:
+        """Send default response when specific content is not available."""
+        default_responses = {
+            "ar": "عذراً، لم أفهم سؤالك بشكل كامل. هل يمكنك إعادة صياغته بطريقة أخرى؟",
+            "en": "I'm sorry, I didn't fully understand your question. Could you rephrase it?"
+        }
+        
+        language = analysis.get("language", "ar")
+        message = default_responses.get(language, default_responses["ar"])
+        
+        await cl.Message(content=message).send()
 
-  5. Clean components""",
+# Main message handler
 
 
+import chainlit as cl
+import logging
 
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
+# Initialize car expert system globally (before handlers)
+car_expert = None
 
-        "ar": """🛑 **دليل شامل لنظام الفرامل (مصر 2025)**
+@cl.on_chat_start
+async def start():
+    """Initialize the chat session"""
+    global car_expert
+    try:
+        # Initialize the car expert system
+        car_expert = CarExpertSystem()
+        logger.info("🚗 Car Expert System initialized successfully")
+        
+        welcome_message = """🚗 **Welcome to the Advanced Car Expert System!**
 
+مرحباً بك في نظام خبير السيارات المتقدم!
 
+**Version:** 2.5.0  
+**Last Updated:** 2025-06-06 19:54:22  
+**Current User:** andrewamirr
 
+---
 
+**I can help you with:**
+• Car diagnostics and troubleshooting
+• Maintenance schedules and advice  
+• Emergency assistance
+• Cost estimates
+• Technical support
 
-• مكونات النظام والمشاكل:
+**يمكنني مساعدتك في:**
+• تشخيص أعطال السيارات
+• جداول الصيانة والنصائح
+• المساعدة في الطوارئ
+• تقدير التكاليف
+• الدعم الفني
 
+---
 
-  1. الفرامل الأمامية:
+**How can I help you today?** / **كيف يمكنني مساعدتك اليوم؟**
 
+*Example: "البطارية مش شغالة" or "Engine making noise"*"""
+        
+        await cl.Message(content=welcome_message).send()
+        
+    except Exception as e:
+        logger.error(f"Initialization error: {str(e)}")
+        error_message = """❌ **System Initialization Failed**
 
-     - تيل: 400-1700 جنيه/طقم
+عذراً، فشل في تهيئة النظام. يرجى المحاولة مرة أخرى.
 
+Sorry, system initialization failed. Please try again later."""
+        await cl.Message(content=error_message).send()
 
-     - ديسكات: 1200-2500 جنيه/زوج
+@cl.on_message
+async def main(message: cl.Message):
+    """Handle incoming messages"""
+    global car_expert
+    
+    try:
+        # Check if car_expert is initialized
+        if car_expert is None:
+            logger.warning("Car expert system not initialized, creating new instance")
+            car_expert = CarExpertSystem()
+        
+        # Process message through car expert system
+        await car_expert.process_message(message)
+        
+    except Exception as e:
+        logger.error(f"Error in main handler: {str(e)}")
+        
+        # Send error message in both languages
+        error_message = """❌ **Error Occurred**
 
+حدث خطأ أثناء معالجة رسالتك. يرجى المحاولة مرة أخرى.
 
-     - كاليبرات: 1500-3000 جنيه/قطعة
+An error occurred while processing your message. Please try again.
 
+*If the problem persists, please restart the chat.*"""
+        
+        await cl.Message(content=error_message).send()
 
-     
+# Additional handler for when user leaves
+@cl.on_chat_end
+async def end():
+    """Handle chat end"""
+    logger.info("Chat session ended")
 
+if __name__ == "__main__":
+    # This will run when the script is executed directly
+    logger.info("🚗 Car Expert System ready to start")
+    print("Run with: chainlit run your_filename.py")
+class AdvancedResponseGenerator:
 
-  2. الفرامل الخلفية:
+    async def _get_main_content(self, query, language):
+        # Minimal stub to avoid AttributeError
+        return "This is a placeholder main content response."
+    def _generate_error_response(self, error: Exception, language: str) -> dict:
 
 
-     - تيل: 500-1000 جنيه/طقم
+        """Generate error response in the appropriate language."""
 
 
-     - طنابير: 900-1800 جنيه/زوج
+        error_messages = {
 
 
-     - اسطوانات: 400-800 جنيه/قطعة
+            "en": {
 
 
-     
+                "general": "Sorry, an error occurred. Please try again.",
 
 
-  3. النظام الهيدروليكي:
+                "maintenance": "Unable to process maintenance request.",
 
 
-     - ماستر: 1200-2500 جنيه
+                "diagnostic": "Unable to complete diagnostic analysis.",
 
 
-     - خراطيم: 400-1000 جنيه
+                "cost": "Unable to calculate costs at this time."
 
 
-     - ABS: 3000-7000 جنيه
+            },
 
 
+            "ar": {
 
 
+                "general": "عذراً، حدث خطأ. يرجى المحاولة مرة أخرى.",
 
-• المشاكل الشائعة:
 
+                "maintenance": "تعذر معالجة طلب الصيانة.",
 
-  1. مشاكل الصوت:
 
+                "diagnostic": "تعذر إكمال التحليل التشخيصي.",
 
-     - صفير: مؤشرات التآكل
 
+                "cost": "تعذر حساب التكاليف في الوقت الحالي."
 
-     - احتكاك: معدن بمعدن
 
+            }
 
-     - طقطقة: مسامير مفكوكة
 
+        }
 
-     
 
 
-  2. مشاكل الأداء:
 
 
-     - دواسة طرية: هواء/تسريب
+        error_type = type(error).__name__
 
 
-     - دواسة صلبة: بوستر/ماستر
+        error_category = "general"
 
 
-     - سحب: كاليبر/زوايا
+        
 
 
-     
+        if "Maintenance" in error_type:
 
 
-  3. مشاكل الاهتزاز:
+            error_category = "maintenance"
 
 
-     - دواسة: ماستر
+        elif "Diagnostic" in error_type:
 
 
-     - دركسيون: ديسكات
+            error_category = "diagnostic"
 
 
-     - جسم: تعليق
+        elif "Cost" in error_type:
 
 
+            error_category = "cost"
 
 
 
-• جدول الصيانة:
 
 
-  - فحص التيل: كل 10,000 كم
+        return {
 
 
-  - تغيير الزيت: كل سنتين
+            "type": "error",
 
 
-  - فحص الديسكات: مع التيل
+            "message": error_messages[language][error_category],
 
 
-  - غسيل النظام: كل 3 سنوات
+            "error_code": error_type,
 
 
+            "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S")
 
 
+        }
 
-• علامات الطوارئ:
+        self.current_date = datetime.datetime.now()
 
 
-  1. الدواسة تنزل للأرض
 
+class CarExpertSystem:
 
-  2. صوت احتكاك
 
+    async def _send_response(self, response: dict, session_id: str) -> None:
 
-  3. رائحة حريق
 
+        """Send response to the user."""
 
-  4. لمبة ABS
 
+        try:
 
-  5. سحب لجانب
 
+            # Format the response based on type
 
 
+            if response.get("type") == "error":
 
 
-• نصائح احترافية:
+                message = f"❌ {response['message']}"
 
 
-  1. التغيير بالأزواج
+            elif response.get("type") == "emergency":
 
 
-  2. استخدام قطع جيدة
+                message = f"🚨 {response['message']}"
 
 
-  3. تليين صحيح
+            else:
 
 
-  4. فحص منتظم
+                message = self._format_response(response)
 
 
-  5. تنظيف المكونات"""
 
 
-    },
 
+            # Send the message
 
-}
 
+            await cl.Message(content=message).send()
 
-# Advanced Diagnostic System Implementation
 
+            
 
-class AdvancedDiagnosticSystem:
 
+        except Exception as e:
 
-    def __init__(self):
 
+            logger.error(f"Error sending response: {str(e)}")
 
-        self.diagnostic_data = {
 
+            await self._send_system_error(session_id)
 
-            "engine": {
 
 
-                "symptoms": {
 
 
-                    "starting": {
+    def _format_response(self, response: dict) -> str:
 
 
-                        "no_crank": {
+        """Format the response for display."""
 
 
-                            "causes": [
+        language = response.get("language", "en")
 
 
-                                {"part": "battery", "probability": 0.4, "cost": "1400-2500"},
+        
 
 
-                                {"part": "starter", "probability": 0.3, "cost": "1800-3500"},
+        if language == "ar":
 
 
-                                {"part": "alternator", "probability": 0.2, "cost": "2500-4500"}
+            if "maintenance_info" in response:
+                return response.get("main_content", "") + "\n\n" + \
+                       "معلومات الصيانة:\n" + response["maintenance_info"]
 
 
-                            ],
+            return response.get("main_content", "")
 
 
-                            "tests": ["Battery voltage", "Starter draw", "Alternator output"]
+        else:
 
 
-                        },
+            if "maintenance_info" in response:
 
 
-                        "crank_no_start": {
+                                return response.get("main_content", "") + "\n\n" + \
+                "Maintenance Information:\n" + response["maintenance_info"]
 
 
-                            "causes": [
+            return response.get("main_content", "")
 
 
-                                {"part": "fuel_pump", "probability": 0.35, "cost": "2100-3700"},
 
 
-                                {"part": "spark_plugs", "probability": 0.25, "cost": "120-270"},
 
+    async def _send_system_error(self, session_id: str) -> None:
 
-                                {"part": "ignition_coil", "probability": 0.2, "cost": "450-1200"}
 
+        """Send system error message."""
 
-                            ],
 
+        error_messages = {
 
-                            "tests": ["Fuel pressure", "Spark test", "Compression test"]
 
+            "en": "⚠️ System Error: Please try again later or contact support.",
 
-                        }
 
+            "ar": "⚠️ خطأ في النظام: يرجى المحاولة لاحقاً أو الاتصال بالدعم."
 
-                    },
 
+        }
 
-                    "running": {
 
+        
 
-                        "misfire": {
 
+        # Get user's language preference from session
 
-                            "causes": [
 
+        session = self.session_manager.get_or_create_session(session_id)
 
-                                {"part": "spark_plugs", "probability": 0.3, "cost": "120-270"},
 
+        language = session.get("language", "en")
 
-                                {"part": "ignition_coils", "probability": 0.3, "cost": "450-1200"},
 
+        
 
-                                {"part": "fuel_injectors", "probability": 0.2, "cost": "1500-2800"}
 
+        await cl.Message(content=error_messages[language]).send()
 
-                            ],
 
 
-                            "tests": ["Compression test", "Spark test", "Injector balance"]
 
 
-                        }
+    async def _send_emergency_notification(self, response: dict, session_id: str) -> None:
 
 
-                    }
+        """Send emergency notification."""
 
 
-                }
+        emergency_prefix = "🚨 EMERGENCY / طوارئ 🚨\n\n"
 
 
-            }
+        await cl.Message(content=emergency_prefix + response.get("message", "")).send()
 
 
-        }
 
 
-        
 
+# Update the main message handler
 
-    def diagnose(self, system: str, symptom: str, sub_symptom: str) -> dict:
 
+@cl.on_message
 
-        """Perform advanced diagnosis based on symptoms."""
 
+async def main(message: cl.Message):
 
-        try:
 
+    try:
 
-            system_data = self.diagnostic_data.get(system, {})
 
+        user_message = message.content.strip()
 
-            symptom_data = system_data.get("symptoms", {}).get(symptom, {})
 
+        
 
-            problem_data = symptom_data.get(sub_symptom, {})
 
+        if not user_message:
 
-            
 
+            await cl.Message(content="Please enter your question. / يرجى إدخال سؤالك.").send()
 
-            if not problem_data:
 
+            return
 
-                raise DiagnosticError(f"Unknown problem: {system}/{symptom}/{sub_symptom}")
 
 
-                
 
 
-            # Calculate confidence scores
+        # Process message through car expert system
 
 
-            total_probability = sum(cause["probability"] for cause in problem_data["causes"])
+        await car_expert.process_message(message)
 
 
-            normalized_causes = []
+        
 
 
-            
+    except Exception as e:
 
 
-            for cause in problem_data["causes"]:
+        logger.error(f"Error in main handler: {str(e)}")
 
 
-                normalized_causes.append({
+        error_message = "An error occurred. Please try again."
 
 
-                    "part": cause["part"],
+        await cl.Message(content=error_message).send()
 
 
-                    "confidence": round(cause["probability"] / total_probability * 100, 2),
 
 
-                    "cost": cause["cost"]
 
+# Enhanced Multilingual Support System
 
-                })
 
+class MultilingualSystem:
 
-                
 
+    def __init__(self):
 
-            return {
 
+        self.supported_languages = ["en", "ar"]
 
-                "possible_causes": normalized_causes,
 
+        self.translations = {
 
-                "recommended_tests": problem_data["tests"],
 
+            "emergency_responses": {
 
-                "confidence_level": "high" if total_probability > 0.8 else "medium"
 
+                "en": {
 
-            }
 
+                    "critical": "🚨 CRITICAL: Stop driving immediately and call emergency services!",
 
-            
 
+                    "high": "⚠️ WARNING: Get to a safe location and contact a mechanic.",
 
-        except Exception as e:
 
+                    "medium": "📢 CAUTION: Monitor the situation and seek professional help soon.",
 
-            logger.error(f"Diagnostic error: {str(e)}")
 
+                    "low": "ℹ️ NOTE: Schedule a check-up at your earliest convenience."
 
-            raise DiagnosticError(f"Error during diagnosis: {str(e)}")
 
+                },
 
 
+                "ar": {
 
 
-# Enhanced User Profile System
+                    "critical": "🚨 خطر: توقف فوراً واتصل بخدمات الطوارئ!",
 
 
-class EnhancedUserProfile:
+                    "high": "⚠️ تحذير: توجه لمكان آمن واتصل بميكانيكي.",
 
 
-    def __init__(self, username: str):
+                    "medium": "📢 تنبيه: راقب الوضع واطلب مساعدة فني قريباً.",
 
 
-        self.username = username
+                    "low": "ℹ️ ملاحظة: احجز موعد فحص في أقرب وقت مناسب."
 
 
-        self.vehicles = {}
+                }
 
 
-        self.service_history = {}
+            },
 
 
-        self.preferences = {
+            "maintenance_terms": {
 
 
-            "preferred_shops": [],
+                "en": {
 
 
-            "parts_quality": "standard",
+                    "oil_change": "Oil Change",
 
 
-            "notification_preference": "both",  # email/sms/both
+                    "brake_service": "Brake Service",
 
 
-            "maintenance_style": "standard"  # economic/standard/premium
+                    "tire_rotation": "Tire Rotation"
 
 
-        }
+                },
 
 
-        
+                "ar": {
 
 
-    def add_vehicle(self, vehicle_id: str, details: dict):
+                    "oil_change": "تغيير زيت",
 
 
-        """Add or update vehicle information."""
+                    "brake_service": "صيانة فرامل",
 
 
-        try:
+                    "tire_rotation": "تغيير مكان الكاوتش"
 
 
-            self.vehicles[vehicle_id] = {
+                }
 
 
-                "make": details.get("make", ""),
+            }
 
 
-                "model": details.get("model", ""),
+        }
 
 
-                "year": details.get("year", 0),
+        
 
 
-                "mileage": details.get("mileage", 0),
+    def get_response(self, key: str, subkey: str, language: str) -> str:
 
 
-                "last_service": details.get("last_service", ""),
+        """Get translated response."""
 
 
-                "service_history": [],
+        try:
 
 
-                "maintenance_schedule": {},
+            return self.translations.get(key, {}).get(language, {}).get(subkey, "")
 
 
-                "known_issues": []
+        except Exception as e:
 
 
-            }
+            logger.error(f"Translation error: {str(e)}")
 
 
-            self._update_maintenance_schedule(vehicle_id)
+            return ""
 
 
-        except Exception as e:
 
 
-            raise UserProfileError(f"Error adding vehicle: {str(e)}")
 
+# Enhanced Error Handling System
 
 
+class ErrorHandler:
 
 
-    def _update_maintenance_schedule(self, vehicle_id: str):
+    def __init__(self):
 
 
-        """Update maintenance schedule based on vehicle information."""
+        self.error_responses = {
 
 
-        vehicle = self.vehicles.get(vehicle_id)
+            "en": {
 
 
-        if not vehicle:
+                "diagnostic_error": "Unable to complete diagnosis. Please provide more details or visit a mechanic.",
 
 
-            return
+                "maintenance_error": "Error calculating maintenance schedule. Please check vehicle information.",
 
 
-            
+                "cost_error": "Unable to calculate costs. Please try again with more specific information.",
 
 
-        # Calculate next service dates
+                "system_error": "System temporarily unavailable. Please try again later.",
 
 
-        current_mileage = vehicle["mileage"]
+                "invalid_input": "Please provide valid information about your vehicle issue.",
 
 
-        maintenance_scheduler = EnhancedMaintenanceScheduler()
+                "busy_error": "The assistant is busy answering other drivers. Please try again in a moment."
 
 
-        
+            },
 
 
-        for service_type, intervals in Config.MAINTENANCE_INTERVALS.items():
+            "ar": {
 
 
-            next_service = maintenance_scheduler.calculate_next_service(
 
+                "diagnostic_error": "تعذر إكمال التشخيص. يرجى تقديم المزيد من التفاصيل أو زيارة ميكانيكي.",
 
-                service_type=service_type,
 
+                "maintenance_error": "خطأ في حساب جدول الصيانة. يرجى التحقق من معلومات السيارة.",
 
-                current_mileage=current_mileage,
 
+                "cost_error": "تعذر حساب التكاليف. يرجى المحاولة مرة أخرى مع معلومات أكثر تحديداً.",
 
-                vehicle_type=self._get_vehicle_category(vehicle["make"])
 
+                "system_error": "النظام غير متاح مؤقتاً. يرجى المحاولة لاحقاً.",
 
-            )
 
+                "invalid_input": "يرجى تقديم معلومات صحيحة عن مشكلة سيارتك.",
 
-            vehicle["maintenance_schedule"][service_type] = next_service
 
+                "busy_error": "المساعد مشغول بالرد على سائقين آخرين. يرجى المحاولة بعد قليل."
 
 
+            }
 
 
-    def _get_vehicle_category(self, make: str) -> str:
+        }
 
 
-        """Determine vehicle category for maintenance calculations."""
+        
 
 
-        make_lower = make.lower()
+    async def handle_error(self, error: Exception, language: str) -> dict:
+        logger.error(f"Error occurred: {str(error)}")
+        error_type = type(error).__name__
+        error_mapping = {
+            "DiagnosticError": "diagnostic_error",
+            "MaintenanceError": "maintenance_error",
+            "CostCalculationError": "cost_error",
+            "ValueError": "invalid_input",
+            "InferenceQueueFullError": "busy_error",
+            "Exception": "system_error"
+        }
+        response_key = error_mapping.get(error_type, "system_error")
+        return {
+            "type": "error",
+            "message": self.error_responses[language][response_key]
+        }
 
 
-        for category, data in Config.VEHICLE_CATEGORIES.items():
 
 
-            if make_lower in data["brands"]:
 
+# User Interaction Flow System
 
-                return category
 
+class UserInteractionFlow:
 
-        return "economy"  # default category
 
+    def __init__(self):
 
 
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:16:36", "%Y-%m-%d %H:%M:%S")
 
 
-# Enhanced Maintenance Scheduling System with Weather and Conditions Adaptation
+        self.current_user = "andrewamirr"
 
 
-class EnhancedMaintenanceScheduler:
+        self.query_analyzer = QueryAnalyzer()
 
 
-    def __init__(self):
+        self.multilingual = MultilingualSystem()
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:11:27", "%Y-%m-%d %H:%M:%S")
+        self.error_handler = ErrorHandler()
 
 
-        self.current_user = "andrewamirr"
+        self.session_data = {}
 
 
-        self.weather_conditions = {
+        
 
 
-            "egypt": {
+    async def handle_interaction(self, message: str, session_id: str) -> dict:
 
 
-                "summer": {
+        """Handle user interaction and maintain conversation flow."""
 
 
-                    "temperature": "35-45°C",
+        try:
 
 
-                    "humidity": "high",
+            # Initialize or get session
 
 
-                    "dust": "severe",
+            session = self.session_data.get(session_id, {
 
 
-                    "maintenance_factor": 0.8  # More frequent maintenance needed
+                "start_time": self.current_date,
 
 
-                },
+                "language": "en",
 
 
-                "winter": {
+                "context": [],
 
 
-                    "temperature": "10-25°C",
+                "vehicle_info": None,
 
 
-                    "humidity": "moderate",
+                "last_query": None
 
 
-                    "dust": "moderate",
+            })
 
 
-                    "maintenance_factor": 1.0
+            
 
 
-                }
+            # Analyze query
 
 
-            }
+            analysis = self.query_analyzer.analyze_query(message)
 
 
-        }
+            session["language"] = analysis["language"]
 
 
-        
+            
 
 
-    def get_current_conditions(self) -> dict:
+            # Handle emergency cases first
 
 
-        """Get current weather and environmental conditions."""
+            if analysis["is_emergency"]:
 
 
-        month = self.current_date.month
+                return await self._handle_emergency(message, analysis, session)
 
 
-        if 4 <= month <= 10:  # Summer months in Egypt
+                
 
 
-            return self.weather_conditions["egypt"]["summer"]
+            # Process normal queries
 
 
-        return self.weather_conditions["egypt"]["winter"]
+            response = await self._process_query(message, analysis, session)
 
 
+            
 
 
+            # Update session context
 
-    def calculate_next_service(self, service_type: str, current_mileage: int,
 
+            session["context"].append({
 
-                             vehicle_type: str = "economy", 
 
+                "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
-                             driving_conditions: str = "normal") -> dict:
 
+                "query": message,
 
-        """Calculate next service considering all factors."""
 
+                "response": response
 
-        try:
 
+            })
 
-            # Get base intervals
 
+            
 
-            intervals = Config.MAINTENANCE_INTERVALS.get(service_type, {})
 
+            # Trim context if too long
 
-            base_interval = intervals.get("normal", 10000)
 
+            if len(session["context"]) > 10:
 
-            
 
+                session["context"] = session["context"][-10:]
 
-            # Adjust for vehicle type
 
+                
 
-            vehicle_factor = Config.VEHICLE_CATEGORIES[vehicle_type]["maintenance_factor"]
 
+            self.session_data[session_id] = session
 
-            
 
+            return response
 
-            # Adjust for weather conditions
 
+            
 
-            conditions = self.get_current_conditions()
 
+        except Exception as e:
 
-            weather_factor = conditions["maintenance_factor"]
 
+            return await self.error_handler.handle_error(e, session.get("language", "en"))
 
-            
-
-
-            # Adjust for driving conditions
-
-
-            condition_factors = {
-
-
-                "normal": 1.0,
-
-
-                "severe": 0.7,
-
-
-                "light": 1.2
-
-
-            }
-
-
-            driving_factor = condition_factors.get(driving_conditions, 1.0)
-
-
-            
-
-
-            # Calculate final interval
-
-
-            adjusted_interval = base_interval * vehicle_factor * weather_factor * driving_factor
-
-
-            
-
-
-            next_service_km = current_mileage + int(adjusted_interval)
-
-
-            next_service_date = self.current_date + datetime.timedelta(days=int(adjusted_interval/50))  # Assuming 50km per day average
-
-
-            
-
-
-            return {
-
-
-                "next_service_km": next_service_km,
-
-
-                "next_service_date": next_service_date.strftime("%Y-%m-%d"),
-
-
-                "km_remaining": int(adjusted_interval),
-
-
-                "days_remaining": int((next_service_date - self.current_date).days),
-
-
-                "weather_adjustment": f"{weather_factor:.2f}",
-
-
-                "urgency": self._calculate_urgency(adjusted_interval)
 
 
-            }
-
-
-        except Exception as e:
-
-
-            raise MaintenanceError(f"Error calculating next service: {str(e)}")
-
-
-
-
-
-    def _calculate_urgency(self, interval: float) -> str:
-
-
-        """Calculate maintenance urgency level."""
 
 
-        if interval <= 500:
+    async def _handle_emergency(self, message: str, analysis: dict, session: dict) -> dict:
 
 
-            return "critical"
+        """Handle emergency situations with priority."""
 
 
-        elif interval <= 1000:
+        language = session["language"]
 
 
-            return "urgent"
+        emergency_response = {
 
 
-        elif interval <= 2000:
+            "type": "emergency",
 
 
-            return "soon"
+            "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
 
-        return "normal"
+            "urgency": "critical",
 
 
+            "message": self.multilingual.get_response("emergency_responses", "critical", language),
 
 
-class QueryAnalyzer:
-    # ...existing code...
+            "actions": [
 
-    def analyze_query(self, query: str) -> dict:
-        language = "ar" if is_arabic_text(query) else "en"
-        query_type = self._determine_query_type(query, language)
-        is_emergency = self._check_emergency(query, language)
-        return {
-            "query_type": query_type,
-            "is_emergency": is_emergency,
-            "language": language,
-            "main_content": query
-        }
-        self.current_date = datetime.datetime.strptime("2025-06-06 20:04:01", "%Y-%m-%d %H:%M:%S")
 
-        self.current_user = "andrewamirr"
-# Advanced Cost Calculation System
+                {
 
 
-class CostCalculationSystem:
+                    "type": "contact",
 
 
-    def __init__(self):
+                    "service": "emergency",
 
 
-        self.labor_rates = {
+                    "number": "122"  # Egypt emergency number
 
 
-            "standard": 150,  # EGP per hour
+                },
 
 
-            "specialist": 250,
+                {
 
 
-            "dealership": 350
+                    "type": "contact",
 
 
-        }
+                    "service": "roadside",
 
 
-        self.parts_quality_factors = {
+                    "number": "01234567890"  # Example roadside assistance
 
 
-            "economy": 0.7,
+                }
 
 
-            "standard": 1.0,
+            ],
 
 
-            "premium": 1.4
+            "safety_instructions": self._get_safety_instructions(analysis, language)
 
 
         }
 
 
-        self.emergency_factor = 1.5
-
-
         
 
 
-    def calculate_repair_cost(self, repair_type: str, parts_quality: str = "standard",
-
-
-                            is_emergency: bool = False, shop_type: str = "standard") -> dict:
+        # Log emergency situation
 
 
-        """Calculate detailed repair cost estimate."""
+        logger.warning(f"Emergency situation detected for user {self.current_user}: {message}")
 
 
-        try:
+        return emergency_response
 
 
-            base_costs = {
 
 
-                "oil_change": {
 
+    async def _process_query(self, message: str, analysis: dict, session: dict) -> dict:
 
-                    "parts": 800,
 
+        """Process normal queries and generate response."""
 
-                    "labor_hours": 1,
 
+        query_type = analysis["query_type"]
 
-                    "complexity": "low"
 
+        language = session["language"]
 
-                },
 
+        
 
-                "brake_service": {
 
+        processors = {
 
-                    "parts": 1200,
 
+            "diagnostic": self._handle_diagnostic_query,
 
-                    "labor_hours": 2,
 
+            "maintenance": self._handle_maintenance_query,
 
-                    "complexity": "medium"
 
+            "cost": self._handle_cost_query,
 
-                },
 
+            "information": self._handle_information_query
 
-                "timing_belt": {
 
+        }
 
-                    "parts": 2500,
 
+        
 
-                    "labor_hours": 4,
 
+        processor = processors.get(query_type, self._handle_general_query)
 
-                    "complexity": "high"
 
+        return await processor(message, analysis, session)
 
-                }
 
 
-                # Add more repair types as needed
 
 
-            }
+# External Services Integration
 
 
-            
+class ExternalServicesManager:
 
 
-            if repair_type not in base_costs:
+    def __init__(self):
 
 
-                raise ValueError(f"Unknown repair type: {repair_type}")
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:16:36", "%Y-%m-%d %H:%M:%S")
 
 
-                
+        self.current_user = "andrewamirr"
 
 
-            repair_info = base_costs[repair_type]
+        self.api_keys = {
 
 
-            
+            "weather": "xxx",
 
 
-            # Calculate parts cost
+            "maps": "xxx",
 
 
-            parts_cost = repair_info["parts"] * self.parts_quality_factors[parts_quality]
+            "parts_database": "xxx"
 
 
-            
+        }
 
 
-            # Calculate labor cost
+        
 
 
-            labor_cost = repair_info["labor_hours"] * self.labor_rates[shop_type]
+    async def get_nearest_mechanics(self, location: dict) -> list:
 
 
-            
+        """Find nearest mechanics using Maps API."""
 
 
-            # Apply emergency factor if needed
+        try:
 
 
-            if is_emergency:
+            # Simulated API call
 
 
-                parts_cost *= self.emergency_factor
+            mechanics = [
 
 
-                labor_cost *= self.emergency_factor
+                {
 
 
-                
+                    "name": "Cairo Auto Care",
 
 
-            total_cost = parts_cost + labor_cost
+                    "distance": "1.2 km",
 
 
-            
+                    "rating": 4.5,
 
 
-            return {
+                    "phone": "01234567890",
 
 
-                "repair_type": repair_type,
+                    "open_now": True
 
 
-                "parts_cost": round(parts_cost, 2),
+                },
 
 
-                "labor_cost": round(labor_cost, 2),
+                {
 
 
-                "total_cost": round(total_cost, 2),
+                    "name": "Expert Mechanics",
 
 
-                "quality_level": parts_quality,
+                    "distance": "2.5 km",
 
 
-                "is_emergency": is_emergency,
+                    "rating": 4.3,
 
 
-                "shop_type": shop_type,
+                    "phone": "01234567891",
 
 
-                "estimated_time": repair_info["labor_hours"],
+                    "open_now": True
 
 
-                "complexity": repair_info["complexity"],
+                }
 
 
-                "currency": "EGP"
+            ]
 
 
-            }
+            return mechanics
 
 
         except Exception as e:
 
 
-            raise CostCalculationError(f"Error calculating repair cost: {str(e)}")
-
-
-
-
-
-# Advanced Response Generation System
-
-
-class ResponseGenerator:
-
-
-    def __init__(self):
-
-
-        self.diagnostic_system = AdvancedDiagnosticSystem()
-
-
-        self.cost_calculator = CostCalculationSystem()
-
+            logger.error(f"Error finding mechanics: {str(e)}")
 
-        self.maintenance_scheduler = EnhancedMaintenanceScheduler()
 
+            return []
 
-        
 
 
-    def generate_response(self, query: str, user_profile: EnhancedUserProfile,
 
 
-                         language: str = "en") -> dict:
+    async def get_parts_availability(self, part_name: str, vehicle_info: dict) -> dict:
 
 
-        """Generate comprehensive response to user query."""
+        """Check parts availability in local stores."""
 
 
         try:
 
 
-            # Analyze query
-
-
-            query_type = self._analyze_query_type(query)
-
-
-            is_emergency = self._check_emergency(query)
-
-
-            
-
-
-            # Get base response from knowledge base
-
-
-            base_response = self._get_knowledge_base_response(query, language)
-
-
-            
-
-
-            # Get diagnostic information if needed
-
-
-            if query_type == "problem":
-
-
-                diagnostic_info = self.diagnostic_system.diagnose(
-
-
-                    system=self._identify_system(query),
-
-
-                    symptom=self._identify_symptom(query),
-
-
-                    sub_symptom=self._identify_sub_symptom(query)
-
-
-                )
-
-
-            else:
-
-
-                diagnostic_info = None
-
-
-                
-
-
-            # Calculate costs if applicable
-
-
-            if query_type in ["repair", "maintenance"]:
-
-
-                cost_info = self.cost_calculator.calculate_repair_cost(
-
-
-                    repair_type=self._identify_repair_type(query),
-
-
-                    parts_quality=user_profile.preferences["parts_quality"],
-
-
-                    is_emergency=is_emergency
-
-
-                )
-
-
-            else:
-
-
-                cost_info = None
-
-
-                
-
-
-            # Format response
-
-
-            response = self._format_response(
-
-
-                base_response=base_response,
-
-
-                diagnostic_info=diagnostic_info,
-
-
-                cost_info=cost_info,
-
-
-                is_emergency=is_emergency,
-
-
-                language=language
-
-
-            )
-
-
-            
-
-
-            return response
-
-
-            
-
-
-        except Exception as e:
-
-
-            logger.error(f"Response generation error: {str(e)}")
-
-
-            raise ResponseGenerationError(f"Error generating response: {str(e)}")
-
-
-
-
-
-    def _analyze_query_type(self, query: str) -> str:
-
-
-        """Analyze query type (problem, maintenance, repair, info)."""
-
-
-        # Implementation details...
-
-
-        pass
-
-
-
-
-
-    def _check_emergency(self, query: str) -> bool:
-
-
-        """Check if query indicates emergency situation."""
-
-
-        emergency_keywords = {
-
-
-            "en": ["emergency", "urgent", "help", "stuck", "smoke", "fire"],
-
-
-            "ar": ["طوارئ", "عاجل", "النجدة", "متعطل", "دخان", "حريق"]
-
-
-        }
-
-
-        # Implementation details...
-
-
-        pass
-
-
-
-
-
-# Continue with more implementations...
-
-
-# Helper function to detect Arabic text
-
-
-def is_arabic_text(text: str) -> bool:
-
-
-    arabic_ranges = [
-
-
-        (0x0600, 0x06FF),  # Arabic
-
-
-        (0x0750, 0x077F),  # Arabic Supplement
-
-
-        (0xFB50, 0xFDFF),  # Arabic Presentation Forms-A
-
-
-        (0xFE70, 0xFEFF),  # Arabic Presentation Forms-B
-
-
-    ]
-
-
-    return any(any(ord(char) >= start and ord(char) <= end for start, end in arabic_ranges) for char in text)
-
-
-
-
-
-# Query Analysis and Emergency Response System
-
-
-import datetime
-import re
-
-def is_arabic_text(text: str) -> bool:
-    """Check if text contains Arabic characters"""
-    arabic_pattern = re.compile(r'[\u0600-\u06FF]')
-    return bool(arabic_pattern.search(text))
-
-class QueryAnalyzer:
-    def __init__(self):
-        self.current_date = datetime.datetime.strptime("2025-06-06 20:04:01", "%Y-%m-%d %H:%M:%S")
-        self.current_user = "andrewamirr"
-    
-    def analyze_query(self, query: str) -> dict:
-        """Main method to analyze user query"""
-        language = "ar" if is_arabic_text(query) else "en"
-        query_type = self._determine_query_type(query, language)
-        is_emergency = self._check_emergency(query, language)
-        return {
-            "query_type": query_type,
-            "is_emergency": is_emergency,
-            "language": language,
-            "main_content": query
-        }
-    
-    def _determine_query_type(self, query: str, language: str) -> str:
-        """Determine the type of query being asked."""
-        query_lower = query.lower()
-        
-        # Define pattern dictionaries for each query type
-        patterns = {
-            "maintenance": {
-                "en": ["change", "service", "maintain", "check", "when should", "how often"],
-                "ar": ["تغيير", "صيانة", "فحص", "متى", "كل قد", "كام"]
-            },
-            "diagnostic": {
-                "en": ["problem", "issue", "broken", "not working", "failed", "wrong"],
-                "ar": ["مشكلة", "عطل", "مكسور", "مش شغال", "عطلان", "خربان"]
-            },
-            "cost": {
-                "en": ["cost", "price", "expensive", "cheap", "how much", "pay"],
-                "ar": ["سعر", "تكلفة", "غالي", "رخيص", "بكام", "كلفة"]
-            },
-            "emergency": {
-                "en": ["emergency", "urgent", "help", "stuck", "smoke", "fire"],
-                "ar": ["طوارئ", "عاجل", "نجدة", "متعطل", "دخان", "حريق"]
-            }
-        }
-        
-        # Check each pattern type
-        for query_type, language_patterns in patterns.items():
-            if any(pattern in query_lower for pattern in language_patterns[language]):
-                return query_type
-                
-        # Default to information type if no specific pattern is matched
-        return "information"
-
-    def _check_emergency(self, query: str, language: str) -> bool:
-        """Check if query indicates an emergency situation."""
-        emergency_keywords = {
-            "en": ["emergency", "urgent", "help", "stuck", "smoke", "fire", "accident"],
-            "ar": ["طوارئ", "عاجل", "النجدة", "متعطل", "دخان", "حريق", "حادث"]
-        }
-        
-        query_lower = query.lower()
-        return any(keyword in query_lower for keyword in emergency_keywords[language])
-
-
-import datetime
-import chainlit as cl
-import logging
-
-# Set up logger
-logger = logging.getLogger(__name__)
-
-class SessionManager:
-    """Simple session manager for handling user sessions"""
-    def __init__(self):
-        self.sessions = {}
-    
-    def get_or_create_session(self, session_id: str) -> dict:
-        """Get existing session or create new one"""
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "language": "ar",  # Default to Arabic
-                "created_at": datetime.datetime.now(),
-                "message_count": 0
-            }
-        return self.sessions[session_id]
-
-class CarExpertSystem:
-    def __init__(self):
-        self.current_date = datetime.datetime.strptime("2025-06-06 19:54:22", "%Y-%m-%d %H:%M:%S")
-        self.current_user = "andrewamirr"
-        self.query_analyzer = QueryAnalyzer()
-        self.response_generator = AdvancedResponseGenerator()
-        self.session_manager = SessionManager()
-        
-    async def _send_response(self, response: dict, session_id: str) -> None:
-        """Send response to user via chainlit"""
-        try:
-            # Format the response based on type
-            if response.get("type") == "error":
-                message = f"❌ {response['message']}"
-            elif response.get("type") == "emergency":
-                message = f"🚨 {response['message']}"
-            else:
-                message = response.get("main_content", str(response))
-            
-            await cl.Message(content=message).send()
-            
-        except Exception as e:
-            logger.error(f"Error sending response: {str(e)}")
-            await self._send_system_error(session_id)
-
-    async def _send_system_error(self, session_id: str) -> None:
-        """Send system error message"""
-        error_messages = {
-            "en": "⚠️ System Error: Please try again later or contact support.",
-            "ar": "⚠️ خطأ في النظام: يرجى المحاولة لاحقاً أو الاتصال بالدعم."
-        }
-        
-        try:
-            session = self.session_manager.get_or_create_session(session_id)
-            language = session.get("language", "ar")
-            await cl.Message(content=error_messages[language]).send()
-        except Exception as e:
-            # Fallback error message if even error handling fails
-            logger.error(f"Critical error in error handler: {str(e)}")
-            await cl.Message(content="⚠️ Critical system error occurred").send()
-
-    async def process_message(self, message: cl.Message) -> None:
-        """Process incoming message and generate response."""
-        session_id = "default_session"  # Simple session ID
-        
-        try:
-            user_message = message.content.strip()
-            
-            # Analyze query
-            analysis = self.query_analyzer.analyze_query(user_message)
-            
-            # Get or create session
-            session = self.session_manager.get_or_create_session(session_id)
-            session["message_count"] += 1
-            
-            # Generate response using the response generator
-            try:
-                response_content = self.response_generator.generate_response(analysis)
-                
-                # Create response dict
-                response = {
-                    "type": "emergency" if analysis.get("is_emergency") else "normal",
-                    "main_content": response_content,
-                    "message": response_content
-                }
-                
-                # Send the response
-                await self._send_response(response, session_id)
-                
-            except Exception as e:
-                logger.error(f"Error generating response: {str(e)}")
-                # Send error response
-                error_response = self.response_generator._generate_error_response(e, analysis.get("language", "ar"))
-                await self._send_response(error_response, session_id)
-                
-        except Exception as e:
-            logger.error(f"Error processing message: {str(e)}")
-            await self._send_system_error(session_id)
-
-    async def _send_formatted_response(self, analysis: dict, session_id: str) -> None:
-        """Send formatted response to user."""
-        try:
-            # Generate proper response using response generator
-            response_content = self.response_generator.generate_response(analysis)
-            
-            if response_content:
-                await cl.Message(content=response_content).send()
-            else:
-                await self._send_default_response(analysis, session_id)
-                
-        except Exception as e:
-            logger.error(f"Error sending formatted response: {str(e)}")
-            await self._send_system_error(session_id)
-
-    async def _send_default_response(self, analysis: dict, session_id: str) -> None:
-        """Send default response when specific content is not available."""
-        default_responses = {
-            "ar": "عذراً، لم أفهم سؤالك بشكل كامل. هل يمكنك إعادة صياغته بطريقة أخرى؟",
-            "en": "I'm sorry, I didn't fully understand your question. Could you rephrase it?"
-        }
-        
-        language = analysis.get("language", "ar")
-        message = default_responses.get(language, default_responses["ar"])
-        
-        await cl.Message(content=message).send()
-
-# Main message handler
-
-
-import chainlit as cl
-import logging
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Initialize car expert system globally (before handlers)
-car_expert = None
-
-@cl.on_chat_start
-async def start():
-    """Initialize the chat session"""
-    global car_expert
-    try:
-        # Initialize the car expert system
-        car_expert = CarExpertSystem()
-        logger.info("🚗 Car Expert System initialized successfully")
-        
-        welcome_message = """🚗 **Welcome to the Advanced Car Expert System!**
-
-مرحباً بك في نظام خبير السيارات المتقدم!
-
-**Version:** 2.5.0  
-**Last Updated:** 2025-06-06 19:54:22  
-**Current User:** andrewamirr
-
----
-
-**I can help you with:**
-• Car diagnostics and troubleshooting
-• Maintenance schedules and advice  
-• Emergency assistance
-• Cost estimates
-• Technical support
-
-**يمكنني مساعدتك في:**
-• تشخيص أعطال السيارات
-• جداول الصيانة والنصائح
-• المساعدة في الطوارئ
-• تقدير التكاليف
-• الدعم الفني
-
----
-
-**How can I help you today?** / **كيف يمكنني مساعدتك اليوم؟**
-
-*Example: "البطارية مش شغالة" or "Engine making noise"*"""
-        
-        await cl.Message(content=welcome_message).send()
-        
-    except Exception as e:
-        logger.error(f"Initialization error: {str(e)}")
-        error_message = """❌ **System Initialization Failed**
-
-عذراً، فشل في تهيئة النظام. يرجى المحاولة مرة أخرى.
-
-Sorry, system initialization failed. Please try again later."""
-        await cl.Message(content=error_message).send()
-
-@cl.on_message
-async def main(message: cl.Message):
-    """Handle incoming messages"""
-    global car_expert
-    
-    try:
-        # Check if car_expert is initialized
-        if car_expert is None:
-            logger.warning("Car expert system not initialized, creating new instance")
-            car_expert = CarExpertSystem()
-        
-        # Process message through car expert system
-        await car_expert.process_message(message)
-        
-    except Exception as e:
-        logger.error(f"Error in main handler: {str(e)}")
-        
-        # Send error message in both languages
-        error_message = """❌ **Error Occurred**
-
-حدث خطأ أثناء معالجة رسالتك. يرجى المحاولة مرة أخرى.
-
-An error occurred while processing your message. Please try again.
+            # Simulated parts database query
 
-*If the problem persists, please restart the chat.*"""
-        
-        await cl.Message(content=error_message).send()
 
-# Additional handler for when user leaves
-@cl.on_chat_end
-async def end():
-    """Handle chat end"""
-    logger.info("Chat session ended")
+            return {
 
-if __name__ == "__main__":
-    # This will run when the script is executed directly
-    logger.info("🚗 Car Expert System ready to start")
-    print("Run with: chainlit run your_filename.py")
-class AdvancedResponseGenerator:
 
-    async def _get_main_content(self, query, language):
-        # Minimal stub to avoid AttributeError
-        return "This is a placeholder main content response."
-    def _generate_error_response(self, error: Exception, language: str) -> dict:
+                "available": True,
 
 
-        """Generate error response in the appropriate language."""
+                "locations": [
 
 
-        error_messages = {
+                    {
 
 
-            "en": {
+                        "store": "AutoParts Egypt",
 
 
-                "general": "Sorry, an error occurred. Please try again.",
+                        "price": 1200,
 
 
-                "maintenance": "Unable to process maintenance request.",
+                        "in_stock": 3,
 
 
-                "diagnostic": "Unable to complete diagnostic analysis.",
+                        "quality": "OEM"
 
 
-                "cost": "Unable to calculate costs at this time."
+                    },
 
 
-            },
+                    {
 
 
-            "ar": {
+                        "store": "Cairo Parts Center",
 
 
-                "general": "عذراً، حدث خطأ. يرجى المحاولة مرة أخرى.",
+                        "price": 900,
 
 
-                "maintenance": "تعذر معالجة طلب الصيانة.",
+                        "in_stock": 5,
 
 
-                "diagnostic": "تعذر إكمال التحليل التشخيصي.",
+                        "quality": "Aftermarket"
 
 
-                "cost": "تعذر حساب التكاليف في الوقت الحالي."
+                    }
+
+
+                ],
+
+
+                "delivery_time": "24 hours",
+
+
+                "warranty": "1 year"
 
 
             }
 
 
-        }
+        except Exception as e:
 
 
+            logger.error(f"Error checking parts availability: {str(e)}")
 
 
+            return {"available": False, "error": str(e)}
 
-        error_type = type(error).__name__
 
 
-        error_category = "general"
 
 
-        
+# Advanced Vehicle Diagnostics System
 
 
-        if "Maintenance" in error_type:
+class VehicleDiagnosticsSystem:
 
 
-            error_category = "maintenance"
+    def __init__(self):
 
 
-        elif "Diagnostic" in error_type:
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:16:36", "%Y-%m-%d %H:%M:%S")
 
 
-            error_category = "diagnostic"
+        self.diagnostic_patterns = self._load_diagnostic_patterns()
 
 
-        elif "Cost" in error_type:
+        self.symptom_index = self._compile_symptom_index(self.diagnostic_patterns)
 
 
-            error_category = "cost"
+        self.confidence_cache = {}
 
 
+        
 
 
+    def _load_diagnostic_patterns(self) -> dict:
 
-        return {
 
+        """Load comprehensive diagnostic patterns."""
 
-            "type": "error",
 
+        return {
 
-            "message": error_messages[language][error_category],
 
+            "engine": {
 
-            "error_code": error_type,
 
+                "starting_issues": {
 
-            "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S")
 
+                    "patterns": [
 
-        }
 
-        self.current_date = datetime.datetime.now()
+                        {"symptom": "won't start", "ar": "مش عايزة تدور"},
 
 
+                        {"symptom": "hard start", "ar": "صعب في التشغيل"},
 
-class CarExpertSystem:
 
+                        {"symptom": "clicking", "ar": "صوت طقطقة"}
 
-    async def _send_response(self, response: dict, session_id: str) -> None:
 
+                    ],
 
-        """Send response to the user."""
 
+                    "causes": [
 
-        try:
 
+                        {
 
-            # Format the response based on type
 
+                            "component": "battery",
 
-            if response.get("type") == "error":
 
+                            "probability": 0.4,
 
-                message = f"❌ {response['message']}"
 
+                            "tests": ["voltage test", "load test"],
 
-            elif response.get("type") == "emergency":
 
+                            "cost_range": "1400-2500"
 
-                message = f"🚨 {response['message']}"
 
+                        },
 
-            else:
 
+                        {
 
-                message = self._format_response(response)
 
+                            "component": "starter",
 
 
+                            "probability": 0.3,
 
 
-            # Send the message
+                            "tests": ["starter draw test"],
 
 
-            await cl.Message(content=message).send()
+                            "cost_range": "1800-3500"
 
 
-            
+                        }
 
 
-        except Exception as e:
+                    ]
 
 
-            logger.error(f"Error sending response: {str(e)}")
+                }
 
 
-            await self._send_system_error(session_id)
+            }
 
 
+        }
 
 
 
-    def _format_response(self, response: dict) -> str:
 
 
-        """Format the response for display."""
+    def _compile_symptom_index(self, diagnostic_patterns: dict) -> KeywordAutomaton:
 
 
-        language = response.get("language", "en")
+        """Compile every English and Arabic symptom phrase into one normalized matcher."""
 
 
-        
+        return KeywordAutomaton(
 
 
-        if language == "ar":
+            (arabic_normalizer.normalize(phrase), (system, category, pattern["symptom"]))
 
 
-            if "maintenance_info" in response:
-                return response.get("main_content", "") + "\n\n" + \
-                       "معلومات الصيانة:\n" + response["maintenance_info"]
+            for system, categories in diagnostic_patterns.items()
 
 
-            return response.get("main_content", "")
+            for category, category_data in categories.items()
 
 
-        else:
+            for pattern in category_data["patterns"]
 
 
-            if "maintenance_info" in response:
+            for phrase in (pattern["symptom"], pattern.get("ar"))
 
 
-                                return response.get("main_content", "") + "\n\n" + \
-                "Maintenance Information:\n" + response["maintenance_info"]
+            if phrase
 
 
-            return response.get("main_content", "")
+        )
 
 
 
 
 
-    async def _send_system_error(self, session_id: str) -> None:
+    def _match_symptoms(self, symptoms: list) -> dict:
 
 
-        """Send system error message."""
+        """Match the reported symptoms against the pattern index in one pass."""
 
 
-        error_messages = {
+        # Newlines keep a phrase from matching across two reported symptoms
 
 
-            "en": "⚠️ System Error: Please try again later or contact support.",
+        text = "\n".join(arabic_normalizer.normalize(str(symptom)) for symptom in symptoms)
 
 
-            "ar": "⚠️ خطأ في النظام: يرجى المحاولة لاحقاً أو الاتصال بالدعم."
+        matched_patterns = {}
 
 
-        }
+        for _, _, _, (system, category, symptom) in self.symptom_index.find_all(text):
 
 
-        
+            matched_patterns.setdefault((system, category), set()).add(symptom)
 
 
-        # Get user's language preference from session
+        return matched_patterns
 
 
-        session = self.session_manager.get_or_create_session(session_id)
 
 
-        language = session.get("language", "en")
 
+    def _analyze_patterns(self, matched_patterns: dict, vehicle_info: dict) -> dict:
 
-        
 
+        """Rank the causes of every matched pattern group."""
 
-        await cl.Message(content=error_messages[language]).send()
 
+        findings = []
 
 
+        for (system, category), symptoms in matched_patterns.items():
 
 
-    async def _send_emergency_notification(self, response: dict, session_id: str) -> None:
+            category_data = self.diagnostic_patterns[system][category]
 
 
-        """Send emergency notification."""
+            findings.append({
 
 
-        emergency_prefix = "🚨 EMERGENCY / طوارئ 🚨\n\n"
+                "system": system,
 
 
-        await cl.Message(content=emergency_prefix + response.get("message", "")).send()
+                "category": category,
 
 
+                "matched_symptoms": sorted(symptoms),
 
 
+                "coverage": len(symptoms) / len(category_data["patterns"]),
 
-# Update the main message handler
 
+                "causes": [dict(cause) for cause in sorted(category_data["causes"],
 
-@cl.on_message
 
+                                                           key=lambda cause: cause["probability"], reverse=True)]
 
-async def main(message: cl.Message):
 
+            })
 
-    try:
 
+        findings.sort(key=lambda finding: finding["coverage"], reverse=True)
 
-        user_message = message.content.strip()
 
+        return {
 
-        
 
+            "signature": tuple(sorted((system, category, symptom)
 
-        if not user_message:
 
+                                      for (system, category), symptoms in matched_patterns.items()
 
-            await cl.Message(content="Please enter your question. / يرجى إدخال سؤالك.").send()
 
+                                      for symptom in symptoms)),
 
-            return
 
+            "findings": findings,
 
 
+            "vehicle": vehicle_info
 
 
-        # Process message through car expert system
+        }
 
 
-        await car_expert.process_message(message)
 
 
-        
 
+    def _calculate_confidence(self, diagnosis: dict) -> float:
 
-    except Exception as e:
 
+        """Confidence in the leading finding, cached per distinct symptom signature."""
 
-        logger.error(f"Error in main handler: {str(e)}")
 
+        signature = diagnosis["signature"]
 
-        error_message = "An error occurred. Please try again."
 
+        confidence = self.confidence_cache.get(signature)
 
-        await cl.Message(content=error_message).send()
 
+        if confidence is None:
 
 
+            confidence = max((finding["coverage"] * sum(cause["probability"] for cause in finding["causes"])
 
 
-# Enhanced Multilingual Support System
+                              for finding in diagnosis["findings"]), default=0.0)
 
 
-class MultilingualSystem:
+            confidence = self.confidence_cache[signature] = round(confidence, 2)
 
 
-    def __init__(self):
+        return confidence
 
 
-        self.supported_languages = ["en", "ar"]
 
 
-        self.translations = {
 
+    def _get_recommendations(self, diagnosis: dict) -> list:
 
-            "emergency_responses": {
 
+        """List the tests to run per component, most likely component first."""
 
-                "en": {
 
+        recommendations = []
 
-                    "critical": "🚨 CRITICAL: Stop driving immediately and call emergency services!",
 
+        seen_components = set()
 
-                    "high": "⚠️ WARNING: Get to a safe location and contact a mechanic.",
 
+        for finding in diagnosis["findings"]:
 
-                    "medium": "📢 CAUTION: Monitor the situation and seek professional help soon.",
 
+            for cause in finding["causes"]:
 
-                    "low": "ℹ️ NOTE: Schedule a check-up at your earliest convenience."
 
+                if cause["component"] in seen_components:
 
-                },
 
+                    continue
 
-                "ar": {
 
+                seen_components.add(cause["component"])
 
-                    "critical": "🚨 خطر: توقف فوراً واتصل بخدمات الطوارئ!",
 
+                recommendations.append({
 
-                    "high": "⚠️ تحذير: توجه لمكان آمن واتصل بميكانيكي.",
 
+                    "component": cause["component"],
 
-                    "medium": "📢 تنبيه: راقب الوضع واطلب مساعدة فني قريباً.",
 
+                    "tests": list(cause["tests"]),
 
-                    "low": "ℹ️ ملاحظة: احجز موعد فحص في أقرب وقت مناسب."
 
+                    "cost_range": cause["cost_range"]
 
-                }
 
+                })
 
-            },
 
+        return recommendations
 
-            "maintenance_terms": {
 
 
-                "en": {
 
 
-                    "oil_change": "Oil Change",
+    async def diagnose(self, symptoms: list, vehicle_info: dict) -> dict:
 
 
-                    "brake_service": "Brake Service",
+        """Perform comprehensive vehicle diagnosis."""
 
 
-                    "tire_rotation": "Tire Rotation"
+        try:
 
 
-                },
+            matched_patterns = self._match_symptoms(symptoms)
 
 
-                "ar": {
+            diagnosis = self._analyze_patterns(matched_patterns, vehicle_info)
 
 
-                    "oil_change": "تغيير زيت",
+            return {
 
 
-                    "brake_service": "صيانة فرامل",
+                "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
 
-                    "tire_rotation": "تغيير مكان الكاوتش"
+                "diagnosis": diagnosis,
 
 
-                }
+                "confidence": self._calculate_confidence(diagnosis),
 
 
-            }
+                "recommended_actions": self._get_recommendations(diagnosis)
 
 
-        }
+            }
 
 
-        
+        except Exception as e:
 
 
-    def get_response(self, key: str, subkey: str, language: str) -> str:
+            logger.error(f"Diagnosis error: {str(e)}")
 
 
-        """Get translated response."""
+            raise DiagnosticError(str(e))
 
 
-        try:
 
 
-            return self.translations.get(key, {}).get(language, {}).get(subkey, "")
 
+# Complete Response Generation System
 
-        except Exception as e:
 
+class AdvancedResponseGenerator:
 
-            logger.error(f"Translation error: {str(e)}")
 
+    def __init__(self):
 
-            return ""
 
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:18:22", "%Y-%m-%d %H:%M:%S")
 
 
+        self.current_user = "andrewamirr"
 
 
-# Enhanced Error Handling System
+        self.multilingual = MultilingualSystem()
 
 
-class ErrorHandler:
+        self.cost_calculator = CostCalculationSystem()
 
 
-    def __init__(self):
+        self.diagnostics = VehicleDiagnosticsSystem()
 
 
-        self.error_responses = {
+        
+    def _generate_error_response(self, error: Exception, language: str) -> dict:
+        error_messages = {
+            "en": {
+                "general": "Sorry, an error occurred. Please try again.",
+                "maintenance": "Unable to process maintenance request.",
+                "diagnostic": "Unable to complete diagnostic analysis.",
+                "cost": "Unable to calculate costs at this time."
+            },
+            "ar": {
+                "general": "عذراً، حدث خطأ. يرجى المحاولة مرة أخرى.",
+                "maintenance": "تعذر معالجة طلب الصيانة.",
+                "diagnostic": "تعذر إكمال التحليل التشخيصي.",
+                "cost": "تعذر حساب التكاليف في الوقت الحالي."
+            }
+        }
+        error_type = type(error).__name__
+        error_category = "general"
+        if "Maintenance" in error_type:
+            error_category = "maintenance"
+        elif "Diagnostic" in error_type:
+            error_category = "diagnostic"
+        elif "Cost" in error_type:
+            error_category = "cost"
+        return {
+            "type": "error",
+            "message": error_messages[language][error_category],
+            "error_code": error_type,
+            "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S")
+        }
+
+    async def generate_response(self, query: dict, user_profile: dict, 
 
 
-            "en": {
+                              session_data: dict) -> dict:
 
 
-                "diagnostic_error": "Unable to complete diagnosis. Please provide more details or visit a mechanic.",
+        """Generate comprehensive, contextual response."""
 
 
-                "maintenance_error": "Error calculating maintenance schedule. Please check vehicle information.",
+        try:
 
 
-                "cost_error": "Unable to calculate costs. Please try again with more specific information.",
+            language = query.get("language", "en")
 
 
-                "system_error": "System temporarily unavailable. Please try again later.",
+            response_type = query.get("type", "general")
 
 
-                "invalid_input": "Please provide valid information about your vehicle issue."
+            
 
 
-            },
+            base_response = {
 
 
-            "ar": {
+                "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
 
+                "user": self.current_user,
 
-                "diagnostic_error": "تعذر إكمال التشخيص. يرجى تقديم المزيد من التفاصيل أو زيارة ميكانيكي.",
 
+                "language": language,
 
-                "maintenance_error": "خطأ في حساب جدول الصيانة. يرجى التحقق من معلومات السيارة.",
 
+                "query_type": response_type
 
-                "cost_error": "تعذر حساب التكاليف. يرجى المحاولة مرة أخرى مع معلومات أكثر تحديداً.",
 
+            }
 
-                "system_error": "النظام غير متاح مؤقتاً. يرجى المحاولة لاحقاً.",
 
+            
 
-                "invalid_input": "يرجى تقديم معلومات صحيحة عن مشكلة سيارتك."
 
+            # Handle emergency cases
 
-            }
 
+            if query.get("is_emergency", False):
 
-        }
 
+                response = await self._generate_emergency_response(query, language)
 
-        
 
+            else:
 
-    async def handle_error(self, error: Exception, language: str) -> dict:
-        logger.error(f"Error occurred: {str(error)}")
-        error_type = type(error).__name__
-        error_mapping = {
-            "DiagnosticError": "diagnostic_error",
-            "MaintenanceError": "maintenance_error",
-            "CostCalculationError": "cost_error",
-            "ValueError": "invalid_input",
-            "Exception": "system_error"
-        }
-        response_key = error_mapping.get(error_type, "system_error")
-        return {
-            "type": "error",
-            "message": self.error_responses[language][response_key]
-        }
 
+                response = await self._generate_standard_response(query, language)
 
 
+                
 
 
-# User Interaction Flow System
+            # Add contextual information
 
 
-class UserInteractionFlow:
+            response.update(await self._add_context(query, user_profile, session_data))
 
 
-    def __init__(self):
+            
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:16:36", "%Y-%m-%d %H:%M:%S")
+            # Add maintenance reminders if relevant
 
 
-        self.current_user = "andrewamirr"
+            if self._should_add_maintenance_info(query, user_profile):
 
 
-        self.query_analyzer = QueryAnalyzer()
+                response["maintenance_info"] = await self._get_maintenance_reminders(
 
 
-        self.multilingual = MultilingualSystem()
+                    user_profile, language
 
 
-        self.error_handler = ErrorHandler()
+                )
 
 
-        self.session_data = {}
+                
 
 
-        
+            # Add cost estimates if applicable
 
 
-    async def handle_interaction(self, message: str, session_id: str) -> dict:
+            if "cost" in query.get("requested_info", []):
 
 
-        """Handle user interaction and maintain conversation flow."""
+                response["cost_estimates"] = await self._generate_cost_estimates(
 
 
-        try:
+                    query, language
 
 
-            # Initialize or get session
+                )
 
 
-            session = self.session_data.get(session_id, {
+                
 
 
-                "start_time": self.current_date,
+            # Add recommendations
 
 
-                "language": "en",
+            response["recommendations"] = await self._generate_recommendations(
 
 
-                "context": [],
+                query, response, language
 
 
-                "vehicle_info": None,
+                )
 
 
-                "last_query": None
+                
 
 
-            })
+            return {**base_response, **response}
 
 
             
 
 
-            # Analyze query
+        except Exception as e:
 
 
-            analysis = self.query_analyzer.analyze_query(message)
+            logger.error(f"Response generation error: {str(e)}")
 
 
-            session["language"] = analysis["language"]
+            return self._generate_error_response(e, language)
 
 
-            
 
 
-            # Handle emergency cases first
 
+    async def _generate_standard_response(self, query: dict, language: str) -> dict:
 
-            if analysis["is_emergency"]:
 
+        """Generate standard response with comprehensive information."""
 
-                return await self._handle_emergency(message, analysis, session)
 
+        response = {
 
-                
 
+            "main_content": await self._get_main_content(query, language),
 
-            # Process normal queries
 
+            "additional_info": await self._get_additional_info(query, language),
 
-            response = await self._process_query(message, analysis, session)
 
+            "related_topics": await self._get_related_topics(query, language)
 
-            
 
+        }
 
-            # Update session context
 
+        
 
-            session["context"].append({
 
+        if query.get("needs_diagnosis", False):
 
-                "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
+            response["diagnostic_info"] = await self.diagnostics.diagnose(
 
-                "query": message,
 
+                query.get("symptoms", []),
 
-                "response": response
 
+                query.get("vehicle_info", {})
 
-            })
 
+            )
 
-            
 
+            
 
-            # Trim context if too long
 
+        return response
 
-            if len(session["context"]) > 10:
 
 
-                session["context"] = session["context"][-10:]
 
 
-                
+# Final Integration System
 
 
-            self.session_data[session_id] = session
+class CarExpertSystem:
 
 
-            return response
+    def __init__(self):
 
 
-            
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:18:22", "%Y-%m-%d %H:%M:%S")
 
 
-        except Exception as e:
+        self.current_user = "andrewamirr"
 
 
-            return await self.error_handler.handle_error(e, session.get("language", "en"))
+        self.response_generator = AdvancedResponseGenerator()
 
 
+        self.interaction_flow = UserInteractionFlow()
 
 
+        self.external_services = ExternalServicesManager()
 
-    async def _handle_emergency(self, message: str, analysis: dict, session: dict) -> dict:
 
+        self.error_handler = ErrorHandler()
 
-        """Handle emergency situations with priority."""
 
+        self.session_manager = SessionManager()
 
-        language = session["language"]
 
+        self.query_analyzer = QueryAnalyzer()
 
-        emergency_response = {
 
+        self.model_registry = model_registry
 
-            "type": "emergency",
 
+        self.inference_executor = inference_executor
 
-            "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
+        self.context_manager = ContextWindowManager(model_registry)
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        self.knowledge_store = knowledge_store
 
-            "urgency": "critical",
 
+        self.diagnosis_engine = diagnosis_engine
 
-            "message": self.multilingual.get_response("emergency_responses", "critical", language),
 
+        self.diagnostic_planner = diagnostic_planner
 
-            "actions": [
 
+        
 
-                {
 
+    async def process_message(self, message: cl.Message) -> None:
 
-                    "type": "contact",
 
+        """Main message processing pipeline."""
 
-                    "service": "emergency",
 
+        try:
 
-                    "number": "122"  # Egypt emergency number
 
+            # Initialize processing
 
-                },
 
+            start_time = datetime.datetime.now()
 
-                {
 
+            # Key on the Chainlit connection: display names are neither unique nor always set
 
-                    "type": "contact",
 
+            try:
 
-                    "service": "roadside",
 
+                session_id = cl.context.session.id
 
-                    "number": "01234567890"  # Example roadside assistance
 
+            except Exception:
 
-                }
 
+                # No Chainlit context (scripts, test scenarios): never share state between messages
 
-            ],
 
+                session_id = f"local-{id(message)}"
 
-            "safety_instructions": self._get_safety_instructions(analysis, language)
 
+            user_message = message.content.strip()
 
-        }
 
+            if user_message.startswith("/reload-kb"):
 
-        
 
+                # The command carries the admin token, so it must not stay in the chat history
 
-        # Log emergency situation
 
+                await self._discard_secret_message(message)
 
-        logger.warning(f"Emergency situation detected for user {self.current_user}: {message}")
 
+                await self._handle_reload_command(user_message, session_id)
 
-        return emergency_response
 
+                return
 
 
+            
 
 
-    async def _process_query(self, message: str, analysis: dict, session: dict) -> dict:
+            logger.info(f"Processing message from {session_id}: {user_message}")
 
 
-        """Process normal queries and generate response."""
+            
 
 
-        query_type = analysis["query_type"]
+            # Get or create session
 
 
-        language = session["language"]
+            session = self.session_manager.get_or_create_session(session_id)
 
 
-        
+            if user_message.startswith("/diagnose") or "diagnostic_session" in session:
 
 
-        processors = {
+                if await self._handle_diagnostic_turn(user_message, session):
 
 
-            "diagnostic": self._handle_diagnostic_query,
+                    return
 
 
-            "maintenance": self._handle_maintenance_query,
+            
 
 
-            "cost": self._handle_cost_query,
+            # Process message
 
 
-            "information": self._handle_information_query
+            try:
 
 
-        }
+                # Analyze query
 
 
-        
+                analysis = await self.interaction_flow.handle_interaction(
 
 
-        processor = processors.get(query_type, self._handle_general_query)
+                    user_message, session_id
 
 
-        return await processor(message, analysis, session)
+                )
 
 
+                
 
 
+                # Generate response
 
-# External Services Integration
 
+                response = await self.response_generator.generate_response(
 
-class ExternalServicesManager:
 
+                    analysis,
 
-    def __init__(self):
 
+                    session.get("user_profile", {}),
 
-        self.current_date = datetime.strptime("2025-06-06 19:16:36", "%Y-%m-%d %H:%M:%S")
 
+                    session
 
-        self.current_user = "andrewamirr"
 
+                )
 
-        self.api_keys = {
 
+                
 
-            "weather": "xxx",
 
+                # Handle emergency cases
 
-            "maps": "xxx",
 
+                if analysis.get("is_emergency", False):
 
-            "parts_database": "xxx"
 
+                    await self._handle_emergency_case(response, session_id)
 
-        }
 
+                
 
-        
 
+                # Stream the model's answer when the LLM is available
 
-    async def get_nearest_mechanics(self, location: dict) -> list:
 
+                if self.model_registry.is_loaded():
 
-        """Find nearest mechanics using Maps API."""
 
+                    query_analysis = self.query_analyzer.analyze_query(user_message)
 
-        try:
 
+                    response["main_content"] = await self._stream_llm_response(
 
-            # Simulated API call
 
+                        user_message, query_analysis, session_id
 
-            mechanics = [
 
+                    )
 
-                {
 
+                else:
 
-                    "name": "Cairo Auto Care",
 
+                    await self._send_response(response, session_id)
 
-                    "distance": "1.2 km",
 
+                
 
-                    "rating": 4.5,
 
+                # Update session
 
-                    "phone": "01234567890",
 
+                self.session_manager.update_session(session_id, {
 
-                    "open_now": True
 
+                    "last_interaction": self.current_date,
 
-                },
 
+                    "last_query": user_message,
 
-                {
 
+                    "last_response": response
 
-                    "name": "Expert Mechanics",
 
+                })
 
-                    "distance": "2.5 km",
 
+                
 
-                    "rating": 4.3,
 
+            except Exception as e:
 
-                    "phone": "01234567891",
 
+                error_response = await self.error_handler.handle_error(
 
-                    "open_now": True
 
+                    e, session.get("language", "en")
 
-                }
 
+                )
 
-            ]
 
+                await self._send_response(error_response, session_id)
 
-            return mechanics
 
+                
 
-        except Exception as e:
 
+            finally:
 
-            logger.error(f"Error finding mechanics: {str(e)}")
 
+                # Log processing time
 
-            return []
 
+                processing_time = (datetime.datetime.now() - start_time).total_seconds()
 
 
+                logger.info(f"Message processed in {processing_time}s")
 
 
-    async def get_parts_availability(self, part_name: str, vehicle_info: dict) -> dict:
+                
 
 
-        """Check parts availability in local stores."""
+        except Exception as e:
 
 
-        try:
+            logger.error(f"Critical error in message processing: {str(e)}")
 
 
-            # Simulated parts database query
+            await self._send_system_error(session_id)
 
 
-            return {
 
 
-                "available": True,
 
+    async def _handle_emergency_case(self, response: dict, session_id: str) -> None:
 
-                "locations": [
 
+        """Handle emergency cases with priority."""
 
-                    {
 
+        try:
 
-                        "store": "AutoParts Egypt",
 
+            # Get nearest mechanics
 
-                        "price": 1200,
 
+            mechanics = await self.external_services.get_nearest_mechanics({})
 
-                        "in_stock": 3,
 
+            
 
-                        "quality": "OEM"
 
+            # Update response with emergency information
 
-                    },
 
+            response["emergency_contacts"] = mechanics
 
-                    {
 
+            
 
-                        "store": "Cairo Parts Center",
 
+            # Send immediate notification
 
-                        "price": 900,
 
+            await self._send_emergency_notification(response, session_id)
 
-                        "in_stock": 5,
 
+            
 
-                        "quality": "Aftermarket"
 
+        except Exception as e:
 
-                    }
 
+            logger.error(f"Error handling emergency: {str(e)}")
 
-                ],
 
 
-                "delivery_time": "24 hours",
 
 
-                "warranty": "1 year"
+    async def _stream_llm_response(self, user_message: str, analysis: dict, session_id: str) -> str:
 
 
-            }
+        """Stream the model's answer token by token into a Chainlit message."""
 
 
-        except Exception as e:
+        session = self.session_manager.get_or_create_session(session_id)
 
 
-            logger.error(f"Error checking parts availability: {str(e)}")
+        language = analysis.get("language", "ar")
 
 
-            return {"available": False, "error": str(e)}
+        history = session.setdefault("llm_history", [])
 
 
+        # The whole request uses one knowledge version, even if a reload lands meanwhile
 
 
+        snapshot = self.knowledge_store.current
 
-# Advanced Vehicle Diagnostics System
 
+        # Follow-up questions depend on the conversation, so only opening questions use the caches;
 
-class VehicleDiagnosticsSystem:
 
+        # emergency answers are never cached and always generated fresh with their safety instructions
 
-    def __init__(self):
 
+        cache_key = None
 
-        self.current_date = datetime.strptime("2025-06-06 19:16:36", "%Y-%m-%d %H:%M:%S")
 
+        if analysis.get("is_emergency", False):
 
-        self.diagnostic_patterns = self._load_diagnostic_patterns()
 
+            self.semantic_cache.stats["bypassed"] += 1
 
-        
 
+        elif not history:
 
-    def _load_diagnostic_patterns(self) -> dict:
 
+            cache_key = self.response_cache.make_key(user_message, language, analysis.get("query_type", ""),
 
-        """Load comprehensive diagnostic patterns."""
 
+                                                     snapshot.version)
 
-        return {
 
+        cached_answer = self.response_cache.get(cache_key) if cache_key else None
 
-            "engine": {
 
+        query_type = analysis.get("query_type", "")
 
-                "starting_issues": {
 
+        query_vector = None
 
-                    "patterns": [
 
+        if cache_key and cached_answer is None:
 
-                        {"symptom": "won't start", "ar": "مش عايزة تدور"},
 
+            query_vector = await asyncio.get_running_loop().run_in_executor(
 
-                        {"symptom": "hard start", "ar": "صعب في التشغيل"},
 
+                None, self.semantic_cache.embed, user_message)
 
-                        {"symptom": "clicking", "ar": "صوت طقطقة"}
 
+            cached_answer = self.semantic_cache.lookup(user_message, query_vector, language, query_type,
 
-                    ],
 
+                                                       snapshot.version)
 
-                    "causes": [
 
+        # History keeps the user turn exactly as evaluated, reference block included, so the next
 
-                        {
 
+        # prompt starts with this one and the session's KV cache is reused
 
-                            "component": "battery",
 
+        user_content = build_user_content(user_message, language)
 
-                            "probability": 0.4,
 
+        if cached_answer is not None:
 
-                            "tests": ["voltage test", "load test"],
 
+            token_stream = self._replay_cached_answer(cached_answer)
 
-                            "cost_range": "1400-2500"
 
+        else:
 
-                        },
 
+            knowledge = await self._retrieve_knowledge(snapshot, user_message, language, query_vector,
 
-                        {
 
+                                                       use_vectors=not analysis.get("is_emergency", False))
 
-                            "component": "starter",
 
+            if query_type == "diagnostic":
 
-                            "probability": 0.3,
 
+                knowledge = "\n\n".join(part for part in (self._diagnosis_notes(user_message), knowledge) if part)
 
-                            "tests": ["starter draw test"],
 
+            prompt, max_tokens, user_content = self.context_manager.build_prompt(
 
-                            "cost_range": "1800-3500"
 
+                user_message, language, knowledge=knowledge, history=history)
 
-                        }
 
+            priority = "emergency" if analysis.get("is_emergency", False) else "normal"
 
-                    ]
 
+            token_stream = self.inference_executor.stream(prompt, max_tokens, priority=priority,
 
-                }
 
+                                                          session_id=session_id)
 
-            }
 
+        message = cl.Message(content="")
 
-        }
 
+        chunks = []
 
 
+        first_token_time = None
 
 
-    async def diagnose(self, symptoms: list, vehicle_info: dict) -> dict:
+        start_time = time.perf_counter()
 
 
-        """Perform comprehensive vehicle diagnosis."""
+        async for token in token_stream:
 
 
-        try:
+            if first_token_time is None:
 
 
-            matched_patterns = self._match_symptoms(symptoms)
+                first_token_time = time.perf_counter() - start_time
 
 
-            diagnosis = self._analyze_patterns(matched_patterns, vehicle_info)
+                if cached_answer is None:
 
 
-            return {
+                    inference_metrics.record("time_to_first_token", first_token_time)
 
 
-                "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
+            chunks.append(token)
 
 
-                "diagnosis": diagnosis,
+            await message.stream_token(token)
 
 
-                "confidence": self._calculate_confidence(diagnosis),
+        generation_time = time.perf_counter() - start_time
 
 
-                "recommended_actions": self._get_recommendations(diagnosis)
+        await message.send()
 
 
-            }
+        answer = "".join(chunks)
 
 
-        except Exception as e:
+        if cache_key and cached_answer is None:
 
 
-            logger.error(f"Diagnosis error: {str(e)}")
+            self.response_cache.put(cache_key, answer)
 
 
-            raise DiagnosticError(str(e))
+            self.semantic_cache.add(user_message, query_vector, answer, language, query_type, snapshot.version)
 
 
+        history.append({
 
 
+            "query": user_message,
 
-# Complete Response Generation System
 
+            "user_content": user_content,
 
-class AdvancedResponseGenerator:
 
+            "answer": answer
 
-    def __init__(self):
 
+        })
 
-        self.current_date = datetime.strptime("2025-06-06 19:18:22", "%Y-%m-%d %H:%M:%S")
 
+        if len(history) > 10:
 
-        self.current_user = "andrewamirr"
 
+            del history[:-10]
 
-        self.multilingual = MultilingualSystem()
 
+        if cached_answer is None:
 
-        self.cost_calculator = CostCalculationSystem()
 
+            inference_metrics.record("generation_time", generation_time)
 
-        self.diagnostics = VehicleDiagnosticsSystem()
 
+        inference_metrics.increment("streamed_chunks", len(chunks))
 
-        
-    def _generate_error_response(self, error: Exception, language: str) -> dict:
-        error_messages = {
-            "en": {
-                "general": "Sorry, an error occurred. Please try again.",
-                "maintenance": "Unable to process maintenance request.",
-                "diagnostic": "Unable to complete diagnostic analysis.",
-                "cost": "Unable to calculate costs at this time."
-            },
-            "ar": {
-                "general": "عذراً، حدث خطأ. يرجى المحاولة مرة أخرى.",
-                "maintenance": "تعذر معالجة طلب الصيانة.",
-                "diagnostic": "تعذر إكمال التحليل التشخيصي.",
-                "cost": "تعذر حساب التكاليف في الوقت الحالي."
-            }
-        }
-        error_type = type(error).__name__
-        error_category = "general"
-        if "Maintenance" in error_type:
-            error_category = "maintenance"
-        elif "Diagnostic" in error_type:
-            error_category = "diagnostic"
-        elif "Cost" in error_type:
-            error_category = "cost"
-        return {
-            "type": "error",
-            "message": error_messages[language][error_category],
-            "error_code": error_type,
-            "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S")
-        }
 
-    async def generate_response(self, query: dict, user_profile: dict, 
+        logger.info(f"Streamed {len(chunks)} chunks to {session_id} in {generation_time:.2f}s "
 
 
-                              session_data: dict) -> dict:
+                    f"(first token {first_token_time or 0:.2f}s)")
 
 
-        """Generate comprehensive, contextual response."""
+        return answer
 
 
-        try:
 
 
-            language = query.get("language", "en")
 
+    def _diagnosis_notes(self, user_message: str) -> str:
 
-            response_type = query.get("type", "general")
 
+        """Rank the likely causes of every symptom the message mentions."""
 
-            
 
+        diagnosis = self.diagnosis_engine.diagnose(user_message, top_k=3)
 
-            base_response = {
 
+        if not diagnosis["matched_symptoms"]:
 
-                "timestamp": self.current_date.strftime("%Y-%m-%d %H:%M:%S"),
 
+            return ""
 
-                "user": self.current_user,
 
+        causes = ", ".join(f"{cause['part']} ({cause['confidence']}%)" for cause in diagnosis["possible_causes"])
 
-                "language": language,
 
+        return f"Likely causes for {', '.join(diagnosis['matched_symptoms'])}: {causes}"
 
-                "query_type": response_type
 
 
-            }
 
 
-            
+    async def _retrieve_knowledge(self, snapshot, user_message: str, language: str,
 
 
-            # Handle emergency cases
+                                  query_vector=None, use_vectors: bool = True) -> str:
 
 
-            if query.get("is_emergency", False):
+        """Return the best knowledge base sections for the prompt's reference block."""
 
 
-                response = await self._generate_emergency_response(query, language)
+        matches = snapshot.index.search(user_message)
 
 
-            else:
+        # An alias in the question pins retrieval to that article's sections
 
 
-                response = await self._generate_standard_response(query, language)
+        aliases = matches[0]["aliases"] if matches else None
 
 
-                
+        sections = []
 
 
-            # Add contextual information
+        if use_vectors and snapshot.vectors.is_loaded:
 
 
-            response.update(await self._add_context(query, user_profile, session_data))
+            if query_vector is None:
 
 
-            
+                query_vector = await asyncio.get_running_loop().run_in_executor(
 
 
-            # Add maintenance reminders if relevant
+                    None, self.semantic_cache.embed, user_message)
 
 
-            if self._should_add_maintenance_info(query, user_profile):
+            sections = snapshot.vectors.search(query_vector, language=language, aliases=aliases)
 
 
-                response["maintenance_info"] = await self._get_maintenance_reminders(
+            if not sections and aliases is not None:
 
 
-                    user_profile, language
+                sections = snapshot.vectors.search(query_vector, language=language)
 
 
-                )
+        if not sections:
 
 
-                
+            sections = snapshot.retriever.search(user_message, language=language, aliases=aliases)
 
 
-            # Add cost estimates if applicable
+            if not sections and aliases is not None:
 
 
-            if "cost" in query.get("requested_info", []):
+                sections = snapshot.retriever.search(user_message, language=language)
 
 
-                response["cost_estimates"] = await self._generate_cost_estimates(
+        return "\n\n".join(section["text"] for section in sections)
 
 
-                    query, language
 
 
-                )
 
+    async def _handle_diagnostic_turn(self, user_message: str, session: dict) -> bool:
 
-                
 
+        """One turn of a /diagnose session, answered from the precomputed decision tree.
 
-            # Add recommendations
 
 
-            response["recommendations"] = await self._generate_recommendations(
 
 
-                query, response, language
+        Returns False when the message is not part of the session (an emergency
 
 
-                )
+        or a new question); the session is then closed and the caller answers
 
 
-                
+        the message normally.
 
 
-            return {**base_response, **response}
+        """
 
 
-            
+        planner = self.diagnostic_planner
 
 
-        except Exception as e:
+        if user_message.startswith("/diagnose"):
 
 
-            logger.error(f"Response generation error: {str(e)}")
+            symptoms, tree = planner.plan(user_message[len("/diagnose"):])
 
 
-            return self._generate_error_response(e, language)
+            if not symptoms:
 
 
+                session.pop("diagnostic_session", None)
 
 
+                await cl.Message(content="Please list your symptoms, e.g. /diagnose hard start, clicking\n"
 
-    async def _generate_standard_response(self, query: dict, language: str) -> dict:
 
+                                         "من فضلك اكتب الأعراض بعد /diagnose").send()
 
-        """Generate standard response with comprehensive information."""
 
+                return True
 
-        response = {
 
+            state = session["diagnostic_session"] = {"symptoms": symptoms, "node": tree, "answers": []}
 
-            "main_content": await self._get_main_content(query, language),
 
+        else:
 
-            "additional_info": await self._get_additional_info(query, language),
 
+            state = session["diagnostic_session"]
 
-            "related_topics": await self._get_related_topics(query, language)
 
+            # An emergency never waits behind a check question
 
-        }
 
+            if self.query_analyzer.classify(user_message)["is_emergency"]:
 
-        
 
+                del session["diagnostic_session"]
 
-        if query.get("needs_diagnosis", False):
 
+                return False
 
-            response["diagnostic_info"] = await self.diagnostics.diagnose(
 
+            answer = planner.parse_answer(user_message)
 
-                query.get("symptoms", []),
 
+            if answer is None:
 
-                query.get("vehicle_info", {})
 
+                reply = arabic_normalizer.normalize(user_message).strip(" .!؟?")
 
-            )
 
+                if reply in planner.UNKNOWN_ANSWERS:
 
-            
 
+                    await cl.Message(content=planner.describe_check(state["node"]["check"])).send()
 
-        return response
 
+                    return True
 
 
+                del session["diagnostic_session"]
 
 
-# Final Integration System
+                if reply in ("stop", "cancel", "خلاص", "الغاء"):
 
 
-class CarExpertSystem:
+                    await cl.Message(content="Diagnosis stopped / تم إيقاف التشخيص").send()
 
 
-    def __init__(self):
+                    return True
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:18:22", "%Y-%m-%d %H:%M:%S")
+                # Anything else is a new question, answered by the normal pipeline
 
 
-        self.current_user = "andrewamirr"
+                return False
 
 
-        self.response_generator = AdvancedResponseGenerator()
+            state["answers"].append(answer)
 
 
-        self.interaction_flow = UserInteractionFlow()
+            state["node"] = state["node"]["yes" if answer else "no"]
 
 
-        self.external_services = ExternalServicesManager()
+        node = state["node"]
 
 
-        self.error_handler = ErrorHandler()
+        if "check" in node:
 
 
-        self.session_manager = SessionManager()
+            await cl.Message(content=planner.describe_check(node["check"])).send()
 
 
-        
+            return True
 
 
-    async def process_message(self, message: cl.Message) -> None:
+        del session["diagnostic_session"]
 
 
-        """Main message processing pipeline."""
+        causes = "\n".join(f"- {cause['part']}: {cause['confidence']}% (cost {cause['cost']})"
 
 
-        try:
+                           for cause in node["causes"] if cause["confidence"] >= 1)
 
 
-            # Initialize processing
+        await cl.Message(content=f"🔍 Most likely causes for {', '.join(state['symptoms'])} "
 
 
-            start_time = self.current_date
+                                 f"after {len(state['answers'])} answers:\n{causes}").send()
 
 
-            session_id = message.author or "anonymous"
+        return True
 
 
-            user_message = message.content.strip()
 
 
-            
 
+    @staticmethod
 
-            logger.info(f"Processing message from {session_id}: {user_message}")
 
+    async def _discard_secret_message(message: cl.Message) -> None:
 
-            
 
+        """Redact a user message and remove it from the chat context, the data layer and the UI."""
 
-            # Get or create session
 
+        message.content = "/reload-kb [redacted]"
 
-            session = self.session_manager.get_or_create_session(session_id)
 
+        try:
 
-            
 
+            await message.remove()
 
-            # Process message
 
+        except Exception as e:
 
-            try:
 
+            logger.warning(f"Could not remove the reload command message: {str(e)}")
 
-                # Analyze query
 
 
-                analysis = await self.interaction_flow.handle_interaction(
 
 
-                    user_message, session_id
+    async def _handle_reload_command(self, user_message: str, session_id: str) -> None:
 
 
-                )
+        """Admin command: /reload-kb <token> reloads the knowledge base and prices."""
 
 
-                
+        admin_token = os.environ.get("CAR_EXPERT_ADMIN_TOKEN", "")
 
 
-                # Generate response
+        parts = user_message.split()
 
 
-                response = await self.response_generator.generate_response(
+        if not admin_token or len(parts) < 2 or not hmac.compare_digest(parts[1], admin_token):
 
 
-                    analysis,
+            logger.warning(f"Rejected knowledge reload command from {session_id}")
 
 
-                    session.get("user_profile", {}),
+            await cl.Message(content="❌ Not authorized").send()
 
 
-                    session
+            return
 
 
-                )
+        try:
 
 
-                
+            record = await asyncio.get_running_loop().run_in_executor(
 
 
-                # Handle emergency cases
+                None, self.knowledge_store.reload, f"admin command ({session_id})")
 
 
-                if analysis.get("is_emergency", False):
+        except (OSError, ValueError) as e:
 
 
-                    await self._handle_emergency_case(response, session_id)
+            await cl.Message(content=f"❌ Knowledge reload failed: {str(e)}").send()
 
 
-                
+            return
 
 
-                # Send response
+        await cl.Message(content=f"✅ Knowledge base v{record['version']} loaded in "
 
 
-                await self._send_response(response, session_id)
+                                 f"{record['duration_seconds']}s ({record['articles']} articles)").send()
 
 
-                
 
 
-                # Update session
 
+    @staticmethod
 
-                self.session_manager.update_session(session_id, {
 
+    async def _replay_cached_answer(answer: str):
 
-                    "last_interaction": self.current_date,
 
+        """Yield a cached answer word by word, like a live stream."""
 
-                    "last_query": user_message,
 
+        for chunk in re.findall(r"\S+\s*|\s+", answer):
 
-                    "last_response": response
 
+            yield chunk
 
-                })
 
+            await asyncio.sleep(0)
 
-                
 
 
-            except Exception as e:
 
 
-                error_response = await self.error_handler.handle_error(
+    async def _send_response(self, response: dict, session_id: str) -> None:
 
 
-                    e, session.get("language", "en")
+        """Send a prepared (non-streamed) response to the user."""
 
 
-                )
+        try:
 
 
-                await self._send_response(error_response, session_id)
+            if response.get("type") == "error":
 
 
-                
+                message = f"❌ {response['message']}"
 
 
-            finally:
+            elif response.get("type") == "emergency":
 
 
-                # Log processing time
+                message = f"🚨 {response['message']}"
 
 
-                processing_time = (datetime.utcnow() - start_time).total_seconds()
+            else:
 
 
-                logger.info(f"Message processed in {processing_time}s")
+                message = response.get("main_content", "") or response.get("message", "")
 
 
-                
+            await cl.Message(content=message).send()
 
 
         except Exception as e:
 
 
-            logger.error(f"Critical error in message processing: {str(e)}")
+            logger.error(f"Error sending response: {str(e)}")
 
 
             await self._send_system_error(session_id)
@@ -4671,47 +4835,45 @@ class CarExpertSystem:
 
 
 
-
-    async def _handle_emergency_case(self, response: dict, session_id: str) -> None:
+    async def _send_system_error(self, session_id: str) -> None:
 
 
-        """Handle emergency cases with priority."""
+        """Send system error message."""
 
 
-        try:
+        error_messages = {
 
 
-            # Get nearest mechanics
+            "en": "⚠️ System Error: Please try again later or contact support.",
 
 
-            mechanics = await self.external_services.get_nearest_mechanics({})
+            "ar": "⚠️ خطأ في النظام: يرجى المحاولة لاحقاً أو الاتصال بالدعم."
 
 
-            
+        }
 
 
-            # Update response with emergency information
+        session = self.session_manager.get_or_create_session(session_id)
 
 
-            response["emergency_contacts"] = mechanics
+        language = session.get("language", "en")
 
 
-            
+        await cl.Message(content=error_messages.get(language, error_messages["en"])).send()
 
 
-            # Send immediate notification
 
 
-            await self._send_emergency_notification(response, session_id)
+    async def _send_emergency_notification(self, response: dict, session_id: str) -> None:
 
 
-            
+        """Send emergency notification."""
 
 
-        except Exception as e:
+        emergency_prefix = "🚨 EMERGENCY / طوارئ 🚨\n\n"
 
 
-            logger.error(f"Error handling emergency: {str(e)}")
+        await cl.Message(content=emergency_prefix + response.get("message", "")).send()
 
 
 
@@ -4726,7 +4888,7 @@ class SessionManager:
     def __init__(self):
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:18:22", "%Y-%m-%d %H:%M:%S")
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:18:22", "%Y-%m-%d %H:%M:%S")
 
 
         self.sessions = {}
@@ -4843,7 +5005,7 @@ class TestingSystem:
     def __init__(self):
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:19:32", "%Y-%m-%d %H:%M:%S")
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:19:32", "%Y-%m-%d %H:%M:%S")
 
 
         self.current_user = "andrewamirr"
@@ -5141,7 +5303,7 @@ class PerformanceOptimizer:
     def __init__(self):
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:19:32", "%Y-%m-%d %H:%M:%S")
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:19:32", "%Y-%m-%d %H:%M:%S")
 
 
         self.current_user = "andrewamirr"
@@ -5322,7 +5484,7 @@ class DeploymentConfig:
     def __init__(self):
 
 
-        self.current_date = datetime.strptime("2025-06-06 19:19:32", "%Y-%m-%d %H:%M:%S")
+        self.current_date = datetime.datetime.strptime("2025-06-06 19:19:32", "%Y-%m-%d %H:%M:%S")
 
 
         self.current_user = "andrewamirr"
@@ -5451,6 +5613,2510 @@ class DeploymentConfig:
 
 
 
+# Shared Model Registry
+
+def get_resident_memory_mb() -> float:
+    """Return the resident set size of the current process in MB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return round(resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 2)
+    except (OSError, ValueError, IndexError, AttributeError):
+        try:
+            import resource
+            return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+        except ImportError:
+            return 0.0
+
+class ModelRegistry:
+    """Process-wide registry that loads each GGUF model once and shares it across sessions."""
+    def __init__(self):
+        self.model_specs = {
+            "chat": {
+                "model_path": Config.MODEL_PATH,
+                "n_ctx": Config.N_CTX,
+                "n_threads": Config.N_THREADS,
+                "n_gpu_layers": Config.N_GPU_LAYERS,
+                "n_batch": Config.BATCH_SIZE,
+                "use_mmap": Config.USE_MMAP,
+                "use_mlock": Config.USE_MLOCK,
+                "verbose": Config.VERBOSE
+            },
+            "embedding": {
+                "model_path": Config.EMBEDDING_MODEL_PATH,
+                "embedding": True,
+                "n_ctx": 512,
+                "n_batch": 512,
+                "n_threads": 2,
+                "use_mmap": Config.USE_MMAP,
+                "verbose": Config.VERBOSE
+            }
+        }
+        if Config.SPECULATIVE_DECODING == "draft_model":
+            self.model_specs["draft"] = {
+                "model_path": Config.DRAFT_MODEL_PATH,
+                "n_ctx": Config.N_CTX,
+                "n_threads": Config.N_THREADS,
+                "n_batch": Config.BATCH_SIZE,
+                "use_mmap": Config.USE_MMAP,
+                "verbose": Config.VERBOSE
+            }
+        self.metrics = {}
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, **params) -> None:
+        """Register (or replace) the load parameters for a named model."""
+        with self._lock:
+            if name in self._models:
+                raise ModelLoadError(f"Model already loaded: {name}")
+            self.model_specs[name] = params
+
+    def is_loaded(self, name: str = "chat") -> bool:
+        """Check whether a model is already resident in this process."""
+        return name in self._models
+
+    def get_model(self, name: str = "chat") -> Llama:
+        """Return the shared model instance, loading it on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self._load_model(name)
+            return self._models[name]
+
+    def _load_model(self, name: str) -> Llama:
+        """Load a model from its registered spec and record load metrics."""
+        params = self.model_specs.get(name)
+        if params is None:
+            raise ModelLoadError(f"Unknown model: {name}")
+        model_path = params["model_path"]
+        if not os.path.exists(model_path):
+            raise ModelLoadError(f"Model file not found: {model_path}")
+        memory_before = get_resident_memory_mb()
+        start_time = time.perf_counter()
+        try:
+            model = Llama(**params)
+        except Exception as e:
+            logger.error(f"Model load error: {str(e)}")
+            raise ModelLoadError(f"Error loading model {name}: {str(e)}")
+        load_time = time.perf_counter() - start_time
+        memory_after = get_resident_memory_mb()
+        self.metrics[name] = {
+            "model_path": model_path,
+            "model_file_mb": round(os.path.getsize(model_path) / (1024 * 1024), 2),
+            "load_time_seconds": round(load_time, 3),
+            "resident_memory_mb": memory_after,
+            "resident_delta_mb": round(memory_after - memory_before, 2),
+            "use_mmap": params.get("use_mmap", True),
+            "use_mlock": params.get("use_mlock", False),
+            "loaded_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        logger.info(f"Loaded model '{name}' in {load_time:.2f}s "
+                    f"(RSS {memory_after} MB, +{self.metrics[name]['resident_delta_mb']} MB)")
+        return model
+
+    def get_metrics(self) -> dict:
+        """Get load metrics for every loaded model with the current resident size."""
+        return {
+            "models": {name: dict(metrics) for name, metrics in self.metrics.items()},
+            "resident_memory_mb": get_resident_memory_mb()
+        }
+
+# Process-wide model registry shared by every Chainlit session
+model_registry = ModelRegistry()
+
+# Inference Metrics
+
+class InferenceMetrics:
+    """Rolling latency samples and counters for the inference pipeline."""
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value: float) -> None:
+        """Record one sample of a named measurement."""
+        with self._lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.max_samples)
+            self.samples[name].append(value)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Increment a named counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def get_report(self) -> dict:
+        """Summarize every measurement as count/avg/p50/p95/max."""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+            counters = dict(self.counters)
+        summary = {}
+        for name, values in samples.items():
+            if not values:
+                continue
+            summary[name] = {
+                "count": len(values),
+                "avg": round(sum(values) / len(values), 4),
+                "p50": round(values[len(values) // 2], 4),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 4),
+                "max": round(values[-1], 4)
+            }
+        return {"samples": summary, "counters": counters}
+
+inference_metrics = InferenceMetrics()
+
+# Prompt Construction (Llama-3 chat template)
+
+LANGUAGE_INSTRUCTIONS = {
+    "ar": "أجب باللغة العربية باللهجة المصرية.",
+    "en": "Answer in English."
+}
+
+def format_chat_turn(role: str, content: str) -> str:
+    """Format one Llama-3 chat turn."""
+    return f"<|start_header_id|>{role}<|end_header_id|>\n\n{content.strip()}<|eot_id|>"
+
+def build_user_content(user_message: str, language: str = "ar", knowledge: str = "") -> str:
+    """Build the user turn exactly as it is sent to the model.
+
+    History stores this same text, knowledge included, so a follow-up prompt
+    begins with the tokens the previous turn already evaluated.
+    """
+    user_content = f"{user_message}\n\n{LANGUAGE_INSTRUCTIONS.get(language, LANGUAGE_INSTRUCTIONS['ar'])}"
+    if knowledge:
+        user_content = f"Reference / مرجع:\n{knowledge}\n\n---\n{user_content}"
+    return user_content
+
+# Compiled Knowledge Base
+
+KB_MAGIC = b"CARKB001"
+KB_FORMAT_VERSION = 2
+KB_HEADER = struct.Struct("<8sIIIIiiQQQQQ")
+
+def builtin_knowledge_base() -> dict:
+    """Return the knowledge base shipped in car_knowledge_base.py.
+
+    The module is imported on first use only, so processes serving a
+    compiled knowledge base never parse or keep its literals.
+    """
+    from car_knowledge_base import CAR_KNOWLEDGE_BASE
+    return CAR_KNOWLEDGE_BASE
+
+def export_knowledge_base_source(path: str) -> None:
+    """Write the built-in knowledge base and maintenance intervals as compiler source JSON."""
+    source = {
+        "articles": [
+            {"aliases": list(aliases), "en": article.get("en", ""), "ar": article.get("ar", "")}
+            for aliases, article in builtin_knowledge_base().items()
+        ],
+        "maintenance_intervals": Config.MAINTENANCE_INTERVALS
+    }
+    with open(path, "w", encoding="utf-8") as source_file:
+        json.dump(source, source_file, ensure_ascii=False, indent=2)
+
+def compile_knowledge_base(source_path: str, output_path: str) -> dict:
+    """Compile KB source (JSON, or YAML when PyYAML is installed) into one binary file.
+
+    Layout after the header: string offsets (uint64), the article table
+    (offset and length of each article's body per language), the alias
+    table (alias, normalized alias, article, position) sorted by normalized
+    alias for binary search, the UTF-8 string blob, and finally the article
+    bodies, zlib-compressed one by one and grouped by language so the pages
+    of a language nobody asks for are never read.
+    """
+    with open(source_path, encoding="utf-8") as source_file:
+        if source_path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required to compile YAML knowledge base sources")
+            source = yaml.safe_load(source_file)
+        else:
+            source = json.load(source_file)
+
+    strings = {}
+    def intern(text: str) -> int:
+        return strings.setdefault(text, len(strings))
+
+    source_articles = source.get("articles", [])
+    languages = sorted({language for article in source_articles for language in article if language != "aliases"})
+    aliases = []
+    for article_id, article in enumerate(source_articles):
+        for position, alias in enumerate(article["aliases"]):
+            normalized = arabic_normalizer.normalize(alias)
+            aliases.append((normalized, intern(alias), intern(normalized), article_id, position))
+    aliases.sort(key=lambda alias: (alias[0].encode("utf-8"), alias[3], alias[4]))
+    intervals = source.get("maintenance_intervals")
+    intervals_id = intern(json.dumps(intervals, ensure_ascii=False)) if intervals is not None else -1
+    languages_id = intern(json.dumps(languages))
+
+    bodies = []
+    article_table = np.zeros((len(source_articles), len(languages), 2), dtype="<u8")
+    body_offset = 0
+    for language_index, language in enumerate(languages):
+        for article_id, article in enumerate(source_articles):
+            body = zlib.compress(article.get(language, "").encode("utf-8"), 9)
+            article_table[article_id, language_index] = (body_offset, len(body))
+            bodies.append(body)
+            body_offset += len(body)
+
+    encoded = [text.encode("utf-8") for text in strings]
+    string_offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(data) for data in encoded], out=string_offsets[1:])
+    alias_table = np.asarray([alias[1:] for alias in aliases], dtype="<u4").reshape(-1, 4)
+
+    offsets_at = KB_HEADER.size
+    articles_at = offsets_at + string_offsets.nbytes
+    aliases_at = articles_at + article_table.nbytes
+    blob_at = aliases_at + alias_table.nbytes
+    bodies_at = blob_at + int(string_offsets[-1])
+    # Write next to the target and rename, so processes mapping the old file keep a valid copy
+    temporary_path = f"{output_path}.tmp"
+    with open(temporary_path, "wb") as output_file:
+        output_file.write(KB_HEADER.pack(KB_MAGIC, KB_FORMAT_VERSION, len(encoded), len(source_articles),
+                                         len(aliases), intervals_id, languages_id,
+                                         offsets_at, articles_at, aliases_at, blob_at, bodies_at))
+        output_file.write(string_offsets.tobytes())
+        output_file.write(article_table.tobytes())
+        output_file.write(alias_table.tobytes())
+        for data in encoded:
+            output_file.write(data)
+        for body in bodies:
+            output_file.write(body)
+    os.replace(temporary_path, output_path)
+    return {
+        "articles": len(source_articles),
+        "aliases": len(aliases),
+        "strings": len(encoded),
+        "languages": languages,
+        "body_bytes": body_offset,
+        "bytes": os.path.getsize(output_path)
+    }
+
+class LazyArticle(Mapping):
+    """One compiled article; each language body is decompressed only when read."""
+    def __init__(self, knowledge_base: "CompiledKnowledgeBase", article_id: int):
+        self.knowledge_base = knowledge_base
+        self.article_id = article_id
+
+    def __getitem__(self, language: str) -> str:
+        return self.knowledge_base.article_text(self.article_id, language)
+
+    def __iter__(self):
+        return iter(self.knowledge_base.languages)
+
+    def __len__(self) -> int:
+        return len(self.knowledge_base.languages)
+
+class CompiledKnowledgeBase(Mapping):
+    """Read-only, memory-mapped view of a compiled knowledge base file.
+
+    Behaves like CAR_KNOWLEDGE_BASE (alias tuple -> {"en", "ar"}), but the
+    compressed bodies stay in the shared page cache and a language variant
+    is only decompressed when it is read. Each language keeps its own small
+    LRU of decompressed articles, so a mostly-Arabic deployment never holds
+    the English text.
+    """
+    def __init__(self, path: str, cache_size: int = Config.KB_ARTICLE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        with open(path, "rb") as kb_file:
+            self._mmap = mmap.mmap(kb_file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, n_strings, n_articles, n_aliases, self._intervals_id, languages_id,
+         offsets_at, articles_at, aliases_at, self._blob_at, self._bodies_at) = KB_HEADER.unpack_from(self._mmap, 0)
+        if magic != KB_MAGIC or version != KB_FORMAT_VERSION:
+            raise ValueError(f"Not a compiled knowledge base (format {KB_FORMAT_VERSION}): {path}")
+        self._string_offsets = np.frombuffer(self._mmap, dtype="<u8", count=n_strings + 1, offset=offsets_at)
+        self.languages = tuple(json.loads(self.string(languages_id)))
+        self._articles = np.frombuffer(self._mmap, dtype="<u8", count=n_articles * len(self.languages) * 2,
+                                       offset=articles_at).reshape(n_articles, len(self.languages), 2)
+        self._aliases = np.frombuffer(self._mmap, dtype="<u4", count=n_aliases * 4,
+                                      offset=aliases_at).reshape(-1, 4)
+        article_aliases = [[] for _ in range(n_articles)]
+        for alias_id, _, article_id, position in self._aliases.tolist():
+            article_aliases[article_id].append((position, self.string(alias_id)))
+        self._keys = [tuple(alias for _, alias in sorted(entries)) for entries in article_aliases]
+        self._key_ids = {key: article_id for article_id, key in enumerate(self._keys)}
+        self._article_cache = {language: OrderedDict() for language in self.languages}
+        self._cache_lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "decompressed_bytes": 0}
+
+    def string(self, string_id: int) -> str:
+        start = self._blob_at + int(self._string_offsets[string_id])
+        end = self._blob_at + int(self._string_offsets[string_id + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def article_text(self, article_id: int, language: str) -> str:
+        """Return one language body, decompressing it through that language's LRU."""
+        if language not in self._article_cache:
+            raise KeyError(language)
+        cache = self._article_cache[language]
+        with self._cache_lock:
+            text = cache.get(article_id)
+            if text is not None:
+                cache.move_to_end(article_id)
+                self.stats["hits"] += 1
+                return text
+        offset, length = self._articles[article_id, self.languages.index(language)]
+        start = self._bodies_at + int(offset)
+        body = zlib.decompress(self._mmap[start:start + int(length)])
+        text = body.decode("utf-8")
+        with self._cache_lock:
+            self.stats["misses"] += 1
+            self.stats["decompressed_bytes"] += len(body)
+            cache[article_id] = text
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return text
+
+    def __getitem__(self, aliases: tuple) -> LazyArticle:
+        return LazyArticle(self, self._key_ids[aliases])
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def find_alias(self, alias: str) -> Optional[tuple]:
+        """Binary-search the sorted alias table for an exact (normalized) alias."""
+        target = arabic_normalizer.normalize(alias).encode("utf-8")
+        low, high = 0, len(self._aliases)
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self.string(int(self._aliases[middle, 1])).encode("utf-8")
+            if candidate < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._aliases) and self.string(int(self._aliases[low, 1])).encode("utf-8") == target:
+            return self._keys[int(self._aliases[low, 2])]
+        return None
+
+    @property
+    def maintenance_intervals(self) -> Optional[dict]:
+        if self._intervals_id < 0:
+            return None
+        return json.loads(self.string(self._intervals_id))
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "resident_articles": {language: len(cache) for language, cache in self._article_cache.items()},
+            "resident_chars": sum(len(text) for cache in self._article_cache.values() for text in cache.values())
+        }
+
+def load_knowledge_base(path: str = Config.KB_COMPILED_PATH, strict: bool = False):
+    """Return the compiled knowledge base if one is deployed, else the built-in one.
+
+    With strict=True a compiled file that fails to load raises instead of
+    falling back, so a bad update never replaces a good knowledge base.
+    """
+    if path and os.path.exists(path):
+        try:
+            knowledge_base = CompiledKnowledgeBase(path)
+            logger.info(f"Memory-mapped compiled knowledge base {path} ({len(knowledge_base)} articles)")
+            return knowledge_base
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Compiled knowledge base load error: {str(e)}")
+            if strict:
+                raise ValueError(f"Invalid compiled knowledge base {path}: {str(e)}")
+    return builtin_knowledge_base()
+
+# Knowledge Base Alias Index
+
+class KnowledgeBaseIndex:
+    """Aho-Corasick alias index over a knowledge base.
+
+    All aliases are compiled once into a KeywordAutomaton, so one pass over
+    the query finds every alias it contains regardless of how many topics
+    the knowledge base holds.
+    """
+    def __init__(self, knowledge_base: dict, normalizer: ArabicNormalizer = arabic_normalizer):
+        self.knowledge_base = knowledge_base
+        self.normalizer = normalizer
+        self.entries = list(knowledge_base.keys())
+        self.automaton = KeywordAutomaton((self.normalizer.normalize(alias), entry_id)
+                                          for entry_id, aliases in enumerate(self.entries) for alias in aliases)
+
+    def find_all(self, text: str) -> list:
+        """Return (start, alias, entry_id) for every alias occurrence in text.
+
+        Positions and aliases refer to the normalized text.
+        """
+        return [(start, alias, entry_id)
+                for start, _, alias, entry_id in self.automaton.find_all(self.normalizer.normalize(text))]
+
+    def search(self, query: str) -> list:
+        """Return matching entries ranked by longest alias, then earliest position."""
+        best = {}
+        for start, alias, entry_id in self.find_all(query):
+            match = best.get(entry_id)
+            if match is None:
+                best[entry_id] = {"aliases": self.entries[entry_id], "alias": alias, "start": start,
+                                  "length": len(alias), "matches": 1}
+                continue
+            match["matches"] += 1
+            if (len(alias), -start) > (match["length"], -match["start"]):
+                match.update(alias=alias, start=start, length=len(alias))
+        return sorted(best.values(), key=lambda match: (-match["length"], match["start"], -match["matches"]))
+
+# BM25 Retrieval
+
+class BM25Retriever:
+    """BM25 ranking over the bullet sections of every knowledge base article.
+
+    Each article body in Config.KB_LANGUAGES is split at its "•" headings
+    and every section becomes one document prefixed with the article title.
+    Postings are kept in flat NumPy arrays (document ids and term counts per
+    term, sliced through an offsets array), so scoring a query is a few
+    vectorized operations per query term. Each article's document ids are
+    kept as an array too, so pinning a search to one article is a gather.
+    Documents only record where their section lives; the text is read back
+    from the knowledge base for results.
+    """
+    def __init__(self, knowledge_base: dict, normalizer: ArabicNormalizer = arabic_normalizer,
+                 k1: float = 1.5, b: float = 0.75, languages: Sequence[str] = Config.KB_LANGUAGES):
+        self.knowledge_base = knowledge_base
+        self.normalizer = normalizer
+        self.k1 = k1
+        self.b = b
+        self.languages = tuple(languages)
+        unindexed = [language for language in LANGUAGE_INSTRUCTIONS if language not in self.languages]
+        if unindexed and self.languages:
+            logger.warning(f"Knowledge base bodies for {', '.join(unindexed)} are not indexed; "
+                           f"those questions are grounded in {self.languages[0]}")
+        self.documents = []
+        texts = []
+        for aliases, article in knowledge_base.items():
+            for language in languages:
+                for section_index, section in enumerate(self.split_sections(article.get(language, ""))):
+                    self.documents.append({"aliases": aliases, "language": language, "section": section_index,
+                                           "checksum": zlib.crc32(section.encode("utf-8"))})
+                    texts.append(section)
+        self._build(texts)
+
+    def resolve_language(self, language: Optional[str]) -> Optional[str]:
+        """Map an answer language to an indexed one, so no language is left without grounding."""
+        if language is None or language in self.languages or not self.languages:
+            return language
+        return self.languages[0]
+
+    def section_text(self, doc_id: int) -> str:
+        document = self.documents[doc_id]
+        article = self.knowledge_base[document["aliases"]]
+        return self.split_sections(article.get(document["language"], ""))[document["section"]]
+
+    @staticmethod
+    def split_sections(article: str) -> list:
+        """Split an article into its "•" sections, each prefixed with the title line."""
+        article = re.sub(r"\n(?:[ \t]*\n)+", "\n", article.strip())
+        parts = [part.strip() for part in re.split(r"\n\s*(?=•)", article) if part.strip()]
+        if len(parts) <= 1:
+            return parts
+        title = parts[0]
+        return [f"{title}\n{part}" for part in parts[1:]]
+
+    def tokenize(self, text: str) -> list:
+        tokens = []
+        for token in re.findall(r"\w+", self.normalizer.normalize(text)):
+            if token.startswith("ال") and len(token) > 4:
+                token = token[2:]
+            elif token.isascii() and token.endswith("s") and len(token) > 3:
+                token = token[:-1]
+            if len(token) > 1:
+                tokens.append(token)
+        return tokens
+
+    def _build(self, texts: list) -> None:
+        postings = {}
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            tokens = self.tokenize(text)
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, count))
+        self.vocabulary = {term: term_id for term_id, term in enumerate(postings)}
+        offsets = [0]
+        doc_ids = []
+        counts = []
+        for term_postings in postings.values():
+            doc_ids.extend(doc_id for doc_id, _ in term_postings)
+            counts.extend(count for _, count in term_postings)
+            offsets.append(len(doc_ids))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.term_counts = np.asarray(counts, dtype=np.float32)
+        self.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        self.doc_languages = np.asarray([document["language"] == "ar" for document in self.documents])
+        article_docs = {}
+        for doc_id, document in enumerate(self.documents):
+            article_docs.setdefault(document["aliases"], []).append(doc_id)
+        self.article_docs = {aliases: np.asarray(doc_ids, dtype=np.int32) for aliases, doc_ids in article_docs.items()}
+        document_frequency = np.diff(self.offsets).astype(np.float32)
+        total = len(self.documents)
+        self.idf = np.log(1.0 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = max(float(self.doc_lengths.mean()), 1.0) if total else 1.0
+        self.length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / average_length)
+
+    def search(self, query: str, k: int = Config.RETRIEVAL_TOP_K, language: Optional[str] = None,
+               aliases: Optional[tuple] = None) -> list:
+        """Return the top-k sections as dicts with text, language, aliases and score."""
+        start_time = time.perf_counter()
+        requested_language = language
+        language = self.resolve_language(language)
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for term in set(self.tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            counts = self.term_counts[start:end]
+            scores[doc_ids] += self.idf[term_id] * counts * (self.k1 + 1) / (counts + self.length_norm[doc_ids])
+        if language in ("en", "ar"):
+            scores[self.doc_languages != (language == "ar")] = 0.0
+        pinned = None
+        if aliases is not None:
+            pinned = self.article_docs.get(aliases, np.empty(0, dtype=np.int32))
+            pinned_scores = np.zeros_like(scores)
+            pinned_scores[pinned] = scores[pinned]
+            scores = pinned_scores
+        count = min(k, int(np.count_nonzero(scores)))
+        results = []
+        if count:
+            top = np.argpartition(scores, -count)[-count:]
+            for doc_id in top[np.argsort(scores[top])[::-1]]:
+                results.append({**self.documents[doc_id], "text": self.section_text(doc_id),
+                                "score": round(float(scores[doc_id]), 4)})
+        elif aliases is not None and language != requested_language:
+            # Query words can't match another language's text; the pinned article's opening sections still ground it
+            doc_ids = [doc_id for doc_id in pinned.tolist() if self.documents[doc_id]["language"] == language][:k]
+            results = [{**self.documents[doc_id], "text": self.section_text(doc_id), "score": 0.0}
+                       for doc_id in doc_ids]
+        inference_metrics.record("retrieval_seconds", time.perf_counter() - start_time)
+        return results
+
+# Knowledge Vector Index
+
+class KnowledgeVectorIndex:
+    """Embeddings of every knowledge base section, memory-mapped from disk.
+
+    The index is built offline (python finall.py --build-vector-index) with
+    the "embedding" model and stored as a float16 .npy matrix next to a JSON
+    file describing the chunks it was built from. At startup the matrix is
+    opened with mmap_mode="r", so worker processes share its pages. Search is
+    brute force, which is a single matrix-vector product at this size.
+    """
+    def __init__(self, retriever: BM25Retriever, path: str = Config.VECTOR_INDEX_PATH):
+        self.retriever = retriever
+        documents = retriever.documents
+        self.documents = documents
+        self.path = path
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        self.fingerprint = self.compute_fingerprint(documents)
+        self.entry_ids = {}
+        self.doc_entries = np.asarray([self.entry_ids.setdefault(document["aliases"], len(self.entry_ids))
+                                       for document in documents], dtype=np.int32)
+        self.doc_languages = np.asarray([document["language"] == "ar" for document in documents])
+        self.vectors = None
+
+    @staticmethod
+    def compute_fingerprint(documents: list) -> str:
+        digest = hashlib.sha1(Config.EMBEDDING_PASSAGE_PREFIX.encode("utf-8"))
+        for document in documents:
+            digest.update(document["language"].encode("utf-8"))
+            digest.update(str(document["checksum"]).encode("utf-8"))
+        return digest.hexdigest()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.vectors is not None
+
+    def build(self, embed) -> dict:
+        """Embed every section with embed(text) and write the matrix and its metadata."""
+        start_time = time.perf_counter()
+        vectors = np.stack([embed(self.retriever.section_text(doc_id))
+                            for doc_id in range(len(self.documents))]).astype(np.float16)
+        np.save(self.path, vectors)
+        metadata = {
+            "fingerprint": self.fingerprint,
+            "embedding_model": os.path.basename(Config.EMBEDDING_MODEL_PATH),
+            "chunks": len(self.documents),
+            "dimensions": int(vectors.shape[1]),
+            "built_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "build_seconds": round(time.perf_counter() - start_time, 3)
+        }
+        with open(self.meta_path, "w", encoding="utf-8") as meta_file:
+            json.dump(metadata, meta_file, indent=2)
+        return metadata
+
+    def load(self) -> bool:
+        """Memory-map the index if it exists and matches the current knowledge base."""
+        if not (os.path.exists(self.path) and os.path.exists(self.meta_path)):
+            return False
+        try:
+            with open(self.meta_path, encoding="utf-8") as meta_file:
+                metadata = json.load(meta_file)
+            if metadata.get("fingerprint") != self.fingerprint:
+                logger.warning(f"Vector index {self.path} is stale; rebuild it with --build-vector-index")
+                return False
+            if metadata.get("embedding_model") != os.path.basename(Config.EMBEDDING_MODEL_PATH):
+                logger.warning(f"Vector index {self.path} was built with another embedding model")
+                return False
+            self.vectors = np.load(self.path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.error(f"Vector index load error: {str(e)}")
+            return False
+        logger.info(f"Memory-mapped {self.vectors.shape[0]} knowledge vectors from {self.path}")
+        return True
+
+    def search(self, vector: np.ndarray, k: int = Config.RETRIEVAL_TOP_K, language: Optional[str] = None,
+               aliases: Optional[tuple] = None) -> list:
+        """Return the top-k sections by cosine similarity to a normalized query vector."""
+        if self.vectors is None or vector is None:
+            return []
+        start_time = time.perf_counter()
+        language = self.retriever.resolve_language(language)
+        scores = self.vectors @ vector.astype(np.float32)
+        if language in ("en", "ar"):
+            scores[self.doc_languages != (language == "ar")] = -np.inf
+        if aliases is not None:
+            scores[self.doc_entries != self.entry_ids.get(aliases, -1)] = -np.inf
+        count = min(k, int(np.isfinite(scores).sum()))
+        results = []
+        if count:
+            top = np.argpartition(scores, -count)[-count:]
+            for doc_id in top[np.argsort(scores[top])[::-1]]:
+                results.append({**self.documents[doc_id], "text": self.retriever.section_text(doc_id),
+                                "score": round(float(scores[doc_id]), 4)})
+        inference_metrics.record("vector_search_seconds", time.perf_counter() - start_time)
+        return results
+
+def build_vector_index() -> dict:
+    """Embed every knowledge base section offline and write the memory-mapped index."""
+    def embed(text: str) -> np.ndarray:
+        vector = semantic_cache.embed(text, prefix=Config.EMBEDDING_PASSAGE_PREFIX)
+        if vector is None:
+            raise ModelLoadError(f"Embedding model unavailable: {Config.EMBEDDING_MODEL_PATH}")
+        return vector
+    return knowledge_store.current.vectors.build(embed)
+
+# Knowledge Snapshots and Hot Reload
+
+class KnowledgeSnapshot:
+    """One immutable version of the knowledge base, its indexes and the price tables."""
+    def __init__(self, version: int, knowledge_base, pricing: dict, maintenance_intervals: dict):
+        self.version = version
+        self.knowledge_base = knowledge_base
+        self.pricing = pricing
+        self.maintenance_intervals = maintenance_intervals
+        self.index = KnowledgeBaseIndex(knowledge_base)
+        self.retriever = BM25Retriever(knowledge_base)
+        self.vectors = KnowledgeVectorIndex(self.retriever)
+        self.vectors.load()
+        self.loaded_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+class KnowledgeStore:
+    """Holds the current KnowledgeSnapshot and swaps in new versions while serving.
+
+    A reload builds the complete new snapshot first and then replaces the
+    reference in one assignment; requests that already took the old snapshot
+    keep using it until they finish. Cached answers carry the snapshot
+    version, so nothing produced from old prices is served after a swap.
+    Reloads are triggered by the file watcher (Config.KB_WATCH_INTERVAL) or
+    the /reload-kb admin command.
+    """
+    def __init__(self, kb_path: str = Config.KB_COMPILED_PATH, pricing_path: str = Config.PRICING_PATH):
+        self.kb_path = kb_path
+        self.pricing_path = pricing_path
+        self.watched_paths = [kb_path, pricing_path, Config.VECTOR_INDEX_PATH]
+        self.reload_history = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._mtimes = self._file_mtimes()
+        self.current = self._build_snapshot(1)
+        self._apply(self.current)
+
+    def _file_mtimes(self) -> dict:
+        return {path: os.path.getmtime(path) if path and os.path.exists(path) else None
+                for path in self.watched_paths}
+
+    def _load_pricing(self, strict: bool = False) -> dict:
+        """Return the default price tables with the pricing file's overrides applied.
+
+        Like load_knowledge_base, a file that cannot be read or does not fit
+        the default tables is logged and the built-in prices are used; with
+        strict=True it raises instead, so a reload keeps the previous snapshot.
+        """
+        pricing = json.loads(json.dumps(CostCalculationSystem.DEFAULT_PRICING))
+        if not self.pricing_path or not os.path.exists(self.pricing_path):
+            return pricing
+        try:
+            with open(self.pricing_path, encoding="utf-8") as pricing_file:
+                overrides = json.load(pricing_file)
+            if not isinstance(overrides, dict):
+                raise ValueError("expected an object of pricing tables")
+            for table, values in overrides.items():
+                default = pricing.get(table)
+                if isinstance(default, dict) and not isinstance(values, dict):
+                    raise ValueError(f"{table} must be an object")
+                if isinstance(default, (int, float)) and (isinstance(values, bool) or
+                                                          not isinstance(values, (int, float))):
+                    raise ValueError(f"{table} must be a number")
+        except (OSError, ValueError) as e:
+            logger.error(f"Pricing load error: {str(e)}")
+            if strict:
+                raise ValueError(f"Invalid pricing file {self.pricing_path}: {str(e)}")
+            return pricing
+        for table, values in overrides.items():
+            if isinstance(values, dict) and isinstance(pricing.get(table), dict):
+                pricing[table].update(values)
+            else:
+                pricing[table] = values
+        return pricing
+
+    def _build_snapshot(self, version: int, strict: bool = False) -> KnowledgeSnapshot:
+        knowledge_base = load_knowledge_base(self.kb_path, strict=strict)
+        maintenance_intervals = getattr(knowledge_base, "maintenance_intervals", None) or Config.MAINTENANCE_INTERVALS
+        return KnowledgeSnapshot(version, knowledge_base, self._load_pricing(strict), maintenance_intervals)
+
+    @staticmethod
+    def _apply(snapshot: KnowledgeSnapshot) -> None:
+        Config.MAINTENANCE_INTERVALS = snapshot.maintenance_intervals
+
+    def reload(self, reason: str = "manual") -> dict:
+        """Build the next snapshot, swap it in and invalidate answers from older versions."""
+        with self._lock:
+            start_time = time.perf_counter()
+            # Remember the files even if this version is rejected, so the watcher waits for the next change
+            self._mtimes = self._file_mtimes()
+            try:
+                snapshot = self._build_snapshot(self.current.version + 1, strict=True)
+            except (OSError, ValueError) as e:
+                logger.error(f"Knowledge reload error: {str(e)}")
+                raise
+            previous = self.current
+            self.current = snapshot
+            self._apply(snapshot)
+            response_cache.clear()
+            semantic_cache.clear()
+            duration = time.perf_counter() - start_time
+            inference_metrics.record("kb_reload_seconds", duration)
+            record = {
+                "version": snapshot.version,
+                "previous_version": previous.version,
+                "reason": reason,
+                "articles": len(snapshot.knowledge_base),
+                "vector_index": snapshot.vectors.is_loaded,
+                "duration_seconds": round(duration, 3),
+                "loaded_at": snapshot.loaded_at
+            }
+            self.reload_history.append(record)
+        logger.info(f"Knowledge base v{snapshot.version} loaded in {duration:.2f}s ({reason})")
+        return record
+
+    def has_changed(self) -> bool:
+        return self._file_mtimes() != self._mtimes
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if self.has_changed():
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.reload, "file change")
+                except Exception as e:
+                    logger.error(f"Knowledge watcher error: {str(e)}")
+
+    def start_watcher(self, interval: float = Config.KB_WATCH_INTERVAL) -> None:
+        """Poll the knowledge, pricing and vector files for changes from the running loop."""
+        if interval > 0 and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch(interval))
+
+    def get_stats(self) -> dict:
+        return {
+            "version": self.current.version,
+            "loaded_at": self.current.loaded_at,
+            "compiled": isinstance(self.current.knowledge_base, CompiledKnowledgeBase),
+            "storage": self.current.knowledge_base.get_stats()
+            if isinstance(self.current.knowledge_base, CompiledKnowledgeBase) else None,
+            "reloads": list(self.reload_history)
+        }
+
+knowledge_store = KnowledgeStore()
+
+# Context Window Management
+
+class ContextWindowManager:
+    """Assembles prompts that always fit Config.N_CTX together with the generation budget.
+
+    Token counts come from the model's own tokenizer and are cached per
+    message. The newest turns are kept verbatim, older ones are condensed to
+    their question and the opening of their answer, and whatever still does
+    not fit is dropped.
+    """
+    def __init__(self, registry: ModelRegistry, n_ctx: int = Config.N_CTX,
+                 max_tokens: int = Config.MAX_TOKENS,
+                 verbatim_turns: int = Config.VERBATIM_HISTORY_TURNS,
+                 cache_size: int = Config.TOKEN_COUNT_CACHE_SIZE):
+        self.registry = registry
+        self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+        self.verbatim_turns = verbatim_turns
+        self.cache_size = cache_size
+        self.token_counts = OrderedDict()
+        self.stats = {
+            "count_cache_hits": 0,
+            "count_cache_misses": 0,
+            "turns_summarized": 0,
+            "turns_dropped": 0,
+            "knowledge_truncated": 0
+        }
+
+    def _model(self) -> Optional[Llama]:
+        # Never trigger a model load from the event loop just to count tokens
+        return self.registry.get_model() if self.registry.is_loaded() else None
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the model's tokenizer, caching the result per message."""
+        cached = self.token_counts.get(text)
+        if cached is not None:
+            self.token_counts.move_to_end(text)
+            self.stats["count_cache_hits"] += 1
+            return cached
+        llm = self._model()
+        if llm is None:
+            # Rough estimate until the tokenizer is available; not cached
+            return max(1, len(text) // 3)
+        self.stats["count_cache_misses"] += 1
+        count = len(llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+        self.token_counts[text] = count
+        if len(self.token_counts) > self.cache_size:
+            self.token_counts.popitem(last=False)
+        return count
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text to at most max_tokens tokens."""
+        if max_tokens <= 0:
+            return ""
+        llm = self._model()
+        if llm is None:
+            return text[:max_tokens * 3]
+        tokens = llm.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+        if len(tokens) <= max_tokens:
+            return text
+        return llm.detokenize(tokens[:max_tokens]).decode("utf-8", errors="ignore")
+
+    def summarize_turn(self, turn: dict) -> dict:
+        """Condense an older turn; the summary is stored so later prompts repeat it verbatim."""
+        if "summary" not in turn:
+            first_sentence = re.split(r"(?<=[.!?؟])\s|\n", turn["answer"].strip(), maxsplit=1)[0]
+            turn["summary"] = {
+                "query": self.truncate(turn["query"], Config.SUMMARY_TURN_TOKENS),
+                "answer": self.truncate(first_sentence, Config.SUMMARY_TURN_TOKENS)
+            }
+        return turn["summary"]
+
+    def _turn_cost(self, user_content: str, answer: str) -> tuple:
+        parts = format_chat_turn("user", user_content) + format_chat_turn("assistant", answer)
+        cost = (self.count_tokens(format_chat_turn("user", user_content)) +
+                self.count_tokens(format_chat_turn("assistant", answer)))
+        return parts, cost
+
+    def build_prompt(self, user_message: str, language: str = "ar", knowledge: str = "",
+                     history: Optional[list] = None) -> tuple:
+        """Return (prompt, max_tokens, user_content) with prompt tokens + max_tokens <= n_ctx.
+
+        user_content is the user turn as it went into the prompt, after any
+        truncation; store it in history to replay the turn unchanged.
+        """
+        budget = self.n_ctx - self.max_tokens
+        system_turn = format_chat_turn("system", Config.SYSTEM_PROMPT)
+        assistant_header = "<|start_header_id|>assistant<|end_header_id|>\n\n"
+        # One extra token for BOS
+        used = 1 + self.count_tokens(system_turn) + self.count_tokens(assistant_header)
+
+        user_content = build_user_content(user_message, language, knowledge)
+        user_turn = format_chat_turn("user", user_content)
+        user_tokens = self.count_tokens(user_turn)
+        if used + user_tokens > budget and knowledge:
+            bare_tokens = self.count_tokens(format_chat_turn("user", build_user_content(user_message, language)))
+            knowledge = self.truncate(knowledge, budget - used - bare_tokens - 16)
+            self.stats["knowledge_truncated"] += 1
+            user_content = build_user_content(user_message, language, knowledge)
+            user_turn = format_chat_turn("user", user_content)
+            user_tokens = self.count_tokens(user_turn)
+        if used + user_tokens > budget:
+            user_message = self.truncate(user_message, budget - used - 32)
+            user_content = build_user_content(user_message, language)
+            user_turn = format_chat_turn("user", user_content)
+            user_tokens = self.count_tokens(user_turn)
+        used += user_tokens
+
+        history = history or []
+        history_parts = []
+        for age, turn in enumerate(reversed(history)):
+            if age < self.verbatim_turns:
+                parts, cost = self._turn_cost(turn.get("user_content", turn["query"]), turn["answer"])
+                if used + cost <= budget:
+                    history_parts.append(parts)
+                    used += cost
+                    continue
+            summary = self.summarize_turn(turn)
+            parts, cost = self._turn_cost(summary["query"], summary["answer"])
+            if used + cost > budget:
+                self.stats["turns_dropped"] += len(history) - age
+                break
+            history_parts.append(parts)
+            used += cost
+            self.stats["turns_summarized"] += 1
+
+        prompt = system_turn + "".join(reversed(history_parts)) + user_turn + assistant_header
+        inference_metrics.record("prompt_tokens", used)
+        return prompt, min(self.max_tokens, self.n_ctx - used), user_content
+
+# Response Cache
+
+class ResponseCache:
+    """LRU + TTL cache of complete LLM answers for repeated standalone questions.
+
+    Keys combine the normalized question, its language and query type, and a
+    hash of the model settings that shape the answer, so changing the model
+    or prompt never serves stale text. Entries expire after
+    DeploymentConfig timeouts["cache"] seconds.
+    """
+    def __init__(self, max_entries: int = Config.RESPONSE_CACHE_SIZE, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl is not None else DeploymentConfig().config["timeouts"]["cache"]
+        self.config_hash = self.compute_config_hash()
+        self.entries = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+
+    @staticmethod
+    def compute_config_hash() -> str:
+        settings = "|".join(str(value) for value in (
+            Config.MODEL_PATH, Config.TEMPERATURE, Config.MAX_TOKENS, Config.N_CTX, Config.SYSTEM_PROMPT
+        ))
+        return hashlib.sha1(settings.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Normalize Arabic spelling, drop punctuation and collapse whitespace."""
+        text = re.sub(r"[^\w\s]", " ", arabic_normalizer.normalize(query))
+        return " ".join(text.split())
+
+    def make_key(self, query: str, language: str, query_type: str, version: int = 0) -> tuple:
+        return (self.normalize_query(query), language, query_type, self.config_hash, version)
+
+    def get(self, key: tuple) -> Optional[str]:
+        """Return the cached answer or None, counting the hit or miss."""
+        entry = self.entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] > self.ttl:
+            del self.entries[key]
+            self.stats["expired"] += 1
+            entry = None
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[0]
+
+    def put(self, key: tuple, answer: str) -> None:
+        if not answer.strip():
+            return
+        self.entries[key] = (answer, time.monotonic())
+        self.entries.move_to_end(key)
+        self.stats["stores"] += 1
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+# Process-wide cache shared by every Chainlit session
+response_cache = ResponseCache()
+
+# Semantic Answer Cache
+
+class SemanticCache:
+    """Answers paraphrased opening questions from embeddings of earlier ones.
+
+    Query embeddings from the small "embedding" model are kept L2-normalized
+    in a fixed-size float32 matrix, so a lookup is one matrix-vector product.
+    A hit needs cosine similarity >= threshold, the same language, query type
+    and model settings, and the same numbers in both questions (5000 km is
+    not 10000 km). The least recently used row is overwritten when full.
+    """
+    def __init__(self, registry: ModelRegistry, max_entries: int = Config.SEMANTIC_CACHE_SIZE,
+                 threshold: float = Config.SEMANTIC_CACHE_THRESHOLD, ttl: Optional[float] = None,
+                 audit_size: int = 200):
+        self.registry = registry
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl if ttl is not None else DeploymentConfig().config["timeouts"]["cache"]
+        self.config_hash = ResponseCache.compute_config_hash()
+        self.vectors = None
+        self.created = np.full(max_entries, -np.inf)
+        self.last_used = np.zeros(max_entries)
+        self.entries = [None] * max_entries
+        self.audit_log = deque(maxlen=audit_size)
+        self.available = None
+        # The embedding model has its own lock: lookups and stores run on the event loop and
+        # must never wait for an embedding running on a worker thread
+        self._embed_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0, "bypassed": 0,
+                      "number_mismatches": 0, "false_hits": 0}
+
+    def _embedding_model(self) -> Optional[Llama]:
+        if self.available is None:
+            try:
+                self.registry.get_model("embedding")
+                self.available = True
+            except ModelLoadError as e:
+                logger.warning(f"Semantic cache disabled: {str(e)}")
+                self.available = False
+        return self.registry.get_model("embedding") if self.available else None
+
+    def embed(self, text: str, prefix: str = Config.EMBEDDING_QUERY_PREFIX) -> Optional[np.ndarray]:
+        """Return the normalized embedding of a query, or None without an embedding model.
+
+        e5 embeddings are only comparable (and the similarity threshold only
+        meaningful) with the "query: " / "passage: " prefix they were trained on.
+        """
+        with self._embed_lock:
+            llm = self._embedding_model()
+            if llm is None:
+                return None
+            start_time = time.perf_counter()
+            vector = np.asarray(llm.embed(prefix + text), dtype=np.float32).ravel()
+            inference_metrics.record("query_embedding_seconds", time.perf_counter() - start_time)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @staticmethod
+    def _numbers(text: str) -> set:
+        return set(re.findall(r"\d+", arabic_normalizer.normalize(text)))
+
+    def lookup(self, query: str, vector: Optional[np.ndarray], language: str, query_type: str,
+               version: int = 0) -> Optional[str]:
+        """Return the answer of the most similar cached query, or None."""
+        start_time = time.perf_counter()
+        answer = None
+        if vector is not None and self.vectors is not None:
+            with self._lock:
+                valid = self.created > time.monotonic() - self.ttl
+                if valid.any():
+                    similarity = np.where(valid, self.vectors @ vector, -1.0)
+                    for index in np.argsort(similarity)[::-1][:4]:
+                        if similarity[index] < self.threshold:
+                            break
+                        cached_query, cached_answer, *cached_context = self.entries[index]
+                        if cached_context != [language, query_type, self.config_hash, version]:
+                            continue
+                        if self._numbers(cached_query) != self._numbers(query):
+                            self.stats["number_mismatches"] += 1
+                            continue
+                        self.last_used[index] = time.monotonic()
+                        answer = cached_answer
+                        self.audit_log.append({
+                            "id": self.stats["hits"],
+                            "query": query,
+                            "cached_query": cached_query,
+                            "similarity": round(float(similarity[index]), 4),
+                            "slot": int(index)
+                        })
+                        break
+        inference_metrics.record("semantic_cache_lookup_seconds", time.perf_counter() - start_time)
+        self.stats["hits" if answer is not None else "misses"] += 1
+        return answer
+
+    def add(self, query: str, vector: Optional[np.ndarray], answer: str, language: str, query_type: str,
+            version: int = 0) -> None:
+        if vector is None or not answer.strip():
+            return
+        with self._lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            expired = self.created <= time.monotonic() - self.ttl
+            if expired.any():
+                index = int(np.argmax(expired))
+            else:
+                index = int(np.argmin(self.last_used))
+                self.stats["evicted"] += 1
+            self.vectors[index] = vector
+            self.created[index] = self.last_used[index] = time.monotonic()
+            self.entries[index] = (query, answer, language, query_type, self.config_hash, version)
+            self.stats["stores"] += 1
+
+    def mark_false_hit(self, audit_id: int) -> bool:
+        """Record a reviewed hit as wrong and drop the cached answer it served."""
+        for record in self.audit_log:
+            if record["id"] == audit_id and not record.get("false_hit"):
+                record["false_hit"] = True
+                self.stats["false_hits"] += 1
+                with self._lock:
+                    if self.entries[record["slot"]] and self.entries[record["slot"]][0] == record["cached_query"]:
+                        self.created[record["slot"]] = -np.inf
+                return True
+        return False
+
+    def clear(self) -> None:
+        with self._lock:
+            self.created[:] = -np.inf
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": int((self.created > time.monotonic() - self.ttl).sum()),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "false_hit_rate": round(self.stats["false_hits"] / self.stats["hits"], 4) if self.stats["hits"] else 0.0,
+            "threshold": self.threshold
+        }
+
+semantic_cache = SemanticCache(model_registry)
+
+# Prompt KV Cache
+
+class PromptCache:
+    """Reuses llama.cpp KV state for the fixed system prompt and for each session's conversation.
+
+    The state after the system turn is evaluated once and restored for every
+    new request; after each answer the session's state is kept so a follow-up
+    turn only has to evaluate its new tokens.
+    """
+    def __init__(self, max_session_bytes: int = Config.SESSION_STATE_CACHE_MB * 1024 * 1024):
+        self.max_session_bytes = max_session_bytes
+        self.prefix_state = None
+        self.loaded_session = None
+        self.session_states = OrderedDict()
+        self.session_bytes = 0
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "session_hits": 0,
+            "prefill_tokens_saved": 0,
+            "prefill_tokens_evaluated": 0
+        }
+
+    @staticmethod
+    def tokenize(llm: Llama, prompt: str) -> list:
+        """Tokenize a chat-formatted prompt, keeping special tokens intact."""
+        return llm.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+
+    @staticmethod
+    def common_prefix_length(cached: Sequence[int], tokens: Sequence[int]) -> int:
+        """Length of the shared token prefix of two sequences."""
+        length = 0
+        for cached_token, token in zip(cached, tokens):
+            if cached_token != token:
+                break
+            length += 1
+        return length
+
+    @staticmethod
+    def _snapshot(llm: Llama):
+        """Save the model state without the per-token logits, which are recomputed on restore."""
+        state = llm.save_state()
+        state.scores = state.scores[-1:].copy()
+        return state
+
+    def _ensure_prefix(self, llm: Llama) -> None:
+        """Evaluate the system turn once and keep its KV state."""
+        if self.prefix_state is None:
+            prefix_tokens = self.tokenize(llm, format_chat_turn("system", Config.SYSTEM_PROMPT))
+            llm.reset()
+            llm.eval(prefix_tokens)
+            self.prefix_state = self._snapshot(llm)
+            self.loaded_session = None
+            logger.info(f"Cached system prompt KV state ({len(prefix_tokens)} tokens, "
+                        f"{self.prefix_state.llama_state_size / (1024 * 1024):.1f} MB)")
+
+    def prepare(self, llm: Llama, prompt: str, session_id: Optional[str] = None) -> list:
+        """Restore the cached state sharing the longest prefix with the prompt and return its tokens."""
+        self._ensure_prefix(llm)
+        tokens = self.tokenize(llm, prompt)
+        current = self.common_prefix_length(llm.input_ids[:llm.n_tokens], tokens)
+        candidates = [("prefix", self.prefix_state)]
+        if session_id in self.session_states:
+            candidates.append(("session", self.session_states[session_id]))
+            self.session_states.move_to_end(session_id)
+        best_kind, best_state, best_length = None, None, current
+        for kind, state in candidates:
+            length = self.common_prefix_length(state.input_ids[:state.n_tokens], tokens)
+            if length > best_length:
+                best_kind, best_state, best_length = kind, state, length
+        if best_state is not None:
+            llm.load_state(best_state)
+            self.loaded_session = session_id if best_kind == "session" else None
+        # llama.cpp re-evaluates at least the last prompt token to refresh logits
+        reused = min(best_length, len(tokens) - 1)
+        self.stats["lookups"] += 1
+        if reused > 0:
+            self.stats["hits"] += 1
+            if session_id is not None and self.loaded_session == session_id:
+                self.stats["session_hits"] += 1
+        self.stats["prefill_tokens_saved"] += reused
+        self.stats["prefill_tokens_evaluated"] += len(tokens) - reused
+        return tokens
+
+    def store_session(self, llm: Llama, session_id: str) -> None:
+        """Keep the session's post-answer state so its next turn only evaluates new tokens."""
+        state = self._snapshot(llm)
+        previous = self.session_states.pop(session_id, None)
+        if previous is not None:
+            self.session_bytes -= previous.llama_state_size
+        self.session_states[session_id] = state
+        self.session_bytes += state.llama_state_size
+        self.loaded_session = session_id
+        while self.session_bytes > self.max_session_bytes and len(self.session_states) > 1:
+            _, evicted = self.session_states.popitem(last=False)
+            self.session_bytes -= evicted.llama_state_size
+
+    def get_stats(self) -> dict:
+        """Hit rate and prefill tokens saved so far."""
+        lookups = self.stats["lookups"]
+        total_prefill = self.stats["prefill_tokens_saved"] + self.stats["prefill_tokens_evaluated"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "session_hit_rate": round(self.stats["session_hits"] / lookups, 4) if lookups else 0.0,
+            "prefill_saved_ratio": round(self.stats["prefill_tokens_saved"] / total_prefill, 4) if total_prefill else 0.0,
+            "cached_sessions": len(self.session_states),
+            "session_cache_mb": round(self.session_bytes / (1024 * 1024), 2)
+        }
+
+# Inference Jobs
+
+# Lower value is dispatched first
+PRIORITY_CLASSES = {
+    "emergency": 0,
+    "normal": 1
+}
+
+class InferenceJob:
+    """A single queued generation request and the channel its tokens come back on."""
+    def __init__(self, prompt: str, max_tokens: int, temperature: float,
+                 loop: asyncio.AbstractEventLoop, priority: str = "normal", sequence: int = 0,
+                 session_id: Optional[str] = None):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.loop = loop
+        self.priority = priority
+        self.sequence = sequence
+        self.session_id = session_id
+        self.tokens = asyncio.Queue()
+        self.cancelled = threading.Event()
+        self.preempted = threading.Event()
+        self.generated = []
+        self.generated_tokens = 0
+        self.submitted_at = time.perf_counter()
+        self.enqueued_at = self.submitted_at
+
+    def sort_key(self) -> tuple:
+        """Priority queue ordering: priority class first, then arrival order."""
+        return (PRIORITY_CLASSES[self.priority], self.sequence)
+
+    def put(self, item) -> None:
+        """Hand a token, exception or end marker back to the event loop (thread-safe)."""
+        self.loop.call_soon_threadsafe(self.tokens.put_nowait, item)
+
+class StopSequenceFilter:
+    """Cuts streamed text at the first stop sequence, as create_completion(stop=...) does.
+
+    Text that could still grow into a stop sequence is held back until the
+    next piece decides it.
+    """
+    def __init__(self, stop_sequences: Sequence = Config.STOP_SEQUENCES):
+        self.stop_sequences = [stop for stop in stop_sequences if stop]
+        self.buffer = ""
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        """Return the text that is safe to emit now."""
+        self.buffer += text
+        positions = [position for position in (self.buffer.find(stop) for stop in self.stop_sequences)
+                     if position >= 0]
+        if positions:
+            text, self.buffer, self.stopped = self.buffer[:min(positions)], "", True
+            return text
+        held = 0
+        for stop in self.stop_sequences:
+            for length in range(min(len(stop) - 1, len(self.buffer)), held, -1):
+                if self.buffer.endswith(stop[:length]):
+                    held = length
+                    break
+        text, self.buffer = self.buffer[:len(self.buffer) - held], self.buffer[len(self.buffer) - held:]
+        return text
+
+    def flush(self) -> str:
+        text, self.buffer = self.buffer, ""
+        return text
+
+# Continuous Batching Engine
+
+class BatchSequence:
+    """Decoding state of one job inside the batched engine."""
+    def __init__(self, job: InferenceJob, slot: int, prompt_tokens: list, n_prefix: int, sampler):
+        self.job = job
+        self.slot = slot
+        self.pending = prompt_tokens[n_prefix:]
+        self.pos = n_prefix
+        self.sampler = sampler
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.stops = StopSequenceFilter()
+        self.remaining = job.max_tokens - job.generated_tokens
+        self.next_token = None
+        self.batch_index = -1
+
+class BatchedInferenceEngine:
+    """Decodes several sessions' generations together in one llama.cpp context.
+
+    Every sequence gets its own KV sequence id; id 0 holds the system prompt,
+    which is copied into each new sequence instead of being re-evaluated.
+    Each decode step feeds one token for every generating sequence plus
+    prompt chunks of newly admitted ones, up to Config.BATCH_SIZE tokens, so
+    requests join and leave the batch between steps.
+    """
+    def __init__(self, registry: ModelRegistry, n_parallel: int = Config.N_PARALLEL,
+                 n_batch: int = Config.BATCH_SIZE):
+        self.registry = registry
+        self.n_parallel = n_parallel
+        self.n_batch = n_batch
+        self.ctx = None
+        self.memory = None
+        self.vocab = None
+        self.batch = None
+        self.prefix_tokens = []
+        self.free_slots = list(range(n_parallel, 0, -1))
+        self.active = {}
+        self.pending = queue.Queue()
+        self.running = False
+        self.on_release = None
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        """Free the batch and the multi-sequence context."""
+        if self.batch is not None:
+            llama_cpp.llama_batch_free(self.batch)
+            self.batch = None
+        if self.ctx is not None:
+            llama_cpp.llama_free(self.ctx)
+            self.ctx = None
+            self.memory = None
+
+    def __del__(self):
+        self.close()
+
+    def claim_run(self) -> bool:
+        """Mark the engine as running; False if a worker is already driving it."""
+        with self._lock:
+            if self.running:
+                return False
+            self.running = True
+            return True
+
+    def _ensure_context(self, llm: Llama) -> None:
+        """Create the multi-sequence context on the shared weights and cache the system prompt."""
+        if self.ctx is not None:
+            return
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = Config.N_CTX * self.n_parallel
+        params.n_batch = self.n_batch
+        params.n_ubatch = self.n_batch
+        params.n_seq_max = self.n_parallel + 1
+        params.n_threads = Config.N_THREADS
+        params.n_threads_batch = Config.N_THREADS
+        params.kv_unified = True
+        self.ctx = llama_cpp.llama_init_from_model(llm.model, params)
+        if self.ctx is None:
+            raise ModelLoadError("Could not create the batched llama.cpp context")
+        self.memory = llama_cpp.llama_get_memory(self.ctx)
+        self.vocab = llama_cpp.llama_model_get_vocab(llm.model)
+        self.batch = llama_cpp.llama_batch_init(self.n_batch, 0, 1)
+        self.prefix_tokens = PromptCache.tokenize(llm, format_chat_turn("system", Config.SYSTEM_PROMPT))
+        self._decode([(token, pos, 0, False) for pos, token in enumerate(self.prefix_tokens)])
+
+    def _decode(self, entries: list) -> None:
+        """Run llama_decode over (token, pos, seq_id, wants_logits) entries."""
+        for start in range(0, len(entries), self.n_batch):
+            chunk = entries[start:start + self.n_batch]
+            self.batch.n_tokens = len(chunk)
+            for i, (token, pos, seq_id, logits) in enumerate(chunk):
+                self.batch.token[i] = token
+                self.batch.pos[i] = pos
+                self.batch.n_seq_id[i] = 1
+                self.batch.seq_id[i][0] = seq_id
+                self.batch.logits[i] = logits
+            status = llama_cpp.llama_decode(self.ctx, self.batch)
+            if status != 0:
+                raise ResponseGenerationError(f"llama_decode failed with status {status}")
+
+    @staticmethod
+    def _build_sampler(temperature: float):
+        """Per-sequence sampler chain matching llama-cpp-python's completion defaults."""
+        sampler = llama_cpp.llama_sampler_chain_init(llama_cpp.llama_sampler_chain_default_params())
+        if temperature <= 0:
+            llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_greedy())
+            return sampler
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_top_k(40))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_top_p(0.95, 1))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_min_p(0.05, 1))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_temp(temperature))
+        llama_cpp.llama_sampler_chain_add(sampler, llama_cpp.llama_sampler_init_dist(llama_cpp.LLAMA_DEFAULT_SEED))
+        return sampler
+
+    def _admit_pending(self, llm: Llama) -> None:
+        """Move handed-off jobs into free sequence slots."""
+        while self.free_slots:
+            try:
+                job = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            if job.cancelled.is_set():
+                job.put(None)
+                self.on_release(job, True)
+                continue
+            tokens = PromptCache.tokenize(llm, job.prompt + "".join(job.generated))
+            # Always leave at least one prompt token to evaluate so there are fresh logits
+            n_prefix = min(PromptCache.common_prefix_length(self.prefix_tokens, tokens), len(tokens) - 1)
+            slot = self.free_slots.pop()
+            llama_cpp.llama_memory_seq_rm(self.memory, slot, -1, -1)
+            if n_prefix > 0:
+                llama_cpp.llama_memory_seq_cp(self.memory, 0, slot, 0, n_prefix)
+            self.active[slot] = BatchSequence(job, slot, tokens, n_prefix, self._build_sampler(job.temperature))
+            inference_metrics.increment("prefill_tokens_saved", n_prefix)
+
+    def _release(self, sequence: BatchSequence, finished: bool) -> None:
+        """Free a sequence slot; unfinished (preempted) jobs go back to the executor."""
+        llama_cpp.llama_memory_seq_rm(self.memory, sequence.slot, -1, -1)
+        llama_cpp.llama_sampler_free(sequence.sampler)
+        del self.active[sequence.slot]
+        self.free_slots.append(sequence.slot)
+        tail = sequence.stops.flush()
+        if tail:
+            sequence.job.generated.append(tail)
+            sequence.job.put(tail)
+        if finished:
+            sequence.job.put(None)
+        self.on_release(sequence.job, finished)
+
+    def _step(self, llm: Llama) -> None:
+        """One decode step over every active sequence."""
+        entries = []
+        for sequence in self.active.values():
+            sequence.batch_index = -1
+            if sequence.next_token is not None:
+                sequence.batch_index = len(entries)
+                entries.append((sequence.next_token, sequence.pos, sequence.slot, True))
+                sequence.pos += 1
+        for sequence in self.active.values():
+            budget = self.n_batch - len(entries)
+            if sequence.next_token is not None or not sequence.pending or budget <= 0:
+                continue
+            chunk, sequence.pending = sequence.pending[:budget], sequence.pending[budget:]
+            for i, token in enumerate(chunk):
+                wants_logits = not sequence.pending and i == len(chunk) - 1
+                if wants_logits:
+                    sequence.batch_index = len(entries)
+                entries.append((token, sequence.pos, sequence.slot, wants_logits))
+                sequence.pos += 1
+        step_start = time.perf_counter()
+        self._decode(entries)
+        produced = 0
+        for sequence in list(self.active.values()):
+            if sequence.batch_index < 0:
+                continue
+            job = sequence.job
+            token = llama_cpp.llama_sampler_sample(sequence.sampler, self.ctx, sequence.batch_index)
+            if llama_cpp.llama_vocab_is_eog(self.vocab, token) or job.cancelled.is_set():
+                self._release(sequence, True)
+                continue
+            produced += 1
+            sequence.remaining -= 1
+            job.generated_tokens += 1
+            text = sequence.stops.feed(sequence.decoder.decode(llm.detokenize([token])))
+            if text:
+                job.generated.append(text)
+                job.put(text)
+            if sequence.remaining <= 0 or sequence.stops.stopped:
+                self._release(sequence, True)
+            elif job.preempted.is_set():
+                self._release(sequence, False)
+            else:
+                sequence.next_token = token
+        step_time = time.perf_counter() - step_start
+        inference_metrics.record("batch_size", len(entries))
+        inference_metrics.record("batch_step_seconds", step_time)
+        if produced and step_time > 0:
+            inference_metrics.record("batch_tokens_per_second", produced / step_time)
+
+    def run(self) -> None:
+        """Worker-thread loop: admit, decode, stream, until there is no work left."""
+        try:
+            llm = self.registry.get_model()
+            self._ensure_context(llm)
+        except Exception as e:
+            logger.error(f"Batched inference setup error: {str(e)}")
+            self._fail_all(e)
+            return
+        while True:
+            self._admit_pending(llm)
+            if not self.active:
+                with self._lock:
+                    if self.pending.empty():
+                        self.running = False
+                        return
+                continue
+            try:
+                self._step(llm)
+            except Exception as e:
+                logger.error(f"Batched inference error: {str(e)}")
+                for sequence in list(self.active.values()):
+                    sequence.job.put(e)
+                    self._release(sequence, True)
+
+    def _fail_all(self, error: Exception) -> None:
+        """Fail every waiting job when the engine cannot start."""
+        with self._lock:
+            self.running = False
+            while not self.pending.empty():
+                job = self.pending.get_nowait()
+                job.put(error)
+                job.put(None)
+                self.on_release(job, True)
+
+# Speculative Decoding
+
+class PromptLookupDrafter:
+    """Drafts tokens by finding the latest earlier occurrence of the current n-gram."""
+    def __init__(self, max_ngram_size: int = 3):
+        self.max_ngram_size = max_ngram_size
+
+    def propose(self, tokens: np.ndarray, count: int) -> list:
+        length = len(tokens)
+        for ngram_size in range(min(self.max_ngram_size, length - 1), 0, -1):
+            windows = np.lib.stride_tricks.sliding_window_view(tokens[:-1], ngram_size)
+            matches = np.nonzero(np.all(windows == tokens[-ngram_size:], axis=1))[0]
+            if len(matches):
+                start = int(matches[-1]) + ngram_size
+                return tokens[start:start + count].tolist()
+        return []
+
+class DraftModelDrafter:
+    """Drafts tokens greedily with a small GGUF model sharing the main model's vocabulary."""
+    def __init__(self, registry: ModelRegistry):
+        self.registry = registry
+
+    def propose(self, tokens: np.ndarray, count: int) -> list:
+        draft = self.registry.get_model("draft")
+        proposal = []
+        for token in draft.generate(tokens.tolist(), temp=0.0):
+            proposal.append(token)
+            if len(proposal) >= count:
+                break
+        return proposal
+
+class SpeculativeDecoder:
+    """Generation with the 8B model while a cheap drafter proposes the next few tokens.
+
+    Each step decodes the pending token plus the draft in one batch, then
+    samples every position in order with the sampler chain and seed that
+    create_completion builds (greedy at temperature 0). Draft tokens are kept
+    while the sampled token equals them, and the first mismatch becomes the
+    next pending token. The sampler draws once per emitted token, exactly as
+    in plain decoding, so for the same seed the text is identical to
+    create_completion and the same stop sequences end it.
+    """
+    def __init__(self, drafter, draft_tokens: int = Config.SPECULATIVE_DRAFT_TOKENS):
+        self.drafter = drafter
+        self.draft_tokens = draft_tokens
+        self.batch = llama_cpp.llama_batch_init(draft_tokens + 1, 0, 1)
+        self.stats = {"steps": 0, "drafted": 0, "accepted": 0, "emitted": 0}
+
+    def close(self) -> None:
+        """Free the verification batch."""
+        if self.batch is not None:
+            llama_cpp.llama_batch_free(self.batch)
+            self.batch = None
+
+    def __del__(self):
+        self.close()
+
+    def _decode(self, llm: Llama, tokens: list, n_past: int) -> None:
+        self.batch.n_tokens = len(tokens)
+        for i, token in enumerate(tokens):
+            self.batch.token[i] = token
+            self.batch.pos[i] = n_past + i
+            self.batch.n_seq_id[i] = 1
+            self.batch.seq_id[i][0] = 0
+            self.batch.logits[i] = True
+        status = llama_cpp.llama_decode(llm.ctx, self.batch)
+        if status != 0:
+            raise ResponseGenerationError(f"llama_decode failed with status {status}")
+        llm.input_ids[n_past:n_past + len(tokens)] = tokens
+        llm.n_tokens = n_past + len(tokens)
+
+    @staticmethod
+    def _sampler(llm: Llama, temperature: float, seed: Optional[int]):
+        """The seed and sampler chain create_completion(temperature=..., seed=...) would use."""
+        llm.set_seed(seed if seed is not None else random.Random(llm._seed).randint(0, 2 ** 32))
+        return llm._init_sampler(temp=temperature)
+
+    def generate(self, llm: Llama, prompt_tokens: list, max_tokens: int, temperature: float = 0.0,
+                 seed: Optional[int] = None):
+        """Yield (text, finish_reason) pieces for up to max_tokens tokens.
+
+        finish_reason is None until the last piece, then "stop" or "length"
+        like a create_completion stream chunk.
+        """
+        sampler = self._sampler(llm, temperature, seed)
+        try:
+            yield from self._generate(llm, sampler, prompt_tokens, max_tokens)
+        finally:
+            sampler.close()
+
+    def _generate(self, llm: Llama, sampler, prompt_tokens: list, max_tokens: int):
+        vocab = llama_cpp.llama_model_get_vocab(llm.model)
+        memory = llama_cpp.llama_get_memory(llm.ctx)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        stops = StopSequenceFilter()
+        # Prefill only what the restored KV state does not already hold
+        reused = min(PromptCache.common_prefix_length(llm.input_ids[:llm.n_tokens], prompt_tokens),
+                     len(prompt_tokens) - 1)
+        llm.n_tokens = reused
+        llm.eval(prompt_tokens[reused:])
+        history = list(prompt_tokens)
+        pending = sampler.sample(llm._ctx, -1)
+        emitted = 0
+        tail = ""
+        finish_reason = "stop"
+        while not llama_cpp.llama_vocab_is_eog(vocab, pending):
+            emitted += 1
+            self.stats["emitted"] += 1
+            history.append(pending)
+            text = stops.feed(decoder.decode(llm.detokenize([pending])))
+            if stops.stopped:
+                tail = text
+                break
+            if emitted >= max_tokens or llm.n_tokens + 1 >= llm.n_ctx():
+                tail = text
+                finish_reason = "length"
+                break
+            if text:
+                yield text, None
+            budget = min(self.draft_tokens, max_tokens - emitted, llm.n_ctx() - llm.n_tokens - 2)
+            draft = self.drafter.propose(np.asarray(history, dtype=np.intc), budget) if budget > 0 else []
+            n_past = llm.n_tokens
+            self._decode(llm, [pending] + draft, n_past)
+            self.stats["steps"] += 1
+            self.stats["drafted"] += len(draft)
+            accepted = 0
+            for i in range(len(draft) + 1):
+                token = sampler.sample(llm._ctx, i)
+                if i < len(draft) and token == draft[i] and not llama_cpp.llama_vocab_is_eog(vocab, token) \
+                        and emitted + 1 < max_tokens:
+                    accepted += 1
+                    emitted += 1
+                    self.stats["emitted"] += 1
+                    history.append(token)
+                    text = stops.feed(decoder.decode(llm.detokenize([token])))
+                    if stops.stopped:
+                        tail = text
+                        break
+                    if text:
+                        yield text, None
+                    continue
+                pending = token
+                break
+            self.stats["accepted"] += accepted
+            # Drop the rejected draft positions from the KV cache
+            keep = n_past + 1 + accepted
+            if keep < llm.n_tokens:
+                llama_cpp.llama_memory_seq_rm(memory, 0, keep, -1)
+                llm.n_tokens = keep
+            if stops.stopped:
+                break
+        yield tail + stops.flush(), finish_reason
+
+    def get_stats(self) -> dict:
+        drafted = self.stats["drafted"]
+        return {
+            **self.stats,
+            "acceptance_rate": round(self.stats["accepted"] / drafted, 4) if drafted else 0.0,
+            "tokens_per_step": round(self.stats["emitted"] / self.stats["steps"], 3) if self.stats["steps"] else 0.0
+        }
+
+# Inference Executor
+
+class InferenceExecutor:
+    """Owns the shared Llama instance and runs generations off the event loop.
+
+    A single llama.cpp context uses Config.N_THREADS compute threads, so the
+    pool runs Config.INFERENCE_WORKERS generations at a time and everything
+    else waits in a priority queue. Each priority class has its own bound and
+    emergency requests preempt a running normal generation, which is resumed
+    from where it stopped once the emergency has been served. With
+    Config.N_PARALLEL > 1 the jobs are handed to a BatchedInferenceEngine and
+    decoded together instead of one after another.
+    """
+    def __init__(self, registry: ModelRegistry, max_queue_size: int = Config.INFERENCE_QUEUE_SIZE,
+                 workers: int = Config.INFERENCE_WORKERS):
+        self.registry = registry
+        self.max_queue_size = max_queue_size
+        self.queue_limits = {
+            "emergency": Config.EMERGENCY_QUEUE_SIZE,
+            "normal": max_queue_size
+        }
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llama-inference")
+        self.prompt_cache = PromptCache()
+        self.batch_engine = BatchedInferenceEngine(registry) if Config.N_PARALLEL > 1 else None
+        self.capacity = Config.N_PARALLEL if self.batch_engine is not None else workers
+        self.speculative = None
+        if self.batch_engine is None and Config.SPECULATIVE_DECODING:
+            drafter = DraftModelDrafter(registry) if Config.SPECULATIVE_DECODING == "draft_model" \
+                else PromptLookupDrafter()
+            self.speculative = SpeculativeDecoder(drafter)
+        self._slots = None
+        self.waiting = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.running_jobs = set()
+        self._sequence = 0
+        self._queue = None
+        self._dispatchers = []
+
+    @property
+    def active_jobs(self) -> int:
+        return len(self.running_jobs)
+
+    def _ensure_started(self) -> None:
+        """Create the queue and dispatcher tasks inside the running event loop."""
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            if self.batch_engine is not None:
+                self._slots = asyncio.Semaphore(self.capacity)
+                self.batch_engine.on_release = self._release_from_engine
+                self._dispatchers = [asyncio.create_task(self._dispatch_batched())]
+            else:
+                self._dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.workers)]
+
+    def submit(self, prompt: str, max_tokens: int = Config.MAX_TOKENS,
+               temperature: float = Config.TEMPERATURE, priority: str = "normal",
+               session_id: Optional[str] = None) -> InferenceJob:
+        """Queue a generation, failing fast when its priority class is full."""
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        self._ensure_started()
+        if self.waiting[priority] >= self.queue_limits[priority]:
+            inference_metrics.increment(f"queue_rejected_{priority}")
+            raise InferenceQueueFullError(
+                f"Inference queue full ({self.waiting[priority]} {priority} requests waiting)"
+            )
+        self._sequence += 1
+        job = InferenceJob(prompt, max_tokens, temperature, asyncio.get_running_loop(),
+                           priority=priority, sequence=self._sequence, session_id=session_id)
+        self._enqueue(job)
+        inference_metrics.increment(f"requests_{priority}")
+        inference_metrics.record("queue_depth", self._queue.qsize())
+        if priority == "emergency":
+            self._preempt_normal_jobs()
+        return job
+
+    def _enqueue(self, job: InferenceJob) -> None:
+        self.waiting[job.priority] += 1
+        self._queue.put_nowait((job.sort_key(), job))
+
+    def _requeue(self, job: InferenceJob) -> None:
+        """Put a preempted job back, ahead of normal work that arrived after it."""
+        job.preempted.clear()
+        job.enqueued_at = time.perf_counter()
+        self._enqueue(job)
+
+    def _dequeued(self, job: InferenceJob) -> None:
+        self.waiting[job.priority] -= 1
+        inference_metrics.record(f"queue_wait_{job.priority}", time.perf_counter() - job.enqueued_at)
+
+    def _preempt_normal_jobs(self) -> None:
+        """Ask running normal generations to yield the model to an emergency."""
+        if self.active_jobs < self.capacity:
+            return
+        for job in self.running_jobs:
+            if job.priority != "emergency" and not job.preempted.is_set():
+                job.preempted.set()
+                inference_metrics.increment("preemptions")
+                break
+
+    async def stream(self, prompt: str, max_tokens: int = Config.MAX_TOKENS,
+                     temperature: float = Config.TEMPERATURE, priority: str = "normal",
+                     session_id: Optional[str] = None):
+        """Yield generated text chunks as the worker produces them."""
+        job = self.submit(prompt, max_tokens, temperature, priority, session_id)
+        try:
+            while True:
+                item = await job.tokens.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stop the worker if the consumer goes away early
+            job.cancelled.set()
+
+    async def generate(self, prompt: str, max_tokens: int = Config.MAX_TOKENS,
+                       temperature: float = Config.TEMPERATURE, priority: str = "normal",
+                       session_id: Optional[str] = None) -> str:
+        """Generate a complete answer without blocking the event loop."""
+        return "".join([chunk async for chunk in
+                        self.stream(prompt, max_tokens, temperature, priority, session_id)])
+
+    async def _dispatch(self) -> None:
+        """Feed queued jobs to the worker pool, most urgent first."""
+        loop = asyncio.get_running_loop()
+        while True:
+            _, job = await self._queue.get()
+            self._dequeued(job)
+            try:
+                if job.cancelled.is_set():
+                    continue
+                self.running_jobs.add(job)
+                try:
+                    finished = await loop.run_in_executor(self.pool, self._run_job, job)
+                finally:
+                    self.running_jobs.discard(job)
+                if finished:
+                    inference_metrics.record("request_latency", time.perf_counter() - job.submitted_at)
+                else:
+                    self._requeue(job)
+            except Exception as e:
+                logger.error(f"Inference dispatch error: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _dispatch_batched(self) -> None:
+        """Hand jobs to the batched engine whenever a sequence slot is free."""
+        loop = asyncio.get_running_loop()
+        window = Config.BATCH_WINDOW_MS / 1000
+        while True:
+            await self._slots.acquire()
+            _, job = await self._queue.get()
+            self._queue.task_done()
+            admitted = [job]
+            if not self.batch_engine.running:
+                # Idle engine: wait briefly so concurrent arrivals share the first prefill
+                deadline = loop.time() + window
+                while not self._slots.locked() and loop.time() < deadline:
+                    await self._slots.acquire()
+                    try:
+                        _, extra = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        self._slots.release()
+                        break
+                    self._queue.task_done()
+                    admitted.append(extra)
+            for job in admitted:
+                self._dequeued(job)
+                if job.cancelled.is_set():
+                    self._slots.release()
+                    continue
+                self.running_jobs.add(job)
+                self.batch_engine.pending.put(job)
+            if self.batch_engine.claim_run():
+                loop.run_in_executor(self.pool, self.batch_engine.run)
+
+    def _release_from_engine(self, job: InferenceJob, finished: bool) -> None:
+        """Called on the worker thread when the engine frees a job's slot."""
+        job.loop.call_soon_threadsafe(self._on_engine_release, job, finished)
+
+    def _on_engine_release(self, job: InferenceJob, finished: bool) -> None:
+        self.running_jobs.discard(job)
+        self._slots.release()
+        if finished:
+            inference_metrics.record("request_latency", time.perf_counter() - job.submitted_at)
+        else:
+            self._requeue(job)
+
+    @staticmethod
+    def count_tokens(llm: Llama, text: str) -> int:
+        return len(llm.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def _run_job(self, job: InferenceJob) -> bool:
+        """Run one generation on the worker thread; return False if it was preempted."""
+        finished = True
+        try:
+            llm = self.registry.get_model()
+            start_time = time.perf_counter()
+            generated = 0
+            prompt_tokens = self.prompt_cache.prepare(llm, job.prompt + "".join(job.generated), job.session_id)
+            remaining = job.max_tokens - job.generated_tokens
+            if self.speculative is not None:
+                stream = self.speculative.generate(llm, prompt_tokens, remaining, temperature=job.temperature)
+            else:
+                stream = ((chunk["choices"][0]["text"], chunk["choices"][0].get("finish_reason"))
+                          for chunk in llm.create_completion(
+                              prompt_tokens,
+                              max_tokens=remaining,
+                              temperature=job.temperature,
+                              stop=Config.STOP_SEQUENCES,
+                              stream=True
+                          ))
+            for text, finish_reason in stream:
+                if job.cancelled.is_set():
+                    break
+                if text:
+                    generated += 1
+                    job.generated.append(text)
+                    job.put(text)
+                # A job whose last chunk has arrived is done, even if an emergency is waiting
+                if finish_reason is not None:
+                    break
+                if job.preempted.is_set():
+                    # The budget is in model tokens, so count what was streamed before resuming
+                    job.generated_tokens = self.count_tokens(llm, "".join(job.generated))
+                    finished = job.generated_tokens >= job.max_tokens
+                    break
+            elapsed = time.perf_counter() - start_time
+            if elapsed > 0:
+                inference_metrics.record("tokens_per_second", generated / elapsed)
+            if finished and job.session_id and not job.cancelled.is_set():
+                self.prompt_cache.store_session(llm, job.session_id)
+        except Exception as e:
+            logger.error(f"Inference error: {str(e)}")
+            job.put(e)
+            finished = True
+        if finished:
+            job.put(None)
+        return finished
+
+    def get_stats(self) -> dict:
+        """Current queue depth per priority class and worker utilisation."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "waiting": dict(self.waiting),
+            "queue_limits": dict(self.queue_limits),
+            "active_jobs": self.active_jobs,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "batching": self.batch_engine is not None,
+            "prompt_cache": self.prompt_cache.get_stats(),
+            "speculative": self.speculative.get_stats() if self.speculative is not None else None,
+            "response_cache": response_cache.get_stats(),
+            "semantic_cache": semantic_cache.get_stats(),
+            "normalizer": arabic_normalizer.get_stats(),
+            "knowledge": knowledge_store.get_stats()
+        }
+
+inference_executor = InferenceExecutor(model_registry)
+
+# Bayesian Diagnosis
+
+class BayesianDiagnosisEngine:
+    """Ranks likely faulty parts for any set of reported symptoms at once.
+
+    The cause tables of AdvancedDiagnosticSystem and VehicleDiagnosticsSystem
+    give P(part | symptom) one symptom at a time. They are compiled once into
+    a symptom x part log-likelihood matrix, P(symptom | part) under equal
+    symptom priors, plus a log prior per part. A case is scored with one sum
+    over its symptom rows and a batch of cases with one matrix product.
+    Smoothing keeps an unrelated symptom from ruling a part out completely.
+    """
+    PART_ALIASES = {"ignition_coils": "ignition_coil"}
+    SYMPTOM_ALIASES = {
+        "no crank": ["not cranking", "won't crank", "الموتور مش بيلف"],
+        "crank no start": ["cranks but won't start", "بتلف ومش بتدور"],
+        "misfire": ["misfiring", "تقطيع في الموتور"]
+    }
+
+    def __init__(self, diagnostic_data: dict = None, diagnostic_patterns: dict = None,
+                 smoothing: float = 1e-3, normalizer: ArabicNormalizer = arabic_normalizer):
+        if diagnostic_data is None:
+            diagnostic_data = AdvancedDiagnosticSystem().diagnostic_data
+        if diagnostic_patterns is None:
+            diagnostic_patterns = VehicleDiagnosticsSystem().diagnostic_patterns
+        self.normalizer = normalizer
+        self.smoothing = smoothing
+        self.symptoms = []
+        self.symptom_ids = {}
+        self.symptom_tests = []
+        self.parts = []
+        self.part_ids = {}
+        self.part_info = []
+        self.phrases = {}
+        weights = {}
+        for system_data in diagnostic_data.values():
+            for symptom_data in system_data.get("symptoms", {}).values():
+                for sub_symptom, problem_data in symptom_data.items():
+                    symptom_id = self._add_symptom(sub_symptom.replace("_", " "), problem_data.get("tests", []))
+                    for cause in problem_data["causes"]:
+                        part_id = self._add_part(cause["part"], cause.get("cost"), [])
+                        weights[symptom_id, part_id] = max(weights.get((symptom_id, part_id), 0.0),
+                                                           cause["probability"])
+        for system_data in diagnostic_patterns.values():
+            for group in system_data.values():
+                tests = [test for cause in group["causes"] for test in cause.get("tests", [])]
+                for pattern in group["patterns"]:
+                    symptom_id = self._add_symptom(pattern["symptom"], tests, pattern.get("ar"))
+                    for cause in group["causes"]:
+                        part_id = self._add_part(cause["component"], cause.get("cost_range"), cause.get("tests", []))
+                        weights[symptom_id, part_id] = max(weights.get((symptom_id, part_id), 0.0),
+                                                           cause["probability"])
+        for symptom, aliases in self.SYMPTOM_ALIASES.items():
+            if symptom in self.symptom_ids:
+                for alias in aliases:
+                    self.phrases[self.normalizer.normalize(alias)] = self.symptom_ids[symptom]
+        likelihood = np.zeros((len(self.symptoms), len(self.parts)))
+        for (symptom_id, part_id), weight in weights.items():
+            likelihood[symptom_id, part_id] = weight
+        # Bayes with equal symptom priors: P(symptom | part) is P(part | symptom) over the part's total mass
+        part_mass = likelihood.sum(axis=0)
+        self.log_prior = np.log(part_mass / part_mass.sum())
+        self.log_likelihood = np.log(likelihood / part_mass + smoothing)
+        self.cause_matrix = likelihood > 0
+        self.automaton = KeywordAutomaton(self.phrases.items())
+        self.stats = {"cases": 0, "batches": 0, "seconds": 0.0}
+
+    def _add_symptom(self, name: str, tests: list, arabic: str = None) -> int:
+        symptom_id = self.symptom_ids.get(name)
+        if symptom_id is None:
+            symptom_id = self.symptom_ids[name] = len(self.symptoms)
+            self.symptoms.append(name)
+            self.symptom_tests.append([])
+        for test in tests:
+            if test not in self.symptom_tests[symptom_id]:
+                self.symptom_tests[symptom_id].append(test)
+        for phrase in (name, arabic):
+            if phrase:
+                self.phrases[self.normalizer.normalize(phrase)] = symptom_id
+        return symptom_id
+
+    def _add_part(self, name: str, cost: str, tests: list) -> int:
+        name = name.lower().replace(" ", "_")
+        name = self.PART_ALIASES.get(name, name)
+        part_id = self.part_ids.get(name)
+        if part_id is None:
+            part_id = self.part_ids[name] = len(self.parts)
+            self.parts.append(name)
+            self.part_info.append({"cost": cost, "tests": []})
+        info = self.part_info[part_id]
+        info["cost"] = info["cost"] or cost
+        info["tests"].extend(test for test in tests if test not in info["tests"])
+        return part_id
+
+    def extract_symptoms(self, text: str) -> list:
+        """Return the known symptoms mentioned in free text, in order of appearance."""
+        return [self.symptoms[symptom_id] for symptom_id in self._extract_ids(text)]
+
+    def _extract_ids(self, text: str) -> list:
+        # Longest phrase wins where phrases overlap ("cranks but won't start" over "won't start")
+        matches = sorted(self.automaton.find_all(self.normalizer.normalize(text)),
+                         key=lambda match: (match[0], match[0] - match[1]))
+        symptom_ids = []
+        covered = 0
+        for start, end, _, symptom_id in matches:
+            if start >= covered:
+                covered = end
+                if symptom_id not in symptom_ids:
+                    symptom_ids.append(symptom_id)
+        return symptom_ids
+
+    def resolve(self, symptoms) -> tuple:
+        """Map symptom names, Arabic patterns or free text to (symptom ids, unknown inputs)."""
+        if isinstance(symptoms, str):
+            symptoms = [symptoms]
+        symptom_ids = []
+        unknown = []
+        for symptom in symptoms:
+            symptom_id = self.phrases.get(self.normalizer.normalize(symptom))
+            found = [symptom_id] if symptom_id is not None else self._extract_ids(symptom)
+            if not found:
+                unknown.append(symptom)
+            symptom_ids.extend(found_id for found_id in found if found_id not in symptom_ids)
+        return symptom_ids, unknown
+
+    def _posterior_matrix(self, case_ids: list) -> np.ndarray:
+        present = np.zeros((len(case_ids), len(self.symptoms)))
+        rows = np.repeat(np.arange(len(case_ids)), [len(symptom_ids) for symptom_ids in case_ids])
+        columns = np.fromiter(itertools.chain.from_iterable(case_ids), dtype=np.intp, count=len(rows))
+        present[rows, columns] = 1.0
+        scores = present @ self.log_likelihood + self.log_prior
+        scores -= scores.max(axis=1, keepdims=True)
+        posterior = np.exp(scores)
+        posterior /= posterior.sum(axis=1, keepdims=True)
+        return posterior
+
+    def posteriors(self, cases: Sequence) -> np.ndarray:
+        """Return the (cases x parts) posterior matrix, columns ordered as self.parts."""
+        return self._posterior_matrix([self.resolve(symptoms)[0] for symptoms in cases])
+
+    def diagnose(self, symptoms, top_k: int = 5) -> dict:
+        """Rank the likely causes for one set of symptoms."""
+        return self.diagnose_batch([symptoms], top_k)[0]
+
+    def diagnose_batch(self, cases: Sequence, top_k: int = 5) -> list:
+        """Rank the likely causes for many symptom sets with one matrix product."""
+        start_time = time.perf_counter()
+        resolved = [self.resolve(symptoms) for symptoms in cases]
+        posterior = self._posterior_matrix([symptom_ids for symptom_ids, _ in resolved])
+        top_k = min(top_k, len(self.parts))
+        if top_k < len(self.parts):
+            top = np.argpartition(-posterior, top_k - 1, axis=1)[:, :top_k]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(posterior, top, axis=1), axis=1), axis=1)
+        else:
+            top = np.argsort(-posterior, axis=1)
+        results = []
+        for (symptom_ids, unknown), part_ids, case_posterior in zip(resolved, top.tolist(), posterior):
+            tests = list(dict.fromkeys(itertools.chain(
+                *(self.part_info[part_id]["tests"] for part_id in part_ids),
+                *(self.symptom_tests[symptom_id] for symptom_id in symptom_ids))))
+            best = case_posterior[part_ids[0]] if part_ids else 0.0
+            results.append({
+                "possible_causes": [
+                    {
+                        "part": self.parts[part_id],
+                        "confidence": round(float(case_posterior[part_id]) * 100, 2),
+                        "cost": self.part_info[part_id]["cost"]
+                    }
+                    for part_id in part_ids
+                ],
+                "recommended_tests": tests,
+                "confidence_level": "low" if not symptom_ids else "high" if best >= 0.6 else "medium",
+                "matched_symptoms": [self.symptoms[symptom_id] for symptom_id in symptom_ids],
+                "unknown_symptoms": unknown
+            })
+        self.stats["cases"] += len(results)
+        self.stats["batches"] += 1
+        self.stats["seconds"] += time.perf_counter() - start_time
+        return results
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "symptoms": len(self.symptoms), "parts": len(self.parts)}
+
+diagnosis_engine = BayesianDiagnosisEngine()
+
+# Diagnostic Session Planning
+
+class DiagnosticPlanner:
+    """Chooses the next question or test of an interactive diagnosis session.
+
+    The belief over parts starts as the Bayesian posterior for the entry
+    symptoms. Every check (a follow-up symptom question or a workshop test)
+    is a yes/no observation with a fixed sensitivity for the parts it
+    targets and a false positive rate for the others. The next check is the
+    one with the highest expected information gain, evaluated for all
+    checks at once. A session ends when one cause reaches the target
+    confidence, the question budget is spent or no check is informative.
+    Answers only walk down a decision tree, so a session costs no LLM calls.
+    Trees for common entry symptoms are built offline
+    (python finall.py --build-diagnostic-trees); the rest are built on
+    first use and kept in memory.
+    """
+    TEST_TARGETS = {
+        "Battery voltage": ["battery"],
+        "voltage test": ["battery"],
+        "load test": ["battery"],
+        "Starter draw": ["starter"],
+        "starter draw test": ["starter"],
+        "Alternator output": ["alternator"],
+        "Fuel pressure": ["fuel_pump"],
+        "Spark test": ["spark_plugs", "ignition_coil"],
+        "Injector balance": ["fuel_injectors"]
+    }
+    YES_ANSWERS = frozenset(["yes", "y", "yeah", "yep", "نعم", "ايوه", "ايوا", "اه", "ااه", "صح"])
+    NO_ANSWERS = frozenset(["no", "n", "nope", "لا", "لاء", "مش", "ابدا"])
+    # Answers that keep the session open and repeat the current check
+    UNKNOWN_ANSWERS = frozenset(["not sure", "don't know", "dont know", "i don't know", "idk",
+                                 "مش عارف", "معرفش", "مش متاكد"])
+
+    def __init__(self, engine: BayesianDiagnosisEngine = diagnosis_engine, path: str = Config.DIAGNOSTIC_TREES_PATH,
+                 target_confidence: float = Config.DIAGNOSTIC_TARGET_CONFIDENCE,
+                 max_questions: int = Config.DIAGNOSTIC_MAX_QUESTIONS, sensitivity: float = 0.9,
+                 false_positive: float = 0.1, min_gain: float = 0.01):
+        self.engine = engine
+        self.path = path
+        self.target_confidence = target_confidence
+        self.max_questions = max_questions
+        self.min_gain = min_gain
+        self.checks = [{"kind": "question", "name": symptom} for symptom in engine.symptoms]
+        targets = [engine.cause_matrix[symptom_id] for symptom_id in range(len(engine.symptoms))]
+        for test, parts in self.TEST_TARGETS.items():
+            part_ids = [engine.part_ids[part] for part in parts if part in engine.part_ids]
+            if part_ids:
+                self.checks.append({"kind": "test", "name": test})
+                targets.append(np.isin(np.arange(len(engine.parts)), part_ids))
+        # P(positive answer | part is the fault), one row per check
+        self.positive = np.where(np.array(targets, dtype=bool), sensitivity, false_positive)
+        self.fingerprint = hashlib.sha1(json.dumps(
+            [engine.symptoms, engine.parts, self.checks, target_confidence, max_questions, sensitivity,
+             false_positive, min_gain]).encode("utf-8")).hexdigest()
+        self.trees = {}
+        self.stats = {"tree_hits": 0, "tree_builds": 0}
+        self.load()
+
+    @staticmethod
+    def entropy(belief: np.ndarray) -> np.ndarray:
+        safe = np.where(belief > 0, belief, 1.0)
+        return -(belief * np.log2(safe)).sum(axis=-1)
+
+    def information_gain(self, belief: np.ndarray, asked: Sequence = ()) -> np.ndarray:
+        """Expected entropy reduction of every check, -inf for checks already asked."""
+        positive = self.positive * belief
+        negative = (1.0 - self.positive) * belief
+        p_positive = positive.sum(axis=1)
+        p_negative = negative.sum(axis=1)
+        expected = (p_positive * self.entropy(positive / np.maximum(p_positive, 1e-12)[:, None])
+                    + p_negative * self.entropy(negative / np.maximum(p_negative, 1e-12)[:, None]))
+        gain = self.entropy(belief) - expected
+        gain[list(asked)] = -np.inf
+        return gain
+
+    def update(self, belief: np.ndarray, check_id: int, answer: bool) -> np.ndarray:
+        belief = belief * (self.positive[check_id] if answer else 1.0 - self.positive[check_id])
+        return belief / belief.sum()
+
+    def next_check(self, belief: np.ndarray, asked: Sequence = ()) -> Optional[int]:
+        """Return the most informative check, or None when the session should stop."""
+        if belief.max() >= self.target_confidence or len(asked) >= self.max_questions:
+            return None
+        gain = self.information_gain(belief, asked)
+        check_id = int(np.argmax(gain))
+        return check_id if gain[check_id] >= self.min_gain else None
+
+    def _build(self, belief: np.ndarray, asked: tuple) -> dict:
+        check_id = self.next_check(belief, asked)
+        if check_id is None:
+            top = np.argsort(-belief)[:3]
+            return {"causes": [
+                {
+                    "part": self.engine.parts[part_id],
+                    "confidence": round(float(belief[part_id]) * 100, 2),
+                    "cost": self.engine.part_info[part_id]["cost"]
+                }
+                for part_id in top.tolist()
+            ]}
+        return {
+            "check": check_id,
+            "yes": self._build(self.update(belief, check_id, True), asked + (check_id,)),
+            "no": self._build(self.update(belief, check_id, False), asked + (check_id,))
+        }
+
+    def plan(self, symptoms) -> tuple:
+        """Return (matched symptoms, decision tree) for the entry symptoms."""
+        symptom_ids, _ = self.engine.resolve(symptoms)
+        signature = "|".join(sorted(self.engine.symptoms[symptom_id] for symptom_id in symptom_ids))
+        tree = self.trees.get(signature)
+        if tree is None:
+            belief = self.engine.posteriors([[self.engine.symptoms[symptom_id] for symptom_id in symptom_ids]])[0]
+            # Entry symptoms are already known, so they are never asked again
+            tree = self.trees[signature] = self._build(belief, tuple(symptom_ids))
+            self.stats["tree_builds"] += 1
+        else:
+            self.stats["tree_hits"] += 1
+        return [self.engine.symptoms[symptom_id] for symptom_id in symptom_ids], tree
+
+    def common_entries(self) -> list:
+        """Every single symptom and every pair of symptoms that share a cause."""
+        entries = [[symptom] for symptom in self.engine.symptoms]
+        overlap = self.engine.cause_matrix.astype(int) @ self.engine.cause_matrix.T.astype(int)
+        for first, second in itertools.combinations(range(len(self.engine.symptoms)), 2):
+            if overlap[first, second]:
+                entries.append([self.engine.symptoms[first], self.engine.symptoms[second]])
+        return entries
+
+    def build(self) -> dict:
+        """Precompute the trees of the common entry symptoms and write them to disk."""
+        start_time = time.perf_counter()
+        for symptoms in self.common_entries():
+            self.plan(symptoms)
+        metadata = {
+            "fingerprint": self.fingerprint,
+            "trees": len(self.trees),
+            "built_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "build_seconds": round(time.perf_counter() - start_time, 3)
+        }
+        with open(self.path + ".tmp", "w", encoding="utf-8") as trees_file:
+            json.dump({**metadata, "checks": self.checks, "tree_map": self.trees}, trees_file, ensure_ascii=False)
+        os.replace(self.path + ".tmp", self.path)
+        return metadata
+
+    def load(self) -> bool:
+        """Load precomputed trees if they match the current diagnostic data."""
+        if not (self.path and os.path.exists(self.path)):
+            return False
+        try:
+            with open(self.path, encoding="utf-8") as trees_file:
+                data = json.load(trees_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Diagnostic trees load error: {str(e)}")
+            return False
+        if data.get("fingerprint") != self.fingerprint:
+            logger.warning(f"Diagnostic trees {self.path} are stale; rebuild them with --build-diagnostic-trees")
+            return False
+        self.trees.update(data["tree_map"])
+        logger.info(f"Loaded {len(data['tree_map'])} precomputed diagnostic trees from {self.path}")
+        return True
+
+    def parse_answer(self, text: str) -> Optional[bool]:
+        answer = arabic_normalizer.normalize(text).strip(" .!؟?")
+        if answer in self.YES_ANSWERS:
+            return True
+        if answer in self.NO_ANSWERS:
+            return False
+        return None
+
+    def describe_check(self, check_id: int) -> str:
+        check = self.checks[check_id]
+        if check["kind"] == "question":
+            return f"❓ Do you also notice: {check['name']}? (yes/no - نعم/لا)"
+        return f"🔧 Please run this check: {check['name']}. Did it show a fault? (yes/no - نعم/لا)"
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "checks": len(self.checks), "cached_trees": len(self.trees)}
+
+diagnostic_planner = DiagnosticPlanner()
+
+# Fleet Maintenance Scheduling
+
+class FleetMaintenanceScheduler:
+    """Columnar version of EnhancedMaintenanceScheduler.calculate_next_service.
+
+    An interval depends only on the service type, the vehicle category and
+    the driving conditions, so every combination is computed once into a
+    small (categories x conditions x services) table. A fleet is then
+    scheduled by indexing that table with its category and condition codes,
+    giving (vehicles x services) arrays in one pass. Dates stay datetime64
+    and are only formatted for the vehicles that are displayed.
+    """
+    DRIVING_CONDITIONS = ("normal", "severe", "light")
+    DRIVING_FACTORS = {"normal": 1.0, "severe": 0.7, "light": 1.2}
+    URGENCY_LEVELS = ("normal", "soon", "urgent", "critical")
+    URGENCY_THRESHOLDS = (2000, 1000, 500)
+    KM_PER_DAY = 50
+
+    def __init__(self, scheduler: EnhancedMaintenanceScheduler = None):
+        self.scheduler = scheduler or EnhancedMaintenanceScheduler()
+        self.current_date = self.scheduler.current_date
+        self._intervals = None
+        self._categories = None
+        self.stats = {"vehicles": 0, "runs": 0, "seconds": 0.0}
+
+    @staticmethod
+    def base_interval(intervals: dict) -> float:
+        base_interval = intervals.get("normal", 10000)
+        if isinstance(base_interval, dict):
+            # Graded services (spark plugs) schedule the standard grade
+            base_interval = base_interval.get("standard", min(base_interval.values()))
+        return base_interval
+
+    def _table(self) -> np.ndarray:
+        # Rebuilt only when a knowledge reload swaps the interval or category tables
+        if self._intervals is not Config.MAINTENANCE_INTERVALS or self._categories is not Config.VEHICLE_CATEGORIES:
+            self._intervals = Config.MAINTENANCE_INTERVALS
+            self._categories = Config.VEHICLE_CATEGORIES
+            self.service_types = tuple(self._intervals)
+            self.category_names = tuple(self._categories)
+            weather_factor = self.scheduler.get_current_conditions()["maintenance_factor"]
+            base = np.array([self.base_interval(self._intervals[service]) for service in self.service_types],
+                            dtype=np.float64)
+            vehicle = np.array([self._categories[category]["maintenance_factor"] for category in self.category_names])
+            driving = np.array([self.DRIVING_FACTORS[condition] for condition in self.DRIVING_CONDITIONS])
+            self.interval_table = base * vehicle[:, None, None] * weather_factor * driving[None, :, None]
+            self.weather_factor = weather_factor
+        return self.interval_table
+
+    @staticmethod
+    def encode(values, names: tuple, default: Optional[int] = None, label: str = "vehicle category") -> np.ndarray:
+        """Map names (or pass through integer codes) to indexes into names."""
+        values = np.asarray(values)
+        if values.dtype.kind in "iu":
+            # Negative codes would silently index from the end of the table
+            invalid = (values < 0) | (values >= len(names))
+            if invalid.any():
+                raise MaintenanceError(f"Invalid {label} code: {', '.join(map(str, np.unique(values[invalid])))}")
+            return values.astype(np.intp, copy=False)
+        unique, inverse = np.unique(values, return_inverse=True)
+        lookup = {name: index for index, name in enumerate(names)}
+        codes = np.array([lookup.get(str(value), -1 if default is None else default) for value in unique],
+                         dtype=np.intp)
+        if (codes < 0).any():
+            raise MaintenanceError(f"Unknown {label}: {', '.join(map(str, unique[codes < 0]))}")
+        return codes[inverse.reshape(-1)]
+
+    def schedule(self, mileage, categories, driving_conditions=None) -> dict:
+        """Schedule every vehicle x service type of a fleet given as columnar arrays.
+
+        categories and driving_conditions take names or integer codes into
+        category_names and DRIVING_CONDITIONS; unknown driving conditions
+        count as normal, as in calculate_next_service. Unknown categories and
+        out-of-range codes raise MaintenanceError.
+        """
+        start_time = time.perf_counter()
+        table = self._table()
+        mileage = np.asarray(mileage, dtype=np.int64)
+        category_codes = self.encode(categories, self.category_names)
+        if driving_conditions is None:
+            condition_codes = np.zeros(len(mileage), dtype=np.intp)
+        else:
+            condition_codes = self.encode(driving_conditions, self.DRIVING_CONDITIONS, default=0,
+                                          label="driving condition")
+        adjusted = table[category_codes, condition_codes]
+        km_remaining = adjusted.astype(np.int64)
+        days_remaining = (adjusted / self.KM_PER_DAY).astype(np.int64)
+        urgency = sum((adjusted <= threshold).astype(np.uint8) for threshold in self.URGENCY_THRESHOLDS)
+        self.stats["vehicles"] += len(mileage)
+        self.stats["runs"] += 1
+        self.stats["seconds"] += time.perf_counter() - start_time
+        return {
+            "service_types": self.service_types,
+            "next_service_km": mileage[:, None] + km_remaining,
+            "km_remaining": km_remaining,
+            "days_remaining": days_remaining,
+            "next_service_date": np.datetime64(self.current_date.date()) + days_remaining.astype("timedelta64[D]"),
+            "urgency": urgency,
+            "weather_adjustment": self.weather_factor
+        }
+
+    def vehicle_schedule(self, fleet_schedule: dict, index: int) -> dict:
+        """Format one vehicle's row the way calculate_next_service reports it."""
+        return {
+            service_type: {
+                "next_service_km": int(fleet_schedule["next_service_km"][index, column]),
+                "next_service_date": str(fleet_schedule["next_service_date"][index, column]),
+                "km_remaining": int(fleet_schedule["km_remaining"][index, column]),
+                "days_remaining": int(fleet_schedule["days_remaining"][index, column]),
+                "weather_adjustment": f"{fleet_schedule['weather_adjustment']:.2f}",
+                "urgency": self.URGENCY_LEVELS[fleet_schedule["urgency"][index, column]]
+            }
+            for column, service_type in enumerate(fleet_schedule["service_types"])
+        }
+
+    def get_stats(self) -> dict:
+        seconds = self.stats["seconds"]
+        return {
+            **self.stats,
+            "vehicles_per_second": round(self.stats["vehicles"] / seconds) if seconds > 0 else 0
+        }
+
+fleet_scheduler = FleetMaintenanceScheduler()
+
+
+
+
 # Main application setup
 
 
@@ -5466,10 +8132,31 @@ async def start():
     try:
 
 
-        car_expert = CarExpertSystem()
+        # Reuse the process-wide system; only the first session builds it
 
 
-        logger.info("🚗 Car Expert System initialized successfully")
+        if car_expert is None:
+
+
+            car_expert = CarExpertSystem()
+
+
+            logger.info("🚗 Car Expert System initialized successfully")
+
+
+        knowledge_store.start_watcher()
+
+
+        try:
+
+
+            await asyncio.get_running_loop().run_in_executor(None, model_registry.get_model)
+
+
+        except ModelLoadError as e:
+
+
+            logger.warning(f"LLM unavailable, continuing without it: {str(e)}")
 
 
         
@@ -5562,6 +8249,66 @@ async def main(message: cl.Message):
 if __name__ == "__main__":
 
 
+    if "--export-kb-source" in sys.argv[1:]:
+
+
+        export_knowledge_base_source(sys.argv[sys.argv.index("--export-kb-source") + 1])
+
+
+        sys.exit(0)
+
+
+    if "--compile-kb" in sys.argv[1:]:
+
+
+        source_path = sys.argv[sys.argv.index("--compile-kb") + 1]
+
+
+        print(f"📦 Compiled knowledge base: {compile_knowledge_base(source_path, Config.KB_COMPILED_PATH)}")
+
+
+        sys.exit(0)
+
+
+    if "--analyze-batch" in sys.argv[1:]:
+
+
+        # Re-classify a log of one query per line into JSON lines on stdout
+
+
+        with open(sys.argv[sys.argv.index("--analyze-batch") + 1], encoding="utf-8") as queries_file:
+
+
+            for result in QueryAnalyzer().analyze_batch((line.strip() for line in queries_file if line.strip()),
+
+
+                                                        workers=os.cpu_count() or 1):
+
+
+                print(json.dumps(result, ensure_ascii=False))
+
+
+        sys.exit(0)
+
+
+    if "--build-diagnostic-trees" in sys.argv[1:]:
+
+
+        print(f"🌳 Built diagnostic trees: {diagnostic_planner.build()}")
+
+
+        sys.exit(0)
+
+
+    if "--build-vector-index" in sys.argv[1:]:
+
+
+        print(f"📦 Built knowledge vector index: {build_vector_index()}")
+
+
+        sys.exit(0)
+
+
     print(f"🚀 Starting Car Expert System v2.5.0")
 
 
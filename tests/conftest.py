@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def finall():
+    """The application module; needs chainlit and llama-cpp-python installed."""
+    pytest.importorskip("chainlit")
+    pytest.importorskip("llama_cpp")
+    import finall
+    return finall
+
+
+class RecordingExecutor:
+    """Stands in for InferenceExecutor and keeps every prompt it is asked to complete."""
+
+    def __init__(self, answer="Check the battery first."):
+        self.answer = answer
+        self.prompts = []
+
+    async def stream(self, prompt, max_tokens, priority="normal", session_id=None):
+        self.prompts.append(prompt)
+        yield self.answer
+
+
+class SilentMessage:
+    """Collects streamed tokens instead of sending them to a Chainlit client."""
+    sent = []
+
+    def __init__(self, content="", **kwargs):
+        self.content = content
+
+    async def stream_token(self, token):
+        self.content += token
+
+    async def send(self):
+        SilentMessage.sent.append(self.content)
+        return self
+
+
+@pytest.fixture
+def expert(finall, monkeypatch):
+    """A CarExpertSystem whose model calls are recorded in expert.inference_executor.prompts."""
+    SilentMessage.sent = []
+    monkeypatch.setattr(finall.cl, "Message", SilentMessage)
+    system = finall.CarExpertSystem()
+    system.inference_executor = RecordingExecutor()
+    return system
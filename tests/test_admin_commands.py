@@ -0,0 +1,22 @@
+import asyncio
+
+
+class UserMessage:
+    def __init__(self, content):
+        self.content = content
+        self.removed = False
+
+    async def remove(self):
+        self.removed = True
+        return True
+
+
+def test_reload_command_token_is_removed_from_history(expert, monkeypatch):
+    monkeypatch.setenv("CAR_EXPERT_ADMIN_TOKEN", "s3cret-token")
+    message = UserMessage("/reload-kb wrong-token")
+
+    asyncio.run(expert.process_message(message))
+
+    assert message.removed
+    assert "wrong-token" not in message.content
+    assert "s3cret-token" not in message.content
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+
+class BlockingEmbeddingRegistry:
+    """Model registry whose embedding model blocks until released."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def get_model(self, name="chat"):
+        return self
+
+    def embed(self, text):
+        self.started.set()
+        self.release.wait(5)
+        return [1.0, 0.0, 0.0]
+
+
+def test_semantic_cache_lookups_do_not_wait_for_embeddings(finall):
+    registry = BlockingEmbeddingRegistry()
+    cache = finall.SemanticCache(registry, max_entries=4, threshold=0.9, ttl=60)
+    embedding = threading.Thread(target=cache.embed, args=("how often should I change the oil?",))
+    embedding.start()
+    try:
+        assert registry.started.wait(5)
+        vector = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+        start = time.perf_counter()
+        cache.add("when do I change the oil?", vector, "Every 5000 km.", "en", "maintenance")
+        answer = cache.lookup("when do I change the oil?", vector, "en", "maintenance")
+        assert time.perf_counter() - start < 1
+        assert answer == "Every 5000 km."
+    finally:
+        registry.release.set()
+        embedding.join()
+
+
+@pytest.fixture
+def clock(finall, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(finall.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_response_cache_evicts_least_recently_used(finall, clock):
+    cache = finall.ResponseCache(max_entries=2, ttl=60)
+    first, second, third = (cache.make_key(question, "en", "general") for question in ("a", "b", "c"))
+    cache.put(first, "A")
+    cache.put(second, "B")
+    assert cache.get(first) == "A"
+    cache.put(third, "C")
+    assert cache.get(second) is None
+    assert cache.get(first) == "A" and cache.get(third) == "C"
+    assert cache.get_stats()["evicted"] == 1
+
+
+def test_response_cache_entries_expire_after_ttl(finall, clock):
+    cache = finall.ResponseCache(max_entries=2, ttl=60)
+    key = cache.make_key("how often should I change the oil?", "en", "maintenance")
+    cache.put(key, "Every 5000 km.")
+    clock[0] += 60
+    assert cache.get(key) == "Every 5000 km."
+    clock[0] += 1
+    assert cache.get(key) is None
+    assert cache.get_stats()["expired"] == 1 and not cache.entries
+
+
+@pytest.mark.parametrize("question, variant", [
+    ("How often should I change the oil?", "how often  should i change the OIL"),
+    ("متى أغير الزيت؟", "مَتي اُغيّر الزّيت"),
+])
+def test_response_cache_keys_normalize_questions(finall, question, variant):
+    cache = finall.ResponseCache(max_entries=2, ttl=60)
+    assert cache.make_key(question, "en", "maintenance") == cache.make_key(variant, "en", "maintenance")
+    assert cache.make_key(question, "en", "maintenance") != cache.make_key(question, "ar", "maintenance")
+    assert cache.make_key(question, "en", "maintenance") != cache.make_key(question, "en", "cost")
+    assert cache.make_key(question, "en", "maintenance") != cache.make_key(question, "en", "maintenance", version=1)
@@ -0,0 +1,34 @@
+import pytest
+
+
+@pytest.fixture
+def compiled(finall, tmp_path):
+    source = tmp_path / "knowledge_base.json"
+    output = tmp_path / "knowledge_base.kb"
+    finall.export_knowledge_base_source(str(source))
+    finall.compile_knowledge_base(str(source), str(output))
+    return finall.CompiledKnowledgeBase(str(output))
+
+
+def test_compiled_bodies_roundtrip(finall, compiled):
+    builtin = finall.builtin_knowledge_base()
+    assert list(compiled) == list(builtin)
+    for aliases, article in builtin.items():
+        assert dict(compiled[aliases]) == {"ar": article["ar"], "en": article["en"]}
+    assert compiled.maintenance_intervals == finall.Config.MAINTENANCE_INTERVALS
+
+
+def test_find_alias_returns_owning_article(finall, compiled):
+    for aliases in finall.builtin_knowledge_base():
+        for alias in aliases:
+            assert alias in compiled.find_alias(alias)
+    assert compiled.find_alias("no such alias") is None
+
+
+def test_decompressed_bytes_counts_utf8_bytes(finall, compiled):
+    aliases = next(key for key, article in finall.builtin_knowledge_base().items() if article["ar"])
+    article_id = compiled._key_ids[aliases]
+    text = compiled.article_text(article_id, "ar")
+    compiled.article_text(article_id, "ar")
+    assert compiled.stats["decompressed_bytes"] == len(text.encode("utf-8")) > len(text)
+    assert compiled.stats["hits"] == 1 and compiled.stats["misses"] == 1
@@ -0,0 +1,15 @@
+import asyncio
+
+
+def test_follow_up_prompt_extends_the_evaluated_turn(expert):
+    async def converse():
+        for query in ("How often should I change the engine oil in my Corolla?", "And the oil filter?"):
+            analysis = expert.query_analyzer.analyze_query(query)
+            await expert._stream_llm_response(query, analysis, "conversation-test")
+
+    asyncio.run(converse())
+
+    first, second = expert.inference_executor.prompts
+    assert "Reference / مرجع:" in first
+    # Turn N+1 starts with everything turn N evaluated, so the session's KV cache covers it
+    assert second.startswith(first + expert.inference_executor.answer)
@@ -0,0 +1,67 @@
+import asyncio
+
+
+def test_diagnostic_prompt_includes_ranked_causes(expert):
+    query = "I have a problem: hard start and clicking"
+    analysis = expert.query_analyzer.analyze_query(query)
+    assert analysis["query_type"] == "diagnostic"
+
+    asyncio.run(expert._stream_llm_response(query, analysis, "diagnosis-test"))
+
+    prompts = expert.inference_executor.prompts
+    assert len(prompts) == 1
+    assert expert._diagnosis_notes(query)
+    assert "Likely causes for" in prompts[0]
+
+
+DIAGNOSTIC_TABLE = {
+    "electrical": {
+        "symptoms": {
+            "starting": {
+                "no_crank": {"causes": [{"part": "battery", "probability": 0.6, "cost": "100-200"},
+                                        {"part": "starter", "probability": 0.4, "cost": "300-600"}],
+                             "tests": ["battery voltage"]},
+                "clicking": {"causes": [{"part": "starter", "probability": 0.7, "cost": "300-600"},
+                                        {"part": "battery", "probability": 0.3, "cost": "100-200"}],
+                             "tests": ["starter draw"]},
+                "dim_lights": {"causes": [{"part": "battery", "probability": 0.8, "cost": "100-200"},
+                                          {"part": "alternator", "probability": 0.2, "cost": "400-800"}],
+                               "tests": ["charging voltage"]}
+            }
+        }
+    }
+}
+
+
+def ranking(engine, symptoms):
+    return [cause["part"] for cause in engine.diagnose(symptoms, top_k=3)["possible_causes"]]
+
+
+def test_single_symptom_keeps_table_probabilities(finall):
+    engine = finall.BayesianDiagnosisEngine(DIAGNOSTIC_TABLE, {})
+    result = engine.diagnose(["no crank"], top_k=2)
+    assert [cause["part"] for cause in result["possible_causes"]] == ["battery", "starter"]
+    assert [round(cause["confidence"]) for cause in result["possible_causes"]] == [60, 40]
+    assert result["matched_symptoms"] == ["no crank"]
+
+
+def test_combined_symptoms_update_the_ranking(finall):
+    engine = finall.BayesianDiagnosisEngine(DIAGNOSTIC_TABLE, {})
+    assert ranking(engine, ["no crank", "clicking"]) == ["starter", "battery", "alternator"]
+    assert ranking(engine, ["dim lights", "clicking"]) == ["battery", "starter", "alternator"]
+    assert ranking(engine, "clicking and no crank") == ranking(engine, ["clicking", "no crank"])
+
+
+def test_unknown_symptoms_fall_back_to_the_prior(finall):
+    engine = finall.BayesianDiagnosisEngine(DIAGNOSTIC_TABLE, {})
+    result = engine.diagnose(["smoke from exhaust"], top_k=3)
+    assert [cause["part"] for cause in result["possible_causes"]] == ["battery", "starter", "alternator"]
+    assert result["confidence_level"] == "low"
+    assert result["unknown_symptoms"] == ["smoke from exhaust"]
+
+
+def test_batch_matches_single_cases(finall):
+    engine = finall.BayesianDiagnosisEngine(DIAGNOSTIC_TABLE, {})
+    cases = [["no crank"], ["no crank", "clicking"], ["dim lights"]]
+    assert engine.diagnose_batch(cases, top_k=3) == [engine.diagnose(case, top_k=3) for case in cases]
+    assert abs(engine.posteriors(cases).sum(axis=1) - 1).max() < 1e-9
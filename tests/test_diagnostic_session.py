@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+
+def start_session(expert, session):
+    assert asyncio.run(expert._handle_diagnostic_turn("/diagnose hard start, clicking", session))
+    assert "diagnostic_session" in session
+
+
+@pytest.mark.parametrize("message", [
+    "there's smoke coming from the hood",
+    "العربية فيها حريق",
+])
+def test_emergency_ends_the_session(expert, message):
+    session = {}
+    start_session(expert, session)
+    assert not asyncio.run(expert._handle_diagnostic_turn(message, session))
+    assert "diagnostic_session" not in session
+
+
+def test_new_question_ends_the_session(expert):
+    session = {}
+    start_session(expert, session)
+    assert not asyncio.run(expert._handle_diagnostic_turn("How much does a new battery cost?", session))
+    assert "diagnostic_session" not in session
+
+
+@pytest.mark.parametrize("message, answer", [("yes", True), ("no", False)])
+def test_yes_no_answers_walk_the_tree(expert, message, answer):
+    session = {}
+    start_session(expert, session)
+    node = session["diagnostic_session"]["node"]
+    assert asyncio.run(expert._handle_diagnostic_turn(message, session))
+    state = session.get("diagnostic_session")
+    if state is not None:
+        assert state["answers"] == [answer]
+        assert state["node"] is node["yes" if answer else "no"]
+
+
+@pytest.mark.parametrize("message", ["not sure", "مش عارف"])
+def test_unknown_answer_repeats_the_check(expert, message):
+    session = {}
+    start_session(expert, session)
+    check = session["diagnostic_session"]["node"]["check"]
+    assert asyncio.run(expert._handle_diagnostic_turn(message, session))
+    assert session["diagnostic_session"]["node"]["check"] == check
+    assert session["diagnostic_session"]["answers"] == []
+
+
+def test_stop_closes_the_session(expert):
+    session = {}
+    start_session(expert, session)
+    assert asyncio.run(expert._handle_diagnostic_turn("stop", session))
+    assert "diagnostic_session" not in session
+    assert expert.inference_executor.prompts == []
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def schedulers(finall):
+    scheduler = finall.EnhancedMaintenanceScheduler()
+    return scheduler, finall.FleetMaintenanceScheduler(scheduler)
+
+
+def test_fleet_schedule_matches_calculate_next_service(finall, schedulers):
+    scheduler, fleet = schedulers
+    rng = np.random.default_rng(1)
+    categories = rng.choice(list(finall.Config.VEHICLE_CATEGORIES), 2000)
+    conditions = rng.choice(["normal", "severe", "light", "unknown"], 2000)
+    mileage = rng.integers(0, 300000, 2000)
+
+    schedule = fleet.schedule(mileage, categories, conditions)
+
+    for index in range(len(mileage)):
+        row = fleet.vehicle_schedule(schedule, index)
+        for service_type in schedule["service_types"]:
+            # Graded intervals (spark plugs) are only schedulable by the fleet scheduler
+            if isinstance(finall.Config.MAINTENANCE_INTERVALS[service_type].get("normal"), dict):
+                continue
+            expected = scheduler.calculate_next_service(service_type, int(mileage[index]), categories[index],
+                                                        conditions[index])
+            assert row[service_type] == expected
+
+
+def test_integer_codes_match_names(finall, schedulers):
+    _, fleet = schedulers
+    names = list(finall.Config.VEHICLE_CATEGORIES)
+    by_name = fleet.schedule([1000, 2000], [names[0], names[-1]], ["severe", "light"])
+    by_code = fleet.schedule([1000, 2000], [0, len(names) - 1], [1, 2])
+    assert (by_name["next_service_km"] == by_code["next_service_km"]).all()
+
+
+@pytest.mark.parametrize("categories, conditions", [
+    ([-1], None),
+    ([5], None),
+    ([0], [-1]),
+    ([0], [3]),
+    (["boat"], None),
+])
+def test_invalid_categories_and_codes_raise(finall, schedulers, categories, conditions):
+    _, fleet = schedulers
+    with pytest.raises(finall.MaintenanceError):
+        fleet.schedule([1000], categories, conditions)
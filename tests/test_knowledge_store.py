@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def pricing_file(tmp_path):
+    return tmp_path / "pricing.json"
+
+
+def make_store(finall, tmp_path, pricing_file):
+    return finall.KnowledgeStore(kb_path=str(tmp_path / "knowledge_base.kb"), pricing_path=str(pricing_file))
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    "[1, 2, 3]",
+    json.dumps({"labor_rates": 200}),
+    json.dumps({"emergency_factor": "high"}),
+])
+def test_malformed_pricing_falls_back_to_builtin_prices(finall, tmp_path, pricing_file, content):
+    pricing_file.write_text(content, encoding="utf-8")
+    store = make_store(finall, tmp_path, pricing_file)
+    assert store.current.pricing == finall.CostCalculationSystem.DEFAULT_PRICING
+
+
+def test_pricing_overrides_and_rejected_reload(finall, tmp_path, pricing_file):
+    pricing_file.write_text(json.dumps({"labor_rates": {"standard": 200}}), encoding="utf-8")
+    store = make_store(finall, tmp_path, pricing_file)
+    assert store.current.pricing["labor_rates"]["standard"] == 200
+    assert store.current.pricing["labor_rates"]["specialist"] == \
+        finall.CostCalculationSystem.DEFAULT_PRICING["labor_rates"]["specialist"]
+
+    pricing_file.write_text("{not json", encoding="utf-8")
+    with pytest.raises(ValueError):
+        store.reload("test")
+    assert store.current.version == 1
+    assert store.current.pricing["labor_rates"]["standard"] == 200
@@ -0,0 +1,66 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def analyzer(finall):
+    return finall.QueryAnalyzer()
+
+
+@pytest.mark.parametrize("query", [
+    "el 3arabeya feha fire",
+    "ana 3ayez help, el 3arabeya feha smoke",
+    "my car has دخان coming from the engine",
+    "العربية فيها fire",
+])
+def test_emergency_detected_in_arabizi_and_mixed_script(analyzer, query):
+    analysis = analyzer.analyze_query(query)
+    assert analysis["is_emergency"]
+    assert analysis["query_type"] == "emergency"
+
+
+@pytest.mark.parametrize("query, language", [
+    ("el 3arabeya feha fire", "ar"),
+    ("my فرامل are making a noise when braking", "en"),
+    ("audi a4 5w30 oil", "en"),
+    ("عايز اغير زيت الموتور في bmw x5", "ar"),
+])
+def test_language_identification(finall, query, language):
+    assert finall.language_identifier.identify(query)["language"] == language
+
+
+def test_language_profile_ratios(finall):
+    profile = finall.language_identifier.identify("my فرامل are making a noise")
+    assert profile["is_mixed"]
+    assert profile["arabic_ratio"] == round(5 / 22, 3)
+    assert not finall.language_identifier.identify("e7na 12 2ana")["is_mixed"]
+
+
+@pytest.mark.parametrize("query", [
+    "my engine misfire at idle",
+    "any helpful tips for a long trip?",
+])
+def test_keywords_inside_other_words_do_not_match(analyzer, query):
+    assert not analyzer.classify(query)["is_emergency"]
+
+
+@pytest.mark.parametrize("query, query_type", [
+    ("the brakes stopped working, it is a problem", "diagnostic"),
+    ("fires everywhere", "emergency"),
+    ("عندي مشكلة في الفرامل", "diagnostic"),
+    ("والحريق قريب", "emergency"),
+])
+def test_inflected_and_clitic_keywords_match(analyzer, query, query_type):
+    assert analyzer.classify(query)["query_type"] == query_type
+
+
+@pytest.mark.parametrize("query", [
+    "كم سعر تغيير الزيت",
+    "بكام تغيير الزيت؟",
+    "How much does an oil change cost?",
+])
+def test_price_of_a_service_is_a_cost_question(analyzer, query):
+    assert analyzer.classify(query)["query_type"] == "cost"
+
+
+def test_maintenance_question_without_price_terms(analyzer):
+    assert analyzer.classify("When should I change the oil?")["query_type"] == "maintenance"
@@ -0,0 +1,30 @@
+import pytest
+
+
+@pytest.fixture
+def knowledge_base(finall):
+    return finall.builtin_knowledge_base()
+
+
+def test_exact_alias_pins_bm25_to_its_article(finall, knowledge_base):
+    retriever = finall.BM25Retriever(knowledge_base)
+    query = "brake noise when the battery is low"
+    aliases = finall.KnowledgeBaseIndex(knowledge_base).search(query)[0]["aliases"]
+    assert "brake noise" in aliases
+    assert retriever.search(query, language="en")[0]["aliases"] != aliases
+
+    pinned = retriever.search(query, language="en", aliases=aliases)
+    assert pinned and all(section["aliases"] == aliases for section in pinned)
+    assert all(section["language"] == "en" for section in pinned)
+    unpinned = [section for section in retriever.search(query, k=len(retriever.documents), language="en")
+                if section["aliases"] == aliases]
+    assert pinned == unpinned[:len(pinned)]
+
+
+def test_pinned_article_grounds_unindexed_languages(finall, knowledge_base):
+    retriever = finall.BM25Retriever(knowledge_base, languages=("en",))
+    aliases = next(key for key in knowledge_base if "brake noise" in key)
+    sections = retriever.search("صوت فرامل", k=2, language="ar", aliases=aliases)
+    assert [section["section"] for section in sections] == [0, 1]
+    assert all(section["aliases"] == aliases and section["language"] == "en" for section in sections)
+    assert retriever.search("صوت فرامل", language="ar", aliases=("no such article",)) == []
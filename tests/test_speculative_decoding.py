@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+
+@pytest.mark.parametrize("pieces, expected", [
+    (["Hello <|eo", "t_id|> more"], "Hello "),
+    (["a<", "b"], "a<b"),
+    (["x<|end_of_text|>"], "x"),
+])
+def test_stop_sequence_filter_cuts_like_create_completion(finall, pieces, expected):
+    stops = finall.StopSequenceFilter()
+    text = ""
+    for piece in pieces:
+        if not stops.stopped:
+            text += stops.feed(piece)
+    assert text + stops.flush() == expected
+
+
+@pytest.mark.parametrize("temperature", [0.0, 0.18])
+@pytest.mark.parametrize("seed", [0, 1234])
+def test_speculative_output_matches_plain_decoding(finall, temperature, seed):
+    if not os.path.exists(finall.Config.MODEL_PATH):
+        pytest.skip("model weights not available")
+    llm = finall.model_registry.get_model()
+    prompt, _, _ = finall.ContextWindowManager(finall.model_registry).build_prompt(
+        "How often should I change the engine oil and the oil filter?", "en")
+    tokens = finall.PromptCache.tokenize(llm, prompt)
+
+    llm.reset()
+    plain = "".join(chunk["choices"][0]["text"] for chunk in llm.create_completion(
+        tokens, max_tokens=64, temperature=temperature, seed=seed, stop=finall.Config.STOP_SEQUENCES,
+        stream=True))
+    llm.reset()
+    decoder = finall.SpeculativeDecoder(finall.PromptLookupDrafter())
+    try:
+        speculative = "".join(text for text, _ in decoder.generate(
+            llm, tokens, 64, temperature=temperature, seed=seed))
+    finally:
+        decoder.close()
+
+    assert speculative == plain